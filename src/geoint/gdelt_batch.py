@@ -0,0 +1,333 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+import numpy
+from geoint.gdelt_schema import create_event_fields, create_graph_fields
+
+def _create_column(field, values):
+    """Converts the values of a field into a typed column array and a mask of NULL values.
+    """
+    field_name = field[0]
+    field_type = field[1]
+    if "DATEADDED" == field_name or "LONG" == field_type:
+        # NULL values are converted to NaN
+        float_column = numpy.asarray(values, dtype=numpy.float64)
+        nulls = numpy.isnan(float_column)
+        column = numpy.where(nulls, 0, float_column).astype(numpy.int64)
+        if "DATEADDED" == field_name:
+            # DATEADDED creates a C-long overflow
+            # must be treated as a string!
+            column = column.astype(numpy.str_)
+        return (column, nulls if nulls.any() else None)
+    if "DOUBLE" == field_type:
+        column = numpy.asarray(values, dtype=numpy.float64)
+        nulls = numpy.isnan(column)
+        return (column, nulls if nulls.any() else None)
+    column = numpy.empty(len(values), dtype=object)
+    column[:] = values
+    return (column, None)
+
+def transpose_records(records):
+    """Transposes the records of a page into the values of every field.
+    The value tuple of a BigQuery row is read as a whole, because iterating a row calls __getitem__ for every value.
+    """
+    return list(zip(*[getattr(record, "_xxx_values", record) for record in records]))
+
+def column_to_list(column, nulls=None):
+    """Converts a column array into a list of native values.
+    The values masked as NULL are returned as None.
+    """
+    values = column.tolist()
+    if nulls is not None:
+        for null_index in numpy.flatnonzero(nulls).tolist():
+            values[null_index] = None
+    return values
+
+def convert_timestamps(values):
+    """Converts integer timestamps formatted as YYYYMMDDhhmmss into datetime64 values.
+    Returns the datetime64 array and a mask of the valid timestamps.
+    """
+    # NULL values are converted to NaN
+    float_values = numpy.asarray(values, dtype=numpy.float64)
+    valid = ~numpy.isnan(float_values)
+    timestamps = numpy.where(valid, float_values, 19700101000000).astype(numpy.int64)
+    years = timestamps // 10000000000
+    months = timestamps // 100000000 % 100
+    days = timestamps // 1000000 % 100
+    hours = timestamps // 10000 % 100
+    minutes = timestamps // 100 % 100
+    seconds = timestamps % 100
+    valid &= (1 <= months) & (months <= 12) & (1 <= days) & (days <= 31) & (hours < 24) & (minutes < 60) & (seconds < 60)
+    months = numpy.where(valid, months, 1)
+    days = numpy.where(valid, days, 1)
+    month_starts = (years - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (months - 1).astype("timedelta64[M]")
+    dates = month_starts.astype("datetime64[D]") + (days - 1).astype("timedelta64[D]")
+    # Days overflowing the month like the 31st of April are invalid
+    valid &= dates.astype("datetime64[M]") == month_starts
+    datetimes = dates.astype("datetime64[s]") + hours.astype("timedelta64[h]") + minutes.astype("timedelta64[m]") + seconds.astype("timedelta64[s]")
+    return (datetimes, valid)
+
+
+
+class gdelt_batch_record(object):
+    """Represents a lightweight view of one record of a batch.
+    The values are read from the column arrays of the batch on demand.
+    """
+
+    __slots__ = ("__batch", "__index")
+
+    def __init__(self, batch, index):
+        self.__batch = batch
+        self.__index = index
+
+    def __get_id(self):
+        return self.__batch.ids.item(self.__index)
+
+    def __get_location(self):
+        (x, y) = self.__batch.locations
+        return (x.item(self.__index), y.item(self.__index))
+
+    def __get_fullname(self):
+        field_name = self.__batch.FULLNAME_FIELD
+        if field_name not in [field[0] for field in self.__batch.fields]:
+            return None
+        return self.__batch.value(self.__index, field_name)
+
+    def __get_values(self):
+        return tuple(self.__batch.row(self.__index))
+
+    id = property(__get_id)
+
+    location = property(__get_location)
+
+    fullname = property(__get_fullname)
+
+    values = property(__get_values)
+
+
+
+class gdelt_batch(object):
+    """Represents a batch of GDELT records as typed column arrays.
+    The columns are ordered like the fields of the corresponding feature class.
+    """
+
+    FULLNAME_FIELD = None
+
+    def __init__(self, fields, columns, null_masks=None):
+        self.__fields = fields
+        self.__columns = columns
+        self.__null_masks = null_masks if null_masks else {}
+        self.__field_index = {field[0]: index for (index, field) in enumerate(fields)}
+
+    def __len__(self):
+        if not self.__columns:
+            return 0
+        return len(self.__columns[0])
+
+    def __get_fields(self):
+        return self.__fields
+
+    def __get_columns(self):
+        return self.__columns
+
+    def __get_null_masks(self):
+        return self.__null_masks
+
+    fields = property(__get_fields)
+
+    columns = property(__get_columns)
+
+    null_masks = property(__get_null_masks)
+
+    def column(self, field_name):
+        """Returns the column array of a field.
+        """
+        return self.__columns[self.__field_index[field_name]]
+
+    def value(self, index, field_name):
+        """Returns the native value of a field of one record.
+        NULL values are returned as None.
+        """
+        field_index = self.__field_index[field_name]
+        if field_index in self.__null_masks and self.__null_masks[field_index][index]:
+            return None
+        return self.__columns[field_index].item(index)
+
+    def row(self, index):
+        """Returns the native values of one record.
+        NULL values are returned as None.
+        """
+        return [self.value(index, field[0]) for field in self.__fields]
+
+    def record(self, index):
+        """Returns a lightweight view of one record having id, location, fullname and values.
+        """
+        return gdelt_batch_record(self, index)
+
+    def records(self):
+        """Returns an iterator over lightweight views of all records.
+        """
+        return (gdelt_batch_record(self, index) for index in range(len(self)))
+
+    def column_lists(self):
+        """Returns the columns as lists of native values.
+        NULL values are returned as None.
+        """
+        return [column_to_list(column, self.__null_masks.get(index)) for (index, column) in enumerate(self.__columns)]
+
+    def select(self, mask):
+        """Returns a new batch containing only the records selected by the boolean mask.
+        """
+        columns = [column[mask] for column in self.__columns]
+        null_masks = {index: nulls[mask] for (index, nulls) in self.__null_masks.items()}
+        return type(self)(self.__fields, columns, null_masks)
+
+
+
+class gdelt_event_batch(gdelt_batch):
+    """Represents a batch of GDELT event records as typed column arrays.
+    The columns are ordered like the fields of the GDELT events feature class.
+    """
+
+    FULLNAME_FIELD = "ActionGeo_FullName"
+
+    @classmethod
+    def from_records(cls, records, fields=None):
+        """Creates a batch from a page of GDELT event records.
+        """
+        if fields is None:
+            fields = create_event_fields()
+        if records:
+            values_by_field = transpose_records(records)
+        else:
+            values_by_field = [()] * len(fields)
+        columns = []
+        null_masks = {}
+        for index, field in enumerate(fields):
+            (column, nulls) = _create_column(field, values_by_field[index])
+            columns.append(column)
+            if nulls is not None:
+                null_masks[index] = nulls
+        return cls(fields, columns, null_masks)
+
+    def __get_ids(self):
+        return self.column("GlobalEventId")
+
+    def __get_locations(self):
+        return (self.column("ActionGeo_Long"), self.column("ActionGeo_Lat"))
+
+    ids = property(__get_ids)
+
+    locations = property(__get_locations)
+
+
+
+class gdelt_graph_batch(gdelt_batch):
+    """Represents a batch of GDELT knowledge graph locations as typed column arrays.
+    Every location of the V2Locations of a document is exploded into its own record.
+    The columns are ordered like the fields of the GDELT knowledge graph feature class.
+    """
+
+    FULLNAME_FIELD = "Location_FullName"
+
+    def __init__(self, fields, columns, null_masks=None, failures=0):
+        gdelt_batch.__init__(self, fields, columns, null_masks)
+        self.__failures = failures
+
+    @classmethod
+    def from_records(cls, records):
+        """Creates a batch from a page of GDELT knowledge graph records.
+        The records must contain GKGRECORDID, V2Locations, DATE, SourceCommonName, DocumentIdentifier and optionally the matched Themes.
+        Locations which cannot be parsed are counted as failures.
+        """
+        fields = create_graph_fields()
+        (dates, valid_dates) = convert_timestamps([record[2] for record in records])
+        valid_dates = valid_dates.tolist()
+        failures = 0
+        document_indices = []
+        location_values = [[] for index in range(8)]
+        for document_index, record in enumerate(records):
+            for location in record[1].split(";"):
+                if not location:
+                    continue
+                location_parts = location.split("#")
+                if len(location_parts) < 8 or not valid_dates[document_index]:
+                    failures += 1
+                    continue
+                try:
+                    # Location type is LONG
+                    location_type = int(location_parts[0])
+                    # Latitude and Longitude are FLOAT
+                    latitude = float(location_parts[5])
+                    longitude = float(location_parts[6])
+                except ValueError:
+                    failures += 1
+                    continue
+                location_values[0].append(location_type)
+                location_values[1].append(location_parts[1])
+                location_values[2].append(location_parts[2])
+                location_values[3].append(location_parts[3])
+                location_values[4].append(location_parts[4])
+                location_values[5].append(latitude)
+                location_values[6].append(longitude)
+                location_values[7].append(location_parts[7])
+                document_indices.append(document_index)
+
+        document_indices = numpy.asarray(document_indices, dtype=numpy.int64)
+        record_ids = _create_column(fields[0], [record[0] for record in records])[0]
+        source_names = _create_column(fields[10], [record[3] for record in records])[0]
+        document_identifiers = _create_column(fields[11], [record[4] for record in records])[0]
+        themes = _create_column(fields[12], [record[5] if 5 < len(record) else None for record in records])[0]
+        columns = [record_ids[document_indices]]
+        for index in range(8):
+            columns.append(_create_column(fields[index + 1], location_values[index])[0])
+        columns.append(dates[document_indices])
+        columns.append(source_names[document_indices])
+        columns.append(document_identifiers[document_indices])
+        columns.append(themes[document_indices])
+        return cls(fields, columns, failures=failures)
+
+    def select(self, mask):
+        """Returns a new batch containing only the records selected by the boolean mask.
+        The parsing failures are kept.
+        """
+        batch = gdelt_batch.select(self, mask)
+        batch.__failures = self.__failures
+        return batch
+
+    def __get_ids(self):
+        return self.column("GKGRECORDID")
+
+    def __get_locations(self):
+        return (self.column("Location_Long"), self.column("Location_Lat"))
+
+    def __get_failures(self):
+        return self.__failures
+
+    ids = property(__get_ids)
+
+    locations = property(__get_locations)
+
+    failures = property(__get_failures)
@@ -0,0 +1,236 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+class gdelt_cache_writer(object):
+    """Writes the pages of one query result into a cache file.
+    The entry is only visible to readers after it was committed.
+    """
+
+    def __init__(self, cache, key, date):
+        self._cache = cache
+        self._key = key
+        self._date = date
+        self._temp_path = os.path.join(cache.path, "{0}.{1}.tmp".format(key, uuid.uuid4().hex))
+        self._file = gzip.open(self._temp_path, "wt", encoding="utf-8")
+        self._header_written = False
+
+    def write_page(self, field_names, rows):
+        """Writes a page of rows column by column.
+        """
+        if not self._header_written:
+            self._file.write(json.dumps({"fields": list(field_names)}))
+            self._file.write("\n")
+            self._header_written = True
+        columns = [list(column) for column in zip(*rows)]
+        self._file.write(json.dumps({"columns": columns}))
+        self._file.write("\n")
+
+    def commit(self):
+        """Closes the cache file and registers the entry.
+        """
+        self._file.close()
+        if not self._header_written:
+            # Empty results are not cached
+            os.remove(self._temp_path)
+            return
+        self._cache._register(self._key, self._date, self._temp_path)
+
+    def discard(self):
+        """Closes and removes the incomplete cache file.
+        """
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+
+
+class gdelt_cache(object):
+    """Persistent on-disk cache for GDELT query results.
+    Every entry is a gzip compressed file storing the result pages column by column.
+    Entries are evicted by age and in least recently used order when the cache grows too large.
+    Entries of today's partition expire after a short time to live, because new events are still added.
+    """
+
+    def __init__(self, path=None, max_size=1024*1024*1024, max_age=datetime.timedelta(days=30), today_ttl=datetime.timedelta(minutes=15)):
+        if path is None:
+            path = os.path.join(os.path.expanduser("~"), ".geoint", "cache")
+        os.makedirs(path, exist_ok=True)
+        self._path = path
+        self._index_path = os.path.join(path, "index.json")
+        self._max_size = max_size
+        self._max_age = max_age
+        self._today_ttl = today_ttl
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+        self._index = self._load_index()
+
+    def __get_path(self):
+        return self._path
+
+    def __get_statistics(self):
+        with self._lock:
+            requests = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": float(self._hits) / requests if requests else 0.0,
+                "stores": self._stores,
+                "evictions": self._evictions,
+                "entries": len(self._index),
+                "size": sum(entry["size"] for entry in self._index.values())
+            }
+
+    path = property(__get_path)
+
+    statistics = property(__get_statistics)
+
+    @staticmethod
+    def create_key(table, date, bbox=None, theme=None, limit=None, columns="*", filters=None):
+        """Creates the cache key of a normalized query.
+        The bounding box can be a single bounding box or a list of bounding boxes.
+        """
+        if bbox:
+            bboxes = bbox if isinstance(bbox, list) else [bbox]
+            bbox = sorted([round(float(item[name]), 6) for name in ["xmin", "ymin", "xmax", "ymax"]] for item in bboxes)
+        if not isinstance(columns, str):
+            columns = sorted(columns)
+        normalized = {
+            "table": table,
+            "date": str(date),
+            "bbox": bbox,
+            "theme": theme,
+            "limit": limit,
+            "columns": columns,
+            "filters": filters if filters else None
+        }
+        return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def lookup(self, key):
+        """Returns an iterator over the cached pages as (field names, rows) or None when the query is not cached.
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry and self._is_expired(entry):
+                self._evict(key)
+                self._save_index()
+                entry = None
+            if not entry:
+                self._misses += 1
+                return None
+            self._hits += 1
+            entry["accessed"] = time.time()
+            self._save_index()
+            return self._read_pages(os.path.join(self._path, entry["file"]))
+
+    def store(self, key, date):
+        """Returns a writer for storing the pages of a query result.
+        """
+        return gdelt_cache_writer(self, key, str(date))
+
+    def clear(self):
+        """Removes all entries from this cache.
+        """
+        with self._lock:
+            for key in list(self._index.keys()):
+                self._evict(key)
+            self._save_index()
+
+    def _read_pages(self, file_path):
+        with gzip.open(file_path, "rt", encoding="utf-8") as cache_file:
+            header = json.loads(cache_file.readline())
+            field_names = header["fields"]
+            for line in cache_file:
+                columns = json.loads(line)["columns"]
+                yield (field_names, list(zip(*columns)))
+
+    def _register(self, key, date, temp_path):
+        with self._lock:
+            file_name = "{0}.json.gz".format(key)
+            os.replace(temp_path, os.path.join(self._path, file_name))
+            now = time.time()
+            self._index[key] = {
+                "file": file_name,
+                "date": date,
+                "size": os.path.getsize(os.path.join(self._path, file_name)),
+                "created": now,
+                "accessed": now
+            }
+            self._stores += 1
+            self._evict_expired()
+            self._evict_least_recently_used()
+            self._save_index()
+
+    def _is_expired(self, entry):
+        age = time.time() - entry["created"]
+        if entry["date"] >= str(datetime.date.today()):
+            return age > self._today_ttl.total_seconds()
+        return age > self._max_age.total_seconds()
+
+    def _evict_expired(self):
+        for key in [key for key, entry in self._index.items() if self._is_expired(entry)]:
+            self._evict(key)
+
+    def _evict_least_recently_used(self):
+        size = sum(entry["size"] for entry in self._index.values())
+        for key in sorted(self._index.keys(), key=lambda key: self._index[key]["accessed"]):
+            if size <= self._max_size:
+                break
+            size -= self._index[key]["size"]
+            self._evict(key)
+
+    def _evict(self, key):
+        entry = self._index.pop(key)
+        file_path = os.path.join(self._path, entry["file"])
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        self._evictions += 1
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path):
+            return {}
+        try:
+            with open(self._index_path, "r") as index_file:
+                return json.load(index_file)
+        except ValueError:
+            # A corrupted index invalidates the whole cache
+            return {}
+
+    def _save_index(self):
+        temp_path = "{0}.{1}.tmp".format(self._index_path, uuid.uuid4().hex)
+        with open(temp_path, "w") as index_file:
+            json.dump(self._index, index_file)
+        os.replace(temp_path, self._index_path)
@@ -23,22 +23,39 @@
 # See <https://developers.arcgis.com/> for further information.
 #
 
+import concurrent.futures
 import datetime
-from google.cloud import bigquery
+import queue
+import re
+import threading
+import time
+from geoint.gdelt_batch import gdelt_event_batch, gdelt_graph_batch
+from geoint.gdelt_cache import gdelt_cache
+from geoint.gdelt_grid import gdelt_grid
+from geoint.gdelt_instrumentation import gdelt_instrumentation
+from geoint.gdelt_pool import get_client_pool
+from geoint.gdelt_progress import gdelt_cancelled_error, gdelt_timeout_error
+from geoint.gdelt_query import gdelt_query_builder
+from geoint.gdelt_schema import create_graph_columns
 
 class gdelt_event(object):
     """Represents a GDELT event record.
+    The values are stored as a tuple and the record has no instance dictionary.
     """
 
-    def __init__(self, record):
+    __slots__ = ("__id", "__location", "__fullname", "__values")
+
+    def __init__(self, record, dateadded_index=59):
         self.__id = record.GLOBALEVENTID
         self.__location = (record.ActionGeo_Long, record.ActionGeo_Lat)
-        self.__fullname = record.ActionGeo_FullName
-        self.__values = [value for value in record]
+        self.__fullname = record.get("ActionGeo_FullName")
+        values = tuple(record)
 
         # DATEADDED creates a C-long overflow
         # must be treated as a string!
-        self.__values[59] = str(self.__values[59])
+        if dateadded_index is not None:
+            values = values[:dateadded_index] + (str(values[dateadded_index]),) + values[dateadded_index + 1:]
+        self.__values = values
 
     def __get_id(self):
         return self.__id
@@ -73,8 +90,11 @@ class gdelt_event(object):
 
 class gdelt_graph_record(object):
     """Represents a GDELT knowledge graph record.
+    The record has no instance dictionary.
     """
 
+    __slots__ = ("__id", "__location", "__values")
+
     def __init__(self, values):
         self.__id = values[0]
         self.__location = (values[7], values[6])
@@ -109,8 +129,11 @@ class gdelt_graph_entry(object):
 
     def __init__(self, record):
         self.__records = []
+        self.__failures = 0
         locations = record[1].split(";")
         for location in locations:
+            if not location:
+                continue
             values = [record[0]]
             try:
                 location_values = location.split("#")
@@ -121,53 +144,239 @@ class gdelt_graph_entry(object):
                 location_values[6] = float(location_values[6])
                 # Only append to the Feature ID
                 values += location_values[:8]
-                values += [value for value in record[2:]]
+                values += [value for value in record[2:5]]
+                # The matched themes are optional
+                values.append(record[5] if 5 < len(record) else None)
                 self.__records.append(gdelt_graph_record(values))
-            except:
-                # Swallow any exception like float parsing
-                pass
+            except (IndexError, TypeError, ValueError):
+                # Count parsing failures like float parsing
+                self.__failures += 1
 
     def __get_records(self):
         return self.__records
 
+    def __get_failures(self):
+        return self.__failures
+
     records = property(__get_records)
 
+    failures = property(__get_failures)
+
+
+
+class gdelt_query_planner(object):
+    """Plans the queries for a list of bounding boxes.
+    Overlapping bounding boxes are merged and the remaining ones are OR'ed into a few clustered queries.
+    """
+
+    def __init__(self, max_predicates=200):
+        self._max_predicates = max_predicates
+
+    def plan(self, bboxes):
+        """Returns a list of bounding box lists, every list is answered by one query.
+        """
+        merged_bboxes = self.merge(bboxes)
+        # Neighbouring bounding boxes are clustered into the same query
+        merged_bboxes.sort(key=lambda bbox: (bbox["xmin"], bbox["ymin"]))
+        return [merged_bboxes[index:index + self._max_predicates] for index in range(0, len(merged_bboxes), self._max_predicates)]
+
+    def merge(self, bboxes):
+        """Merges intersecting bounding boxes as long as their union is not larger than both areas.
+        """
+        merged_bboxes = [dict(bbox) for bbox in bboxes]
+        merged = True
+        while merged:
+            merged = False
+            for index, bbox in enumerate(merged_bboxes):
+                for other_index in range(index + 1, len(merged_bboxes)):
+                    other_bbox = merged_bboxes[other_index]
+                    if self._mergeable(bbox, other_bbox):
+                        merged_bboxes[index] = self._union(bbox, other_bbox)
+                        del merged_bboxes[other_index]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return merged_bboxes
+
+    def _mergeable(self, bbox, other_bbox):
+        if bbox["xmax"] < other_bbox["xmin"] or other_bbox["xmax"] < bbox["xmin"]:
+            return False
+        if bbox["ymax"] < other_bbox["ymin"] or other_bbox["ymax"] < bbox["ymin"]:
+            return False
+        return self._area(self._union(bbox, other_bbox)) <= self._area(bbox) + self._area(other_bbox)
+
+    def _union(self, bbox, other_bbox):
+        return {
+            "xmin": min(bbox["xmin"], other_bbox["xmin"]),
+            "xmax": max(bbox["xmax"], other_bbox["xmax"]),
+            "ymin": min(bbox["ymin"], other_bbox["ymin"]),
+            "ymax": max(bbox["ymax"], other_bbox["ymax"])
+        }
+
+    def _area(self, bbox):
+        return (bbox["xmax"] - bbox["xmin"]) * (bbox["ymax"] - bbox["ymin"])
+
 
 
 class gdelt_client(object):
     """Client for accesing the GDELT events table.
+    The fetched rows are reported to the optional progress and the optional cancellation token is checked between the pages.
+    A query job exceeding the timeout in seconds is cancelled.
     """
+
+    POLL_SECONDS = 1.0
     
-    def __init__(self):
-        self._client = bigquery.Client()
+    def __init__(self, cache=None, client=None, max_workers=4, instrumentation=None, progress=None, cancellation=None, timeout=None):
+        if client is None:
+            client = self._create_client()
+        self._client = client
+        self._cache = cache
+        self._planner = gdelt_query_planner()
+        self._max_workers = max_workers
+        self._instrumentation = instrumentation if instrumentation else gdelt_instrumentation()
+        self._progress = progress
+        self._cancellation = cancellation
+        self._timeout = timeout
+
+    def __get_instrumentation(self):
+        return self._instrumentation
+
+    def __get_progress(self):
+        return self._progress
+
+    def __get_cancellation(self):
+        return self._cancellation
+
+    instrumentation = property(__get_instrumentation)
+
+    progress = property(__get_progress)
+
+    cancellation = property(__get_cancellation)
 
     def __del__(self):
-        # Close works with version 1.24.0
-        # We had to downgrade to version 1.22.0
-        # See https://github.com/esride-jts/geoint-toolbox/issues/2
-        #self._client.close()
+        # The shared BigQuery client is closed by the client pool at exit
         del self._client
 
-    def query(self, date, limit=1000):
+    def query(self, date, limit=1000, end_date=None):
         """Queries the GDELT events table partitioned using a days restricted on a specific date.
+        When an end date is set, all days from date to end date are queried.
         """
-        query = ("SELECT * "
-                 "FROM `gdelt-bq.gdeltv2.events_partitioned` WHERE DATE(_PARTITIONTIME) = "
-                 "'{0}' AND ActionGeo_Lat IS NOT NULL AND ActionGeo_Long IS NOT NULL LIMIT {1}".format(date, limit)
-                 )
-        query_job = self._client.query(query)
-        return [gdelt_event(record) for record in query_job.result()]
+        return list(self.iter_query(date, limit, end_date=end_date))
+
+    def iter_query(self, date, limit=1000, page_size=10000, end_date=None):
+        """Queries the GDELT events table partitioned using a days restricted on a specific date.
+        When an end date is set, all days from date to end date are queried concurrently.
+        The events are fetched page-wise and returned as an iterator.
+        """
+        return self.iter_query_events(gdelt_query_builder(date, limit, end_date), page_size)
 
-    def query_bbox(self, date, bbox, limit=1000):
+    def iter_query_batches(self, date, limit=1000, page_size=10000, end_date=None):
+        """Queries the GDELT events table partitioned using a days restricted on a specific date.
+        When an end date is set, all days from date to end date are queried concurrently.
+        Every fetched page is returned as a batch of typed column arrays.
+        """
+        return self.iter_query_events_batches(gdelt_query_builder(date, limit, end_date), page_size)
+
+    def query_bbox(self, date, bbox, limit=1000, end_date=None):
         """Queries the GDELT events table partitioned using a days restricted on a specific date and a bounding box.
+        When an end date is set, all days from date to end date are queried.
         """
-        query = ("SELECT * "
-                 "FROM `gdelt-bq.gdeltv2.events_partitioned` WHERE DATE(_PARTITIONTIME) = "
-                 "'{0}' AND ActionGeo_Lat IS NOT NULL AND ActionGeo_Long IS NOT NULL "
-                 "AND ActionGeo_Long >= {1} AND ActionGeo_Long <= {2} AND ActionGeo_Lat >= {3} AND ActionGeo_Lat <= {4} LIMIT {5}".format(date, bbox["xmin"], bbox["xmax"], bbox["ymin"], bbox["ymax"], limit)
-                 )
-        query_job = self._client.query(query)
-        return [gdelt_event(record) for record in query_job.result()]
+        return list(self.iter_query_bbox(date, bbox, limit, end_date=end_date))
+
+    def iter_query_bbox(self, date, bbox, limit=1000, page_size=10000, end_date=None):
+        """Queries the GDELT events table partitioned using a days restricted on a specific date and a bounding box.
+        When an end date is set, all days from date to end date are queried concurrently.
+        The events are fetched page-wise and returned as an iterator.
+        """
+        return self.iter_query_events(gdelt_query_builder(date, limit, end_date).bbox(bbox), page_size)
+
+    def iter_query_bbox_batches(self, date, bbox, limit=1000, page_size=10000, end_date=None):
+        """Queries the GDELT events table partitioned using a days restricted on a specific date and a bounding box.
+        When an end date is set, all days from date to end date are queried concurrently.
+        Every fetched page is returned as a batch of typed column arrays.
+        """
+        return self.iter_query_events_batches(gdelt_query_builder(date, limit, end_date).bbox(bbox), page_size)
+
+    def query_bboxes(self, date, bboxes, limit=1000, end_date=None):
+        """Queries the GDELT events table partitioned using a days restricted on a specific date and a list of bounding boxes.
+        When an end date is set, all days from date to end date are queried.
+        """
+        return list(self.iter_query_bboxes(date, bboxes, limit, end_date=end_date))
+
+    def iter_query_bboxes(self, date, bboxes, limit=1000, page_size=10000, end_date=None):
+        """Queries the GDELT events table partitioned using a days restricted on a specific date and a list of bounding boxes.
+        The bounding boxes are coalesced into as few queries as possible and the limit applies to all of them.
+        When an end date is set, all days from date to end date are queried concurrently.
+        The events are fetched page-wise and returned as an iterator.
+        """
+        return self.iter_query_events(gdelt_query_builder(date, limit, end_date).bbox(bboxes), page_size)
+
+    def iter_query_bboxes_batches(self, date, bboxes, limit=1000, page_size=10000, end_date=None):
+        """Queries the GDELT events table partitioned using a days restricted on a specific date and a list of bounding boxes.
+        The bounding boxes are coalesced into as few queries as possible and the limit applies to all of them.
+        When an end date is set, all days from date to end date are queried concurrently.
+        Every fetched page is returned as a batch of typed column arrays.
+        """
+        return self.iter_query_events_batches(gdelt_query_builder(date, limit, end_date).bbox(bboxes), page_size)
+
+    def query_events(self, builder):
+        """Queries the GDELT events table using a query builder.
+        """
+        return list(self.iter_query_events(builder))
+
+    def iter_query_events(self, builder, page_size=10000):
+        """Queries the GDELT events table using a query builder.
+        The bounding boxes of the builder are coalesced into as few queries as possible and every day is queried concurrently.
+        The events are fetched page-wise and returned as an iterator.
+        """
+        (jobs, deduplicate) = self._create_builder_queries(builder)
+        fields = builder.fields
+        # Every event is a view of the typed columns of its page
+        create_events = lambda page: list(gdelt_event_batch.from_records(page, fields).records())
+        return (gdelt_event for page in self._iter_jobs_pages(jobs, page_size, builder.limit, deduplicate) for gdelt_event in self._construct(page, create_events))
+
+    def iter_query_events_batches(self, builder, page_size=10000):
+        """Queries the GDELT events table using a query builder.
+        The bounding boxes of the builder are coalesced into as few queries as possible and every day is queried concurrently.
+        Every fetched page is returned as a batch of typed column arrays matching the fields of the builder.
+        """
+        (jobs, deduplicate) = self._create_builder_queries(builder)
+        fields = builder.fields
+        return (self._construct(page, lambda page: gdelt_event_batch.from_records(page, fields)) for page in self._iter_jobs_pages(jobs, page_size, builder.limit, deduplicate))
+
+    def query_bins(self, builder, grid=None, page_size=10000):
+        """Queries the GDELT events table using a query builder and aggregates the events into the cells of a grid.
+        BigQuery returns one row per cell and day, every day is queried concurrently and the rows of all days are merged.
+        The bounding boxes of the builder are OR'ed into one query, so that no event is counted twice.
+        By default the events are binned into cells of one degree.
+        """
+        if grid is None:
+            grid = gdelt_grid()
+        bboxes = self._planner.merge(builder.bboxes)
+        jobs = [(builder.build_bins(grid, day, bboxes), builder.create_bins_key(grid, day, bboxes), day) for day in builder.dates]
+        rows = [0]
+        def count_rows(pages):
+            for page in pages:
+                rows[0] += len(page)
+                yield page
+        with self._instrumentation.measure("aggregate") as stage:
+            gdelt_bins = grid.merge(count_rows(self._iter_jobs_pages(jobs, page_size, None)))
+            stage.rows_in = rows[0]
+            stage.rows_out = len(gdelt_bins)
+        return gdelt_bins
+
+    def dry_run(self, builder):
+        """Returns the number of bytes the queries of a query builder would process.
+        No query job is executed.
+        """
+        # BigQuery is imported on first use, so that loading the toolbox stays fast
+        from google.cloud import bigquery
+        (jobs, deduplicate) = self._create_builder_queries(builder)
+        job_config = bigquery.QueryJobConfig()
+        job_config.dry_run = True
+        job_config.use_query_cache = False
+        return sum(self._client.query(query, job_config=job_config).total_bytes_processed for (query, cache_key, date) in jobs)
 
     def query_today(self, limit=1000):
         """Queries the GDELT events table from today.
@@ -179,12 +388,303 @@ class gdelt_client(object):
         """
         return self.query((datetime.datetime.now()-datetime.timedelta(days=1)).date(), limit)
 
-    def query_graph(self, date, theme, limit=1000):
-        """Queries the global knowledge graph by using a specific date and a theme.
+    def query_graph(self, date, theme, limit=1000, end_date=None, since=None):
+        """Queries the global knowledge graph by using a specific date and a theme or a list of themes.
+        A list of themes is queried by a single scan and every record is tagged with the themes its document matched.
+        When an end date is set, all days from date to end date are queried.
+        When since is set, only documents published at or after this datetime are queried.
+        The datetime can also be an integer like 20201017120000.
         """
-        query = ("SELECT GKGRECORDID, V2Locations, DATE, SourceCommonName, DocumentIdentifier "
+        return list(self.iter_query_graph(date, theme, limit, end_date=end_date, since=since))
+
+    def iter_query_graph(self, date, theme, limit=1000, page_size=10000, end_date=None, since=None):
+        """Queries the global knowledge graph by using a specific date and a theme or a list of themes.
+        When an end date is set, all days from date to end date are queried concurrently.
+        The themes are matched as exact tokens and the limit is the maximum number of documents over all days, like gdelt_file_client does.
+        The graph records are fetched page-wise and returned as an iterator.
+        """
+        jobs = [self._create_graph_query(day, theme, limit, since) for day in self._create_dates(date, end_date)]
+        create_records = lambda page: [record for graph_record in page for record in gdelt_graph_entry(graph_record).records]
+        return (record for page in self._iter_jobs_pages(jobs, page_size, limit) for record in self._construct(page, create_records))
+
+    def iter_query_graph_batches(self, date, theme, limit=1000, page_size=10000, end_date=None, since=None):
+        """Queries the global knowledge graph by using a specific date and a theme or a list of themes.
+        When an end date is set, all days from date to end date are queried concurrently.
+        The themes are matched as exact tokens and the limit is the maximum number of documents over all days, like gdelt_file_client does.
+        Every fetched page is parsed into a batch of typed column arrays having one record per location.
+        """
+        jobs = [self._create_graph_query(day, theme, limit, since) for day in self._create_dates(date, end_date)]
+        return (self._construct(page, gdelt_graph_batch.from_records) for page in self._iter_jobs_pages(jobs, page_size, limit))
+
+    def _create_client(self):
+        """Returns the BigQuery client being shared by all GDELT clients of this process.
+        """
+        return get_client_pool().get()
+
+    def _construct(self, page, create):
+        """Creates the records or the batch of a page and measures the construct stage.
+        """
+        with self._instrumentation.measure("construct") as stage:
+            records = create(page)
+            stage.rows_in = len(page)
+            stage.rows_out = len(records)
+        return records
+
+    def _create_dates(self, date, end_date):
+        """Creates the list of days from date to end date.
+        """
+        if end_date is None:
+            return [date]
+        if end_date < date:
+            raise ValueError("The end date must not be before the start date!")
+        return [date + datetime.timedelta(days=offset) for offset in range((end_date - date).days + 1)]
+
+    def _create_builder_queries(self, builder):
+        """Creates the queries of a query builder for every day and cluster of bounding boxes.
+        Returns the list of query, cache key and date and whether the results must be deduplicated.
+        """
+        bboxes = builder.bboxes
+        plan = self._planner.plan(bboxes) if bboxes else [[]]
+        jobs = [(builder.build(day, planned_bboxes), builder.create_key(day, planned_bboxes), day) for day in builder.dates for planned_bboxes in plan]
+        return (jobs, 1 < len(plan))
+
+    def _create_themes(self, theme):
+        """Creates the sorted list of distinct themes from a theme or a list of themes.
+        """
+        themes = [theme] if isinstance(theme, str) else list(theme)
+        if not themes:
+            raise ValueError("At least one theme must be queried!")
+        for item in themes:
+            if not re.match("^[A-Za-z0-9_]+$", item):
+                raise ValueError("The theme {0} is not valid!".format(item))
+        return sorted(set(themes))
+
+    def _create_graph_query(self, date, theme, limit, since=None):
+        """Creates the query of the global knowledge graph.
+        The themes are matched as exact tokens of V2Themes, the LIKE predicates only prune the documents before the tokens are compared.
+        The LIMIT clause is omitted when the limit is None.
+        Returns the query, its cache key and the date.
+        """
+        themes = self._create_themes(theme)
+        since_predicate = ""
+        filters = None
+        if since is not None:
+            if isinstance(since, datetime.datetime):
+                since = since.strftime("%Y%m%d%H%M%S")
+            since_predicate = " AND DATE >= {0}".format(int(since))
+            filters = {"since_date": int(since)}
+        like_predicates = " OR ".join("V2Themes LIKE '%{0}%'".format(item) for item in themes)
+        theme_list = ", ".join("'{0}'".format(item) for item in themes)
+        # Every V2Themes token is a theme followed by its character offset
+        query = ("SELECT GKGRECORDID, V2Locations, DATE, SourceCommonName, DocumentIdentifier, Themes FROM ("
+                 "SELECT GKGRECORDID, V2Locations, DATE, SourceCommonName, DocumentIdentifier, "
+                 "ARRAY_TO_STRING(ARRAY(SELECT DISTINCT theme FROM (SELECT SPLIT(token, ',')[SAFE_OFFSET(0)] AS theme FROM UNNEST(SPLIT(V2Themes, ';')) AS token) "
+                 "WHERE theme IN ({0}) ORDER BY theme), ';') AS Themes "
                  "FROM `gdelt-bq.gdeltv2.gkg_partitioned` WHERE DATE(_PARTITIONTIME) = "
-                 "'{0}' AND V2Locations IS NOT NULL AND V2Themes LIKE '%{1}%' LIMIT {2}".format(date, theme, limit)
+                 "'{1}' AND V2Locations IS NOT NULL AND ({2}){3}) WHERE Themes != ''".format(theme_list, date, like_predicates, since_predicate)
                  )
+        if limit is not None:
+            # No day can contribute more documents than the limit over all days
+            query = "{0} LIMIT {1}".format(query, limit)
+        cache_key = gdelt_cache.create_key("gdelt-bq.gdeltv2.gkg_partitioned", date, theme=";".join(themes), limit=limit, columns=create_graph_columns(), filters=filters)
+        return (query, cache_key, date)
+
+    def _iter_jobs_pages(self, jobs, page_size, limit, deduplicate=False):
+        """Runs the queries and yields the result pages.
+        More than one query is run concurrently and the pages are merged as they arrive.
+        The limit is applied over all queries unless it is None and duplicated events are removed on demand.
+        """
+        if 1 == len(jobs):
+            (query, cache_key, date) = jobs[0]
+            pages = self._iter_pages(query, page_size, cache_key, date)
+        else:
+            pages = self._iter_concurrent_pages(jobs, page_size)
+
+        seen_ids = set()
+        remaining = limit
+        try:
+            while remaining is None or 0 < remaining:
+                self._check_cancelled()
+                # The fetch stage includes waiting for BigQuery, reading the cache and removing duplicates
+                with self._instrumentation.measure("fetch") as stage:
+                    page = next(pages, None)
+                    if page is None:
+                        return
+                    if deduplicate:
+                        records = []
+                        for record in page:
+                            if record.GLOBALEVENTID in seen_ids:
+                                continue
+                            seen_ids.add(record.GLOBALEVENTID)
+                            records.append(record)
+                    else:
+                        records = page
+                    if remaining is not None:
+                        records = records[:remaining]
+                        remaining -= len(records)
+                    stage.rows_in = len(page)
+                    stage.rows_out = len(records)
+                if records:
+                    self._report_fetched(len(records))
+                    yield records
+        finally:
+            pages.close()
+
+    def _iter_concurrent_pages(self, jobs, page_size):
+        """Runs the queries using a bounded pool of workers and yields the pages as they arrive.
+        The pages are passed through a bounded queue, so that the workers wait for the consumer.
+        Only the consumer polls the cancellation token, the workers read whether it was signalled.
+        When the consumer stops early, the running query jobs are cancelled and the workers are not awaited.
+        """
+        pages = queue.Queue(maxsize=2 * self._max_workers)
+        stopped = threading.Event()
+        job_finished = object()
+        lock = threading.Lock()
+        running_jobs = set()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def run(job):
+            if stopped.is_set():
+                return
+            (query, cache_key, date) = job
+            started_jobs = []
+
+            def start(query_job):
+                with lock:
+                    started_jobs.append(query_job)
+                    running_jobs.add(query_job)
+                    if stopped.is_set():
+                        query_job.cancel()
+
+            try:
+                job_pages = self._iter_pages(query, page_size, cache_key, date, poll=False, started=start)
+                try:
+                    for page in job_pages:
+                        if not put(page):
+                            return
+                finally:
+                    job_pages.close()
+            except BaseException as ex:
+                put(ex)
+            finally:
+                with lock:
+                    running_jobs.difference_update(started_jobs)
+                put(job_finished)
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._max_workers)
+        for job in jobs:
+            executor.submit(run, job)
+        try:
+            running = len(jobs)
+            while 0 < running:
+                try:
+                    item = pages.get(timeout=self.POLL_SECONDS)
+                except queue.Empty:
+                    self._check_cancelled()
+                    continue
+                if item is job_finished:
+                    running -= 1
+                elif isinstance(item, BaseException):
+                    raise item
+                else:
+                    yield item
+        finally:
+            # Let the workers finish without waiting for the consumer
+            stopped.set()
+            with lock:
+                for query_job in running_jobs:
+                    query_job.cancel()
+            # The pending jobs return at once and the cancelled jobs are not awaited
+            executor.shutdown(wait=False)
+
+    def _check_cancelled(self):
+        if self._cancellation is not None:
+            self._cancellation.check()
+
+    def _report_fetched(self, rows):
+        if self._progress is not None:
+            self._progress.add_fetched(rows)
+
+    def _wait(self, query_job, page_size, poll=True):
+        """Waits for the query job and returns its row iterator.
+        Without a cancellation token and a timeout the job is awaited at once, otherwise the token and the timeout are polled.
+        Worker threads do not poll the token and only read whether it was signalled.
+        A cancelled or timed out job is cancelled in BigQuery, so that it does not keep running.
+        """
+        if self._cancellation is None and self._timeout is None:
+            return query_job.result(page_size=page_size)
+
+        deadline = None if self._timeout is None else time.perf_counter() + self._timeout
+        while True:
+            poll_seconds = self.POLL_SECONDS
+            if deadline is not None:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    query_job.cancel()
+                    raise gdelt_timeout_error("The GDELT query job did not finish within {0} seconds!".format(self._timeout))
+                poll_seconds = min(poll_seconds, remaining)
+            if self._cancellation is not None and (self._cancellation.cancelled if poll else self._cancellation.signalled):
+                query_job.cancel()
+                raise gdelt_cancelled_error("The GDELT query job was cancelled!")
+            try:
+                return query_job.result(page_size=page_size, timeout=poll_seconds)
+            except concurrent.futures.TimeoutError:
+                pass
+
+    def _iter_pages(self, query, page_size, cache_key=None, date=None, poll=True, started=None):
+        """Runs the query and yields the result pages.
+        The pages are read from and written to the cache when this client has one.
+        The optional started callback receives the query job before it is awaited.
+        """
+        if self._cache and cache_key:
+            cached_pages = self._cache.lookup(cache_key)
+            if cached_pages is not None:
+                from google.cloud.bigquery.table import Row
+                field_to_index = None
+                for (field_names, rows) in cached_pages:
+                    if field_to_index is None:
+                        field_to_index = {field_name: index for (index, field_name) in enumerate(field_names)}
+                    yield [Row(values, field_to_index) for values in rows]
+                return
+
         query_job = self._client.query(query)
-        return [record for graph_record in query_job.result() for record in gdelt_graph_entry(graph_record).records]
+        if started is not None:
+            started(query_job)
+        row_iterator = self._wait(query_job, page_size, poll)
+        self._instrumentation.record_job(query_job)
+        if not self._cache or not cache_key:
+            for page in row_iterator.pages:
+                yield list(page)
+            return
+
+        cache_writer = self._cache.store(cache_key, date)
+        committed = False
+        try:
+            field_names = [field.name for field in row_iterator.schema]
+            # The consumer stops reading when the limit is reached,
+            # so the entry is committed as soon as the last row has arrived
+            total_rows = getattr(row_iterator, "total_rows", None)
+            rows = 0
+            for page in row_iterator.pages:
+                records = list(page)
+                cache_writer.write_page(field_names, [record.values() for record in records])
+                rows += len(records)
+                if total_rows is not None and total_rows <= rows:
+                    cache_writer.commit()
+                    committed = True
+                yield records
+            if not committed:
+                cache_writer.commit()
+                committed = True
+        finally:
+            # Results which were not completely read are never cached
+            if not committed:
+                cache_writer.discard()
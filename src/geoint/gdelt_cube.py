@@ -0,0 +1,185 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+import math
+import numpy
+from geoint.gdelt_batch import convert_timestamps
+from geoint.gdelt_instrumentation import gdelt_instrumentation
+
+EVENT_ROOT_CODES = ["{0:02d}".format(code) for code in range(1, 21)]
+
+class gdelt_space_time_cube(object):
+    """Aggregates batches of GDELT records into space-time bins of fixed-degree cells and hours or days.
+    The batches are added incrementally as the pages arrive and are not kept, so that the memory only grows with the occupied bins.
+    Every bin counts the records, the QuadClass values and the EventRootCode values of the events.
+    """
+
+    INTERVALS = { "hour": 3600, "day": 86400 }
+
+    def __init__(self, cell_size=1.0, interval="day", instrumentation=None):
+        if cell_size <= 0 or 180 < cell_size:
+            raise ValueError("The cell size must be greater than 0 and not greater than 180 degrees!")
+        if interval not in self.INTERVALS:
+            raise ValueError("The interval must be one of {0}!".format(", ".join(sorted(self.INTERVALS))))
+        self._cell_size = float(cell_size)
+        self._interval = interval
+        self._seconds = self.INTERVALS[interval]
+        # Cell columns and rows are shifted, so that every cell of the globe has a non-negative index
+        self._column_offset = int(math.ceil(180.0 / self._cell_size))
+        self._row_offset = int(math.ceil(90.0 / self._cell_size))
+        self._columns = 2 * self._column_offset + 1
+        self._cell_count = self._columns * (2 * self._row_offset + 1)
+        self._root_codes = numpy.asarray(EVENT_ROOT_CODES)
+        self._keys = numpy.empty(0, dtype=numpy.int64)
+        self._counts = numpy.empty((0, 5 + len(EVENT_ROOT_CODES)), dtype=numpy.int64)
+        self._records = 0
+        self._skipped = 0
+        self._instrumentation = instrumentation if instrumentation else gdelt_instrumentation()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __get_cell_size(self):
+        return self._cell_size
+
+    def __get_interval(self):
+        return self._interval
+
+    def __get_records(self):
+        return self._records
+
+    def __get_skipped(self):
+        return self._skipped
+
+    def __get_cells(self):
+        cell_indices = self._keys % self._cell_count
+        columns = (cell_indices % self._columns - self._column_offset).tolist()
+        rows = (cell_indices // self._columns - self._row_offset).tolist()
+        return ["{0}_{1}".format(column, row) for (column, row) in zip(columns, rows)]
+
+    def __get_centers(self):
+        cell_indices = self._keys % self._cell_count
+        x = (cell_indices % self._columns - self._column_offset + 0.5) * self._cell_size
+        y = (cell_indices // self._columns - self._row_offset + 0.5) * self._cell_size
+        return (x, y)
+
+    def __get_start_times(self):
+        return (self._keys // self._cell_count * self._seconds).astype("datetime64[s]")
+
+    def __get_end_times(self):
+        return self.start_times + numpy.timedelta64(self._seconds, "s")
+
+    def __get_counts(self):
+        return self._counts
+
+    cell_size = property(__get_cell_size)
+
+    interval = property(__get_interval)
+
+    records = property(__get_records)
+
+    skipped = property(__get_skipped)
+
+    cells = property(__get_cells)
+
+    centers = property(__get_centers)
+
+    start_times = property(__get_start_times)
+
+    end_times = property(__get_end_times)
+
+    counts = property(__get_counts)
+
+    def add_batch(self, gdelt_batch):
+        """Adds the records of an event batch or of a knowledge graph batch to the bins.
+        Events are binned by DATEADDED or by Day when DATEADDED was not queried, graph records are binned by DATE.
+        Records without a valid location or time are skipped, locations at longitude 180 or latitude 90 are added to the last column or row.
+        """
+        with self._instrumentation.measure("aggregate") as stage:
+            (x, y) = gdelt_batch.locations
+            (times, valid) = self._create_times(gdelt_batch)
+            valid &= (-180.0 <= x) & (x <= 180.0) & (-90.0 <= y) & (y <= 90.0)
+            columns = numpy.floor(numpy.where(valid, x, 0.0) / self._cell_size).astype(numpy.int64) + self._column_offset
+            rows = numpy.floor(numpy.where(valid, y, 0.0) / self._cell_size).astype(numpy.int64) + self._row_offset
+            # Locations on the eastern and the northern edge belong to the last cell, so that every center is a valid location
+            columns = numpy.minimum(columns, 2 * self._column_offset - 1)
+            rows = numpy.minimum(rows, 2 * self._row_offset - 1)
+            time_indices = times.astype(numpy.int64) // self._seconds
+            keys = (time_indices * self._cell_count + rows * self._columns + columns)[valid]
+
+            (batch_keys, inverse) = numpy.unique(keys, return_inverse=True)
+            batch_counts = numpy.zeros((len(batch_keys), self._counts.shape[1]), dtype=numpy.int64)
+            batch_counts[:, 0] = numpy.bincount(inverse, minlength=len(batch_keys))
+            field_names = [field[0] for field in gdelt_batch.fields]
+            if "QuadClass" in field_names:
+                quad_classes = gdelt_batch.column("QuadClass")[valid]
+                known = (1 <= quad_classes) & (quad_classes <= 4)
+                numpy.add.at(batch_counts, (inverse[known], quad_classes[known]), 1)
+            if "EventRootCode" in field_names:
+                root_codes = numpy.asarray(gdelt_batch.column("EventRootCode")[valid], dtype=numpy.str_)
+                code_indices = numpy.searchsorted(self._root_codes, root_codes)
+                known = code_indices < len(EVENT_ROOT_CODES)
+                known[known] = self._root_codes[code_indices[known]] == root_codes[known]
+                numpy.add.at(batch_counts, (inverse[known], 5 + code_indices[known]), 1)
+            self._merge(batch_keys, batch_counts)
+
+            added = len(keys)
+            self._records += added
+            self._skipped += len(gdelt_batch) - added
+            stage.rows_in = len(gdelt_batch)
+            stage.rows_out = added
+        return added
+
+    def add_batches(self, gdelt_batches):
+        """Adds all batches and returns the number of added records.
+        """
+        return sum(self.add_batch(gdelt_batch) for gdelt_batch in gdelt_batches)
+
+    def _create_times(self, gdelt_batch):
+        """Returns the datetime64 values used for binning and a mask of the valid values.
+        """
+        field_names = [field[0] for field in gdelt_batch.fields]
+        if "DATEADDED" in field_names:
+            return convert_timestamps(gdelt_batch.column("DATEADDED").astype(numpy.int64))
+        if "DATE" in field_names:
+            times = gdelt_batch.column("DATE").astype("datetime64[s]")
+            return (times, ~numpy.isnat(times))
+        if "Day" in field_names:
+            return convert_timestamps(gdelt_batch.column("Day") * 1000000)
+        raise ValueError("The batch has no DATEADDED, DATE or Day field!")
+
+    def _merge(self, keys, counts):
+        """Merges the sorted keys and counts of a batch into the bins.
+        """
+        if 0 == len(self._keys):
+            self._keys = keys
+            self._counts = counts
+            return
+        merged_keys = numpy.union1d(self._keys, keys)
+        merged_counts = numpy.zeros((len(merged_keys), self._counts.shape[1]), dtype=numpy.int64)
+        merged_counts[numpy.searchsorted(merged_keys, self._keys)] += self._counts
+        merged_counts[numpy.searchsorted(merged_keys, keys)] += counts
+        self._keys = merged_keys
+        self._counts = merged_counts
@@ -0,0 +1,209 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+import math
+import numpy
+from geoint.gdelt_batch import gdelt_graph_batch
+from geoint.gdelt_instrumentation import gdelt_instrumentation
+
+class exact_key_filter(object):
+    """Remembers every key in a hash set.
+    No record is dropped by mistake, but the memory grows with the number of distinct keys.
+    """
+
+    def __init__(self, keys=None):
+        # The set of existing keys is shared and updated
+        self._keys = keys if keys is not None else set()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __get_statistics(self):
+        return { "filter": type(self).__name__, "keys": len(self._keys), "error_rate": 0.0 }
+
+    statistics = property(__get_statistics)
+
+    def add(self, keys):
+        """Adds the keys and returns a list telling which keys were not seen before.
+        Repeated keys of the same list are only new on their first occurrence.
+        """
+        seen_keys = self._keys
+        new_keys = []
+        for key in keys:
+            if key in seen_keys:
+                new_keys.append(False)
+            else:
+                seen_keys.add(key)
+                new_keys.append(True)
+        return new_keys
+
+
+
+class bloom_key_filter(object):
+    """Remembers the keys in a Bloom filter having a fixed number of bits.
+    The bits are sized for the expected number of keys, so that a new key is taken for a duplicate with the error rate.
+    More keys than the capacity do not need more memory, but increase the error rate.
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        if capacity < 1:
+            raise ValueError("The capacity must be positive!")
+        if error_rate <= 0 or 1 <= error_rate:
+            raise ValueError("The error rate must be between 0 and 1!")
+        self._capacity = int(capacity)
+        self._error_rate = float(error_rate)
+        self._bit_count = max(8, int(math.ceil(-self._capacity * math.log(self._error_rate) / (math.log(2) ** 2))))
+        self._hash_count = max(1, int(round(self._bit_count / self._capacity * math.log(2))))
+        self._bits = numpy.zeros((self._bit_count + 7) // 8, dtype=numpy.uint8)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __get_statistics(self):
+        return {
+            "filter": type(self).__name__,
+            "keys": self._count,
+            "capacity": self._capacity,
+            "error_rate": self._error_rate,
+            "bytes": self._bits.nbytes,
+            "hashes": self._hash_count
+        }
+
+    statistics = property(__get_statistics)
+
+    def add(self, keys):
+        """Adds the keys and returns a list telling which keys were not seen before.
+        Integer keys are hashed vectorized, all other keys like tuples are hashed by Python.
+        """
+        if isinstance(keys, numpy.ndarray) and numpy.issubdtype(keys.dtype, numpy.integer):
+            hashes = keys.astype(numpy.int64).view(numpy.uint64)
+        else:
+            hashes = numpy.fromiter((hash(key) for key in keys), dtype=numpy.int64, count=len(keys)).view(numpy.uint64)
+        # Repeated keys of the same list are only new on their first occurrence
+        first_occurrences = numpy.zeros(len(hashes), dtype=bool)
+        first_occurrences[numpy.unique(hashes, return_index=True)[1]] = True
+        positions = self._create_positions(hashes)
+        contained = numpy.ones(len(hashes), dtype=bool)
+        for hash_positions in positions:
+            contained &= (self._bits[hash_positions >> 3] & (1 << (hash_positions & 7)).astype(numpy.uint8)) != 0
+        new_keys = first_occurrences & ~contained
+        for hash_positions in positions:
+            hash_positions = hash_positions[new_keys]
+            numpy.bitwise_or.at(self._bits, hash_positions >> 3, (1 << (hash_positions & 7)).astype(numpy.uint8))
+        self._count += int(numpy.count_nonzero(new_keys))
+        return new_keys.tolist()
+
+    def _create_positions(self, hashes):
+        """Derives the bit positions of every hash function by double hashing.
+        """
+        with numpy.errstate(over="ignore"):
+            first = self._mix(hashes)
+            second = self._mix(first ^ numpy.uint64(0x5851F42D4C957F2D)) | numpy.uint64(1)
+            bit_count = numpy.uint64(self._bit_count)
+            return [((first + numpy.uint64(index) * second) % bit_count).astype(numpy.int64) for index in range(self._hash_count)]
+
+    def _mix(self, values):
+        """Scrambles the bits of 64-bit values using the SplitMix64 finalizer.
+        """
+        values = values + numpy.uint64(0x9E3779B97F4A7C15)
+        values = (values ^ (values >> numpy.uint64(30))) * numpy.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> numpy.uint64(27))) * numpy.uint64(0x94D049BB133111EB)
+        return values ^ (values >> numpy.uint64(31))
+
+
+
+class gdelt_deduplicator(object):
+    """Removes duplicated records from a stream of GDELT batches or records.
+    Events are keyed on their GlobalEventId and knowledge graph locations on their GKGRECORDID and Location_FeatureID.
+    By default every key is remembered exactly, a Bloom filter bounds the memory of long ingests.
+    """
+
+    def __init__(self, key_filter=None, instrumentation=None):
+        self._key_filter = key_filter if key_filter is not None else exact_key_filter()
+        self._instrumentation = instrumentation if instrumentation else gdelt_instrumentation()
+        self._records = 0
+        self._duplicates = 0
+
+    def __get_key_filter(self):
+        return self._key_filter
+
+    def __get_statistics(self):
+        statistics = dict(self._key_filter.statistics)
+        statistics["records"] = self._records
+        statistics["duplicates"] = self._duplicates
+        return statistics
+
+    key_filter = property(__get_key_filter)
+
+    statistics = property(__get_statistics)
+
+    def deduplicate_batches(self, gdelt_batches):
+        """Returns an iterator over the batches containing only records not seen before.
+        """
+        for gdelt_batch in gdelt_batches:
+            with self._instrumentation.measure("deduplicate") as stage:
+                new_records = numpy.asarray(self._key_filter.add(self._create_keys(gdelt_batch)), dtype=bool)
+                if not new_records.all():
+                    gdelt_batch = gdelt_batch.select(new_records)
+                stage.rows_in = len(new_records)
+                stage.rows_out = len(gdelt_batch)
+                self._count(stage.rows_in, stage.rows_out)
+            yield gdelt_batch
+
+    def deduplicate(self, records, key_of, chunk_size=10000):
+        """Returns an iterator over the records not seen before.
+        The key of every record is returned by key_of and the records are tested chunk by chunk.
+        """
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if chunk_size <= len(chunk):
+                for new_record in self._deduplicate_chunk(chunk, key_of):
+                    yield new_record
+                chunk = []
+        for new_record in self._deduplicate_chunk(chunk, key_of):
+            yield new_record
+
+    def _deduplicate_chunk(self, chunk, key_of):
+        if not chunk:
+            return []
+        with self._instrumentation.measure("deduplicate") as stage:
+            new_records = [record for (record, new_record) in zip(chunk, self._key_filter.add([key_of(record) for record in chunk])) if new_record]
+            stage.rows_in = len(chunk)
+            stage.rows_out = len(new_records)
+            self._count(stage.rows_in, stage.rows_out)
+        return new_records
+
+    def _create_keys(self, gdelt_batch):
+        if isinstance(gdelt_batch, gdelt_graph_batch):
+            return list(zip(gdelt_batch.column("GKGRECORDID").tolist(), gdelt_batch.column("Location_FeatureID").tolist()))
+        if isinstance(self._key_filter, bloom_key_filter):
+            return gdelt_batch.ids
+        return gdelt_batch.ids.tolist()
+
+    def _count(self, rows_in, rows_out):
+        self._records += rows_in
+        self._duplicates += rows_in - rows_out
@@ -23,20 +23,215 @@
 # See <https://developers.arcgis.com/> for further information.
 #
 
-import arcpy
+import itertools
+import numpy
+import pickle
+import struct
+from geoint.gdelt_batch import column_to_list
+from geoint.gdelt_instrumentation import gdelt_instrumentation
+
+class xy_point_backend(object):
+    """Creates the points as (x, y) tuples for the SHAPE@XY token of arcpy cursors.
+    """
+
+    def create_points(self, x, y):
+        return list(zip(x.tolist(), y.tolist()))
+
+
+
+class geopackage_point_backend(object):
+    """Creates the points as GeoPackage binary geometries, which the GeoPackage writer inserts as they are.
+    The geometries of all points are assembled in one NumPy buffer.
+    """
+
+    def __init__(self, spatial_reference=4326):
+        self._spatial_reference = spatial_reference
+
+    def create_points(self, x, y):
+        count = len(x)
+        blobs = numpy.empty((count, 29), dtype=numpy.uint8)
+        # GeoPackage binary header having no envelope followed by a little endian WKB point
+        blobs[:, :8] = numpy.frombuffer(struct.pack("<2sBBi", b"GP", 0, 1, self._spatial_reference), dtype=numpy.uint8)
+        blobs[:, 8:13] = numpy.frombuffer(struct.pack("<BI", 1, 1), dtype=numpy.uint8)
+        blobs[:, 13:21] = numpy.ascontiguousarray(x, dtype="<f8").view(numpy.uint8).reshape(count, 8)
+        blobs[:, 21:29] = numpy.ascontiguousarray(y, dtype="<f8").view(numpy.uint8).reshape(count, 8)
+        data = blobs.tobytes()
+        return [data[offset:offset + 29] for offset in range(0, len(data), 29)]
+
+
+
+class arcpy_point_backend(object):
+    """Creates the points as arcpy points.
+    The backend holds the arcpy module and cannot be passed to other processes.
+    """
+
+    def __init__(self):
+        import arcpy
+        self._arcpy = arcpy
+
+    def create_points(self, x, y):
+        point = self._arcpy.Point
+        return [point(point_x, point_y) for (point_x, point_y) in zip(x.tolist(), y.tolist())]
+
+
+
+class gdelt_feature_columns(object):
+    """Represents the features of a batch as coordinate arrays, points and attribute column arrays having NULL masks.
+    Iterating returns every feature as a tuple of its point and its attribute values, like the bulk writers expect.
+    The column arrays are only converted into native values chunk by chunk while iterating.
+    """
+
+    ITER_CHUNK_SIZE = 10000
+
+    def __init__(self, x, y, points, columns, null_masks=None):
+        self.__x = x
+        self.__y = y
+        self.__points = points
+        self.__columns = columns
+        self.__null_masks = null_masks if null_masks else {}
+
+    def __len__(self):
+        return len(self.__points)
+
+    def __iter__(self):
+        for start in range(0, len(self), self.ITER_CHUNK_SIZE):
+            stop = start + self.ITER_CHUNK_SIZE
+            column_lists = [column_to_list(column[start:stop], self.__null_masks[index][start:stop] if index in self.__null_masks else None) for (index, column) in enumerate(self.__columns)]
+            for feature in zip(self.__points[start:stop], *column_lists):
+                yield feature
+
+    def __get_x(self):
+        return self.__x
+
+    def __get_y(self):
+        return self.__y
+
+    def __get_points(self):
+        return self.__points
+
+    def __get_columns(self):
+        return self.__columns
+
+    def __get_null_masks(self):
+        return self.__null_masks
+
+    x = property(__get_x)
+
+    y = property(__get_y)
+
+    points = property(__get_points)
+
+    columns = property(__get_columns)
+
+    null_masks = property(__get_null_masks)
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Concatenates the features of several parts having the same columns.
+        """
+        x = numpy.concatenate([part.x for part in parts])
+        y = numpy.concatenate([part.y for part in parts])
+        points = [point for part in parts for point in part.points]
+        columns = [numpy.concatenate([part.columns[index] for part in parts]) for index in range(len(parts[0].columns))]
+        null_masks = {}
+        for index in set(index for part in parts for index in part.null_masks):
+            null_masks[index] = numpy.concatenate([part.null_masks[index] if index in part.null_masks else numpy.zeros(len(part), dtype=bool) for part in parts])
+        return cls(x, y, points, columns, null_masks)
+
+    def select(self, mask):
+        """Returns the features selected by the boolean mask.
+        """
+        indices = numpy.flatnonzero(mask).tolist()
+        points = [self.__points[index] for index in indices]
+        columns = [column[mask] for column in self.__columns]
+        null_masks = {index: nulls[mask] for (index, nulls) in self.__null_masks.items()}
+        return type(self)(self.__x[mask], self.__y[mask], points, columns, null_masks)
+
+
+
+def create_feature_columns(gdelt_batch, point_backend):
+    """Creates the features of a batch using a point backend.
+    This function runs in the worker processes of the feature factory.
+    """
+    (x, y) = gdelt_batch.locations
+    return gdelt_feature_columns(x, y, point_backend.create_points(x, y), gdelt_batch.columns, gdelt_batch.null_masks)
+
+
 
 class gdelt_feature_factory(object):
     """Creates features using GDELT event records.
+    Batches of records are converted into feature columns using a point backend, large batches can be split across a process pool.
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, instrumentation=None, point_backend=None, executor=None, chunk_size=100000):
+        self._instrumentation = instrumentation if instrumentation else gdelt_instrumentation()
+        self._point_backend = point_backend if point_backend else xy_point_backend()
+        self._executor = executor
+        self._chunk_size = chunk_size
+        self._picklable = None
+
+    def __get_instrumentation(self):
+        return self._instrumentation
+
+    instrumentation = property(__get_instrumentation)
 
     def create_feature(self, gdelt_event):
         """Creates a feature using a GDELT event record.
         """
+        import arcpy
         location = gdelt_event.location
         feature = [arcpy.Point(location[0], location[1])]
         for value in gdelt_event.values:
             feature.append(value)
-        return feature
\ No newline at end of file
+        return feature
+
+    def create_feature_batch(self, gdelt_batch):
+        """Creates the features of a whole batch of GDELT event or graph records as feature columns.
+        Iterating the feature columns returns every feature as a tuple of its point and its values, by default the point is a (x, y) tuple for the SHAPE@XY token.
+        Batches larger than the chunk size are split across the executor when the point backend can be pickled.
+        """
+        with self._instrumentation.measure("create_features") as stage:
+            if self._executor is not None and self._chunk_size < len(gdelt_batch) and self._is_picklable():
+                chunks = [gdelt_batch.select(self._create_range_mask(len(gdelt_batch), start, start + self._chunk_size)) for start in range(0, len(gdelt_batch), self._chunk_size)]
+                feature_columns = gdelt_feature_columns.concatenate(list(self._executor.map(create_feature_columns, chunks, itertools.repeat(self._point_backend))))
+            else:
+                feature_columns = create_feature_columns(gdelt_batch, self._point_backend)
+            stage.rows_in = len(gdelt_batch)
+            stage.rows_out = len(feature_columns)
+        return feature_columns
+
+    def create_bin_features(self, gdelt_bins):
+        """Creates the features of aggregated grid cells.
+        The location of every feature is the (x, y) tuple of the cell center for the SHAPE@XY token.
+        """
+        with self._instrumentation.measure("create_features") as stage:
+            features = [(gdelt_bin.location,) + tuple(gdelt_bin.values) for gdelt_bin in gdelt_bins]
+            stage.rows_in = len(gdelt_bins)
+            stage.rows_out = len(features)
+        return features
+
+    def create_cube_features(self, cube):
+        """Creates the features of the space-time bins of a cube.
+        The location of every feature is the (x, y) tuple of the cell center for the SHAPE@XY token.
+        """
+        with self._instrumentation.measure("create_features") as stage:
+            (x, y) = cube.centers
+            locations = zip(x.tolist(), y.tolist())
+            features = [(location, cell, start_time, end_time) + tuple(counts) for (location, cell, start_time, end_time, counts) in zip(locations, cube.cells, cube.start_times.tolist(), cube.end_times.tolist(), cube.counts.tolist())]
+            stage.rows_in = len(cube)
+            stage.rows_out = len(features)
+        return features
+
+    def _is_picklable(self):
+        if self._picklable is None:
+            try:
+                pickle.dumps(self._point_backend)
+                self._picklable = True
+            except Exception:
+                self._picklable = False
+        return self._picklable
+
+    def _create_range_mask(self, count, start, stop):
+        mask = numpy.zeros(count, dtype=bool)
+        mask[start:stop] = True
+        return mask
\ No newline at end of file
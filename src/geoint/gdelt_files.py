@@ -0,0 +1,350 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+import datetime
+import itertools
+import mmap
+import os
+import re
+import zipfile
+from geoint.gdelt_batch import gdelt_event_batch, gdelt_graph_batch
+from geoint.gdelt_client import gdelt_client, gdelt_graph_entry
+from geoint.gdelt_grid import gdelt_grid
+from geoint.gdelt_schema import create_event_columns, create_event_fields, create_graph_columns
+
+EXPORT_FILE_PATTERN = re.compile(r"^(\d{8})\d{6}\.export\.csv(\.zip)?$", re.IGNORECASE)
+
+GKG_FILE_PATTERN = re.compile(r"^(\d{8})\d{6}\.gkg\.csv(\.zip)?$", re.IGNORECASE)
+
+# The event columns being aggregated into the cells of a grid
+BINS_COLUMNS = ["ActionGeo_Lat", "ActionGeo_Long", "AvgTone", "GoldsteinScale", "QuadClass"]
+
+def iter_file_lines(path):
+    """Reads the lines of a plain or zipped GDELT file without the line endings.
+    A plain file is memory-mapped and the lines are sliced from the mapping, the members of a zip file are inflated while reading.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member_name in archive.namelist():
+                with archive.open(member_name) as member:
+                    for line in member:
+                        yield line.rstrip(b"\r\n")
+        return
+
+    if 0 == os.path.getsize(path):
+        return
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = 0
+            size = len(mapped)
+            while start < size:
+                end = mapped.find(b"\n", start)
+                if end < 0:
+                    end = size
+                yield mapped[start:end].rstrip(b"\r")
+                start = end + 1
+
+def _create_converters(types):
+    converters = []
+    for field_type in types:
+        if "LONG" == field_type:
+            converters.append(int)
+        elif "DOUBLE" == field_type:
+            converters.append(float)
+        else:
+            converters.append(lambda value: value.decode("utf-8", "replace"))
+    return converters
+
+
+
+class gdelt_file_row(object):
+    """Represents a row parsed from a GDELT file.
+    The values are accessed like the rows returned by BigQuery, by index, by column name or as attribute.
+    """
+
+    __slots__ = ("__values", "__field_to_index")
+
+    def __init__(self, values, field_to_index):
+        self.__values = values
+        self.__field_to_index = field_to_index
+
+    def __iter__(self):
+        return iter(self.__values)
+
+    def __len__(self):
+        return len(self.__values)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.__values[self.__field_to_index[key]]
+        return self.__values[key]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self.__values[self.__field_to_index[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def get(self, key, default=None):
+        """Returns the value of a column or the default value when the column does not exist.
+        """
+        index = self.__field_to_index.get(key)
+        if index is None:
+            return default
+        return self.__values[index]
+
+    def values(self):
+        """Returns the values of this row as a tuple.
+        """
+        return self.__values
+
+
+
+class gdelt_file_client(gdelt_client):
+    """Client for reading the GDELT 2.0 export and knowledge graph files of a local directory.
+    The raw 15-minute files are found by their names, e.g. 20200301000000.export.CSV.zip or 20200301000000.gkg.csv, and may be zipped or not.
+    The files are parsed line by line and the date, bounding box, filter and theme predicates are applied while parsing,
+    so that the same events and graph records are returned like querying BigQuery.
+    """
+
+    def __init__(self, path, instrumentation=None, progress=None, cancellation=None):
+        super().__init__(instrumentation=instrumentation, progress=progress, cancellation=cancellation)
+        if not os.path.isdir(path):
+            raise ValueError("The GDELT file directory {0} does not exist!".format(path))
+        self._path = path
+        self._failures = 0
+        self._lines = 0
+        fields = create_event_fields()
+        types = [field[1] for field in fields]
+        # DATEADDED is an INTEGER column of the events table
+        types[59] = "LONG"
+        self._converters = _create_converters(types)
+
+    def __get_path(self):
+        return self._path
+
+    def __get_failures(self):
+        return self._failures
+
+    def __get_lines(self):
+        return self._lines
+
+    path = property(__get_path)
+
+    failures = property(__get_failures)
+
+    lines = property(__get_lines)
+
+    def iter_query_events(self, builder, page_size=10000):
+        """Reads the GDELT export files using a query builder.
+        Only the files of the dates of the builder are parsed.
+        The events are parsed page-wise and returned as an iterator.
+        """
+        field_to_index = self._create_event_projection(builder)
+        fields = builder.fields
+        # Every event is a view of the typed columns of its page
+        create_events = lambda page: list(gdelt_event_batch.from_records(page, fields).records())
+        return (gdelt_event for page in self._iter_file_pages(self._iter_event_rows(builder, field_to_index), page_size, builder.limit) for gdelt_event in self._construct(page, create_events))
+
+    def iter_query_events_batches(self, builder, page_size=10000):
+        """Reads the GDELT export files using a query builder.
+        Only the files of the dates of the builder are parsed.
+        Every parsed page is returned as a batch of typed column arrays matching the fields of the builder.
+        """
+        field_to_index = self._create_event_projection(builder)
+        fields = builder.fields
+        return (self._construct(page, lambda page: gdelt_event_batch.from_records(page, fields)) for page in self._iter_file_pages(self._iter_event_rows(builder, field_to_index), page_size, builder.limit))
+
+    def query_bins(self, builder, grid=None, page_size=10000):
+        """Reads the GDELT export files using a query builder and aggregates the events into the cells of a grid.
+        Every parsed page is aggregated into one row per cell like BigQuery does and the rows of all pages are merged.
+        The selected fields and the limit of the builder are ignored. By default the events are binned into cells of one degree.
+        """
+        if grid is None:
+            grid = gdelt_grid()
+        field_to_index = {column: index for (index, column) in enumerate(BINS_COLUMNS)}
+        rows = [0]
+        def aggregate_pages(pages):
+            for page in pages:
+                rows[0] += len(page)
+                yield grid.aggregate(page)
+        with self._instrumentation.measure("aggregate") as stage:
+            gdelt_bins = grid.merge(aggregate_pages(self._iter_file_pages(self._iter_event_rows(builder, field_to_index), page_size, None)))
+            stage.rows_in = rows[0]
+            stage.rows_out = len(gdelt_bins)
+        return gdelt_bins
+
+    def dry_run(self, builder):
+        """Returns the number of bytes the queries of a query builder would process.
+        Reading local files does not process any bytes in BigQuery.
+        """
+        return 0
+
+    def iter_query_graph(self, date, theme, limit=1000, page_size=10000, end_date=None, since=None):
+        """Reads the GDELT knowledge graph files by using a specific date and a theme or a list of themes.
+        When an end date is set, the files of all days from date to end date are parsed.
+        The themes are matched as exact tokens and the limit is the maximum number of documents over all days, like gdelt_client does.
+        The graph records are parsed page-wise and returned as an iterator.
+        """
+        rows = self._iter_graph_rows(self._create_dates(date, end_date), self._create_themes(theme), since)
+        create_records = lambda page: [record for graph_record in page for record in gdelt_graph_entry(graph_record).records]
+        return (record for page in self._iter_file_pages(rows, page_size, limit) for record in self._construct(page, create_records))
+
+    def iter_query_graph_batches(self, date, theme, limit=1000, page_size=10000, end_date=None, since=None):
+        """Reads the GDELT knowledge graph files by using a specific date and a theme or a list of themes.
+        When an end date is set, the files of all days from date to end date are parsed.
+        The themes are matched as exact tokens and the limit is the maximum number of documents over all days, like gdelt_client does.
+        Every parsed page is converted into a batch of typed column arrays having one record per location.
+        """
+        rows = self._iter_graph_rows(self._create_dates(date, end_date), self._create_themes(theme), since)
+        return (self._construct(page, gdelt_graph_batch.from_records) for page in self._iter_file_pages(rows, page_size, limit))
+
+    def _create_client(self):
+        # There is no BigQuery client to release
+        return None
+
+    def _create_event_projection(self, builder):
+        """Creates the column indices of the selected fields.
+        """
+        return {column: index for (index, column) in enumerate(builder.columns)}
+
+    def _list_files(self, pattern, dates):
+        """Lists the files matching a file name pattern in chronological order.
+        Only the files of the specified dates are listed.
+        """
+        day_keys = set(day.strftime("%Y%m%d") for day in dates)
+        paths = []
+        for (directory, directory_names, file_names) in os.walk(self._path):
+            for file_name in file_names:
+                match = pattern.match(file_name)
+                if match and match.group(1) in day_keys:
+                    paths.append((file_name, os.path.join(directory, file_name)))
+        return [path for (file_name, path) in sorted(paths)]
+
+    def _iter_file_pages(self, rows, page_size, limit):
+        """Collects the parsed rows into pages and measures the fetch stage.
+        The limit is applied over all files unless it is None.
+        """
+        remaining = limit
+        while remaining is None or 0 < remaining:
+            self._check_cancelled()
+            # The fetch stage includes reading and filtering the lines
+            with self._instrumentation.measure("fetch") as stage:
+                lines = self._lines
+                size = page_size if remaining is None else min(page_size, remaining)
+                page = list(itertools.islice(rows, size))
+                stage.rows_in = self._lines - lines
+                stage.rows_out = len(page)
+            if not page:
+                return
+            if remaining is not None:
+                remaining -= len(page)
+            self._report_fetched(len(page))
+            yield page
+
+    def _iter_event_rows(self, builder, field_to_index):
+        """Parses the lines of the GDELT export files and yields the matching events.
+        The date and the location are tested before the remaining columns are converted.
+        """
+        dates = builder.dates
+        day_keys = set(day.strftime("%Y%m%d").encode("ascii") for day in dates)
+        bboxes = builder.bboxes
+        column_count = len(self._converters)
+        converters = self._converters
+        event_columns = create_event_columns()
+        field_indices = [event_columns.index(column) for column in sorted(field_to_index, key=field_to_index.get)]
+        for path in self._list_files(EXPORT_FILE_PATTERN, dates):
+            for line in iter_file_lines(path):
+                self._lines += 1
+                if not line:
+                    continue
+                parts = line.split(b"\t")
+                if column_count != len(parts):
+                    self._failures += 1
+                    continue
+                # Events are partitioned by the day they were added
+                if parts[59][:8] not in day_keys:
+                    continue
+                if not parts[56] or not parts[57]:
+                    continue
+                try:
+                    latitude = float(parts[56])
+                    longitude = float(parts[57])
+                except ValueError:
+                    self._failures += 1
+                    continue
+                if bboxes and not any(bbox["xmin"] <= longitude <= bbox["xmax"] and bbox["ymin"] <= latitude <= bbox["ymax"] for bbox in bboxes):
+                    continue
+                try:
+                    values = [converter(part) if part else None for (converter, part) in zip(converters, parts)]
+                except ValueError:
+                    self._failures += 1
+                    continue
+                if not builder.matches(values):
+                    continue
+                yield gdelt_file_row(tuple(values[index] for index in field_indices), field_to_index)
+
+    def _iter_graph_rows(self, dates, themes, since=None):
+        """Parses the lines of the GDELT knowledge graph files and yields the documents matching any theme.
+        Lines not containing any theme at all are skipped before they are split into columns.
+        The themes are matched as exact tokens of V2Themes and the matched themes are appended to every document.
+        """
+        day_keys = set(day.strftime("%Y%m%d").encode("ascii") for day in dates)
+        theme_keys = [theme.encode("utf-8") for theme in themes]
+        if since is not None:
+            if isinstance(since, datetime.datetime):
+                since = since.strftime("%Y%m%d%H%M%S")
+            since = int(since)
+        field_to_index = {column: index for (index, column) in enumerate(create_graph_columns())}
+        decode = lambda value: value.decode("utf-8", "replace") if value else None
+        for path in self._list_files(GKG_FILE_PATTERN, dates):
+            for line in iter_file_lines(path):
+                self._lines += 1
+                if not line or not any(theme_key in line for theme_key in theme_keys):
+                    continue
+                parts = line.split(b"\t")
+                if len(parts) < 11:
+                    self._failures += 1
+                    continue
+                # V2Locations
+                if not parts[10]:
+                    continue
+                if parts[1][:8] not in day_keys:
+                    continue
+                try:
+                    date = int(parts[1])
+                except ValueError:
+                    self._failures += 1
+                    continue
+                if since is not None and date < since:
+                    continue
+                # Every V2Themes token is a theme followed by its character offset
+                tokens = set(token.split(b",", 1)[0] for token in parts[8].split(b";"))
+                matched_themes = [theme for (theme, theme_key) in zip(themes, theme_keys) if theme_key in tokens]
+                if not matched_themes:
+                    continue
+                yield gdelt_file_row((decode(parts[0]), decode(parts[10]), date, decode(parts[3]), decode(parts[4]), ";".join(matched_themes)), field_to_index)
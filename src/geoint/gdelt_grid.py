@@ -0,0 +1,274 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+import math
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+class gdelt_bin(object):
+    """Represents a grid cell aggregating GDELT events.
+    The location is the center of the cell and the values are ordered like the fields of a GDELT bins feature class.
+    """
+
+    __slots__ = ("__id", "__location", "__values")
+
+    def __init__(self, cell, location, values):
+        self.__id = cell
+        self.__location = location
+        self.__values = values
+
+    def __get_id(self):
+        return self.__id
+
+    def __get_location(self):
+        return self.__location
+
+    def __get_values(self):
+        return self.__values
+
+    id = property(__get_id)
+
+    location = property(__get_location)
+
+    values = property(__get_values)
+
+
+
+class gdelt_grid(object):
+    """Bins GDELT events into the cells of a fixed-degree grid or into geohash cells.
+    The events are aggregated by BigQuery, so that only one row per cell and day is transferred.
+    Every row contains sums instead of averages, so that the rows of several days can be merged.
+    """
+
+    COLUMNS = [
+        "cell", "event_count",
+        "tone_count", "tone_sum",
+        "goldstein_count", "goldstein_sum", "goldstein_square_sum", "goldstein_min", "goldstein_max",
+        "quad_class_1", "quad_class_2", "quad_class_3", "quad_class_4"
+    ]
+
+    def __init__(self, cell_size=1.0, geohash_precision=None):
+        if geohash_precision is None:
+            if cell_size is None or cell_size <= 0 or 180 < cell_size:
+                raise ValueError("The cell size must be greater than 0 and not greater than 180 degrees!")
+            cell_size = float(cell_size)
+        else:
+            if geohash_precision < 1 or 12 < geohash_precision:
+                raise ValueError("The geohash precision must be between 1 and 12!")
+            cell_size = None
+            geohash_precision = int(geohash_precision)
+        self._cell_size = cell_size
+        self._geohash_precision = geohash_precision
+        if cell_size is not None:
+            self._last_column = int(math.ceil(180.0 / cell_size)) - 1
+            self._last_row = int(math.ceil(90.0 / cell_size)) - 1
+
+    def __get_cell_size(self):
+        return self._cell_size
+
+    def __get_geohash_precision(self):
+        return self._geohash_precision
+
+    def __get_name(self):
+        if self._geohash_precision is None:
+            return "degrees:{0}".format(self._cell_size)
+        return "geohash:{0}".format(self._geohash_precision)
+
+    cell_size = property(__get_cell_size)
+
+    geohash_precision = property(__get_geohash_precision)
+
+    name = property(__get_name)
+
+    def create_projection(self):
+        """Creates the aggregating projection of a query grouped by cell.
+        """
+        if self._geohash_precision is None:
+            # Locations on the eastern and the northern edge belong to the last column and row
+            cell = "FORMAT('%d_%d', LEAST(CAST(FLOOR(ActionGeo_Long / {0}) AS INT64), {1}), LEAST(CAST(FLOOR(ActionGeo_Lat / {0}) AS INT64), {2}))".format(self._cell_size, self._last_column, self._last_row)
+        else:
+            cell = "ST_GEOHASH(ST_GEOGPOINT(ActionGeo_Long, ActionGeo_Lat), {0})".format(self._geohash_precision)
+        aggregates = [
+            "{0} AS cell".format(cell),
+            "COUNT(*) AS event_count",
+            "COUNT(AvgTone) AS tone_count",
+            "SUM(AvgTone) AS tone_sum",
+            "COUNT(GoldsteinScale) AS goldstein_count",
+            "SUM(GoldsteinScale) AS goldstein_sum",
+            "SUM(GoldsteinScale * GoldsteinScale) AS goldstein_square_sum",
+            "MIN(GoldsteinScale) AS goldstein_min",
+            "MAX(GoldsteinScale) AS goldstein_max"
+        ]
+        aggregates += ["COUNTIF(QuadClass = {0}) AS quad_class_{0}".format(quad_class) for quad_class in range(1, 5)]
+        return ", ".join(aggregates)
+
+    def locate(self, x, y):
+        """Returns the cell containing a location like BigQuery does.
+        Locations at longitude 180 or latitude 90 are located in the last column or row.
+        """
+        if self._geohash_precision is None:
+            return "{0}_{1}".format(min(int(math.floor(x / self._cell_size)), self._last_column), min(int(math.floor(y / self._cell_size)), self._last_row))
+        return encode_geohash(x, y, self._geohash_precision)
+
+    def center(self, cell):
+        """Returns the center of a cell as (x, y).
+        Cells beyond the last column or row, e.g. of cached results, are centered in the last column or row.
+        """
+        if self._geohash_precision is None:
+            (column, row) = cell.split("_")
+            return ((min(int(column), self._last_column) + 0.5) * self._cell_size, (min(int(row), self._last_row) + 0.5) * self._cell_size)
+        (xmin, ymin, xmax, ymax) = decode_geohash(cell)
+        return ((xmin + xmax) / 2.0, (ymin + ymax) / 2.0)
+
+    def aggregate(self, records):
+        """Aggregates event records into one row per cell like the aggregating query of BigQuery.
+        The records are accessed by column name and the rows are dictionaries keyed by the grid columns.
+        """
+        cells = {}
+        for record in records:
+            cell = self.locate(record["ActionGeo_Long"], record["ActionGeo_Lat"])
+            values = cells.get(cell)
+            if values is None:
+                values = cells[cell] = [cell, 0, 0, None, 0, None, None, None, None, 0, 0, 0, 0]
+            values[1] += 1
+            tone = record["AvgTone"]
+            if tone is not None:
+                values[2] += 1
+                values[3] = self._add(values[3], tone)
+            goldstein = record["GoldsteinScale"]
+            if goldstein is not None:
+                values[4] += 1
+                values[5] = self._add(values[5], goldstein)
+                values[6] = self._add(values[6], goldstein * goldstein)
+                values[7] = self._extreme(min, values[7], goldstein)
+                values[8] = self._extreme(max, values[8], goldstein)
+            quad_class = record["QuadClass"]
+            if quad_class in (1, 2, 3, 4):
+                values[8 + quad_class] += 1
+        return [dict(zip(self.COLUMNS, values)) for values in cells.values()]
+
+    def merge(self, pages):
+        """Merges the aggregated rows of all pages by cell.
+        Returns the list of bins ordered by cell.
+        """
+        cells = {}
+        for page in pages:
+            for record in page:
+                values = [record[column] for column in self.COLUMNS[1:]]
+                merged_values = cells.get(record["cell"])
+                if merged_values is None:
+                    cells[record["cell"]] = values
+                    continue
+                for index in [0, 1, 2, 3, 4, 5, 8, 9, 10, 11]:
+                    merged_values[index] = self._add(merged_values[index], values[index])
+                merged_values[6] = self._extreme(min, merged_values[6], values[6])
+                merged_values[7] = self._extreme(max, merged_values[7], values[7])
+        return [self._create_bin(cell, cells[cell]) for cell in sorted(cells)]
+
+    def _create_bin(self, cell, values):
+        (event_count, tone_count, tone_sum, goldstein_count, goldstein_sum, goldstein_square_sum, goldstein_min, goldstein_max) = values[:8]
+        avg_tone = tone_sum / tone_count if tone_count else None
+        goldstein_mean = None
+        goldstein_stddev = None
+        if goldstein_count:
+            goldstein_mean = goldstein_sum / goldstein_count
+            goldstein_stddev = math.sqrt(max(0.0, goldstein_square_sum / goldstein_count - goldstein_mean * goldstein_mean))
+        bin_values = (cell, event_count, avg_tone, goldstein_mean, goldstein_stddev, goldstein_min, goldstein_max) + tuple(values[8:])
+        return gdelt_bin(cell, self.center(cell), bin_values)
+
+    def _add(self, value, other_value):
+        if value is None:
+            return other_value
+        if other_value is None:
+            return value
+        return value + other_value
+
+    def _extreme(self, function, value, other_value):
+        if value is None:
+            return other_value
+        if other_value is None:
+            return value
+        return function(value, other_value)
+
+
+
+def encode_geohash(x, y, precision):
+    """Encodes a location as geohash having the specified number of characters.
+    """
+    (xmin, xmax) = (-180.0, 180.0)
+    (ymin, ymax) = (-90.0, 90.0)
+    characters = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(characters) < precision:
+        if even:
+            middle = (xmin + xmax) / 2.0
+            if middle <= x:
+                bits = (bits << 1) | 1
+                xmin = middle
+            else:
+                bits = bits << 1
+                xmax = middle
+        else:
+            middle = (ymin + ymax) / 2.0
+            if middle <= y:
+                bits = (bits << 1) | 1
+                ymin = middle
+            else:
+                bits = bits << 1
+                ymax = middle
+        even = not even
+        bit_count += 1
+        if 5 == bit_count:
+            characters.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(characters)
+
+def decode_geohash(geohash):
+    """Decodes a geohash into its cell as (xmin, ymin, xmax, ymax).
+    """
+    (xmin, xmax) = (-180.0, 180.0)
+    (ymin, ymax) = (-90.0, 90.0)
+    even = True
+    for character in geohash:
+        bits = GEOHASH_ALPHABET.index(character)
+        for shift in range(4, -1, -1):
+            bit = (bits >> shift) & 1
+            if even:
+                middle = (xmin + xmax) / 2.0
+                if bit:
+                    xmin = middle
+                else:
+                    xmax = middle
+            else:
+                middle = (ymin + ymax) / 2.0
+                if bit:
+                    ymin = middle
+                else:
+                    ymax = middle
+            even = not even
+    return (xmin, ymin, xmax, ymax)
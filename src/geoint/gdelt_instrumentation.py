@@ -0,0 +1,177 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+import json
+import threading
+import time
+
+class gdelt_stage(object):
+    """Measures the wall time and the rows of one run of a pipeline stage.
+    The time of nested stages is not accounted to this stage.
+    """
+
+    def __init__(self, instrumentation, name):
+        self._instrumentation = instrumentation
+        self.name = name
+        self.rows_in = 0
+        self.rows_out = 0
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self._instrumentation._enter(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._instrumentation._exit(self)
+        return False
+
+
+
+class gdelt_instrumentation(object):
+    """Records the wall time, the rows in and the rows out of every pipeline stage and the statistics of the BigQuery jobs.
+    Every recorded stage run and job is passed to the callbacks and appended to the JSON log file as one line.
+    Stages running concurrently in several threads accumulate their time.
+    """
+
+    def __init__(self, callback=None, log_path=None):
+        self._callbacks = [callback] if callback else []
+        self._log_path = log_path
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._stages = {}
+        self._jobs = []
+
+    def __get_stages(self):
+        with self._lock:
+            return {name: dict(stage) for (name, stage) in self._stages.items()}
+
+    def __get_jobs(self):
+        with self._lock:
+            return list(self._jobs)
+
+    stages = property(__get_stages)
+
+    jobs = property(__get_jobs)
+
+    def add_callback(self, callback):
+        """Adds a callback which is called with every recorded stage run and job as dictionary.
+        """
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def measure(self, name):
+        """Returns a context manager measuring one run of a stage.
+        The rows in and rows out must be set on the returned stage.
+        """
+        return gdelt_stage(self, name)
+
+    def record_job(self, query_job):
+        """Records the statistics of a finished BigQuery job.
+        """
+        job = {
+            "type": "job",
+            "job_id": getattr(query_job, "job_id", None),
+            "bytes_processed": getattr(query_job, "total_bytes_processed", None),
+            "bytes_billed": getattr(query_job, "total_bytes_billed", None),
+            "cache_hit": getattr(query_job, "cache_hit", None),
+            "slot_millis": getattr(query_job, "slot_millis", None),
+            "seconds": None
+        }
+        started = getattr(query_job, "started", None)
+        ended = getattr(query_job, "ended", None)
+        if started and ended:
+            job["seconds"] = (ended - started).total_seconds()
+        with self._lock:
+            self._jobs.append(job)
+            self._notify(job)
+
+    def summary(self):
+        """Returns the accumulated stages and the totals of all jobs.
+        """
+        with self._lock:
+            jobs = self._jobs
+            return {
+                "type": "summary",
+                "stages": self.stages,
+                "jobs": {
+                    "count": len(jobs),
+                    "bytes_processed": sum(job["bytes_processed"] or 0 for job in jobs),
+                    "bytes_billed": sum(job["bytes_billed"] or 0 for job in jobs),
+                    "cache_hits": sum(1 for job in jobs if job["cache_hit"]),
+                    "slot_millis": sum(job["slot_millis"] or 0 for job in jobs)
+                }
+            }
+
+    def format_messages(self):
+        """Formats the summary as human readable messages.
+        """
+        summary = self.summary()
+        messages = []
+        for (name, stage) in summary["stages"].items():
+            message = "{0}: {1:.3f} seconds, {2} rows in, {3} rows out".format(name, stage["seconds"], stage["rows_in"], stage["rows_out"])
+            if stage["rows_in"] > stage["rows_out"]:
+                message += ", {0} rows dropped".format(stage["rows_in"] - stage["rows_out"])
+            messages.append(message + ".")
+        if summary["jobs"]["count"]:
+            messages.append("BigQuery: {count} jobs, {bytes_processed} bytes processed, {bytes_billed} bytes billed, {cache_hits} cache hits, {slot_millis} slot milliseconds.".format(**summary["jobs"]))
+        return messages
+
+    def close(self):
+        """Passes the summary to the callbacks and appends it to the JSON log file.
+        """
+        with self._lock:
+            self._notify(self.summary())
+
+    def _enter(self, stage):
+        stack = self._get_stack()
+        stack.append([stage, time.perf_counter(), 0.0])
+
+    def _exit(self, stage):
+        stack = self._get_stack()
+        (stage, start, nested_seconds) = stack.pop()
+        seconds = time.perf_counter() - start
+        if stack:
+            stack[-1][2] += seconds
+        stage.seconds = seconds - nested_seconds
+        with self._lock:
+            accumulated = self._stages.setdefault(stage.name, {"seconds": 0.0, "rows_in": 0, "rows_out": 0, "runs": 0})
+            accumulated["seconds"] += stage.seconds
+            accumulated["rows_in"] += stage.rows_in
+            accumulated["rows_out"] += stage.rows_out
+            accumulated["runs"] += 1
+            self._notify({"type": "stage", "name": stage.name, "seconds": stage.seconds, "rows_in": stage.rows_in, "rows_out": stage.rows_out})
+
+    def _get_stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _notify(self, event):
+        for callback in self._callbacks:
+            callback(event)
+        if self._log_path:
+            with open(self._log_path, "a") as log_file:
+                log_file.write(json.dumps(event))
+                log_file.write("\n")
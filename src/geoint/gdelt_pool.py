@@ -0,0 +1,118 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+import atexit
+import threading
+
+def create_bigquery_client(project=None):
+    """Creates a new BigQuery client using the default credentials.
+    """
+    from google.cloud import bigquery
+    return bigquery.Client(project=project)
+
+def close_bigquery_client(client):
+    """Closes the HTTP session of a BigQuery client.
+    """
+    close = getattr(client, "close", None)
+    if callable(close):
+        close()
+        return
+    # Close works with version 1.24.0
+    # We had to downgrade to version 1.22.0
+    # See https://github.com/esride-jts/geoint-toolbox/issues/2
+    http = getattr(client, "_http_internal", None)
+    if http is not None and callable(getattr(http, "close", None)):
+        http.close()
+
+
+
+class gdelt_client_pool(object):
+    """Process-wide registry of BigQuery clients.
+    Every client is created lazily for its project and reused, so that the credentials, the cached access token and the HTTP session are shared.
+    A BigQuery client can be used by several threads concurrently.
+    """
+
+    def __init__(self, factory=None):
+        self._factory = factory if factory else create_bigquery_client
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._constructions = 0
+        self._borrows = 0
+
+    def __get_statistics(self):
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "constructions": self._constructions,
+                "borrows": self._borrows
+            }
+
+    statistics = property(__get_statistics)
+
+    def get(self, project=None):
+        """Returns the shared client of a project and creates it on first use.
+        """
+        with self._lock:
+            self._borrows += 1
+            client = self._clients.get(project)
+            if client is None:
+                client = self._factory(project)
+                self._constructions += 1
+                self._clients[project] = client
+            return client
+
+    def set_factory(self, factory):
+        """Replaces the factory creating the clients and closes all existing clients.
+        Returns the previous factory.
+        """
+        self.close()
+        with self._lock:
+            previous_factory = self._factory
+            self._factory = factory if factory else create_bigquery_client
+            return previous_factory
+
+    def close(self):
+        """Closes all clients, the next borrow creates a new client.
+        """
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients = {}
+        for client in clients:
+            close_bigquery_client(client)
+
+
+
+_client_pool = None
+_client_pool_lock = threading.Lock()
+
+def get_client_pool():
+    """Returns the process-wide client pool which is closed at interpreter exit.
+    """
+    global _client_pool
+    with _client_pool_lock:
+        if _client_pool is None:
+            _client_pool = gdelt_client_pool()
+            atexit.register(_client_pool.close)
+        return _client_pool
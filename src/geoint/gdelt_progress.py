@@ -0,0 +1,120 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+import threading
+
+class gdelt_cancelled_error(Exception):
+    """Raised when a job was cancelled by its cancellation token.
+    """
+
+
+
+class gdelt_timeout_error(gdelt_cancelled_error, TimeoutError):
+    """Raised when a query job did not finish within its timeout.
+    The query job is cancelled like a cancelled job.
+    """
+
+
+
+class gdelt_cancellation_token(object):
+    """Tells the running jobs to stop.
+    The token is cancelled by calling cancel or when the optional poll function returns True, e.g. when the user cancelled the tool.
+    The token is checked between pages and batches and while waiting for BigQuery.
+    The poll function is only called by cancelled and check, worker threads read signalled instead.
+    """
+
+    def __init__(self, poll=None):
+        self._event = threading.Event()
+        self._poll = poll
+
+    def __get_cancelled(self):
+        if not self._event.is_set() and self._poll is not None and self._poll():
+            self._event.set()
+        return self._event.is_set()
+
+    def __get_signalled(self):
+        return self._event.is_set()
+
+    cancelled = property(__get_cancelled)
+
+    signalled = property(__get_signalled)
+
+    def cancel(self):
+        """Cancels all jobs using this token.
+        """
+        self._event.set()
+
+    def check(self):
+        """Raises a cancelled error when this token was cancelled.
+        """
+        if self.cancelled:
+            raise gdelt_cancelled_error("The GDELT job was cancelled!")
+
+
+
+class gdelt_progress(object):
+    """Counts the rows fetched from GDELT and the rows written into the workspace.
+    Every change is passed to the callback, which receives this progress.
+    """
+
+    def __init__(self, callback=None, total=None):
+        self._callback = callback
+        self._total = total
+        self._fetched = 0
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def __get_total(self):
+        return self._total
+
+    def __get_fetched(self):
+        return self._fetched
+
+    def __get_written(self):
+        return self._written
+
+    total = property(__get_total)
+
+    fetched = property(__get_fetched)
+
+    written = property(__get_written)
+
+    def add_fetched(self, rows):
+        """Adds the number of fetched rows and reports the progress.
+        """
+        with self._lock:
+            self._fetched += rows
+        self._report()
+
+    def add_written(self, rows):
+        """Adds the number of written rows and reports the progress.
+        """
+        with self._lock:
+            self._written += rows
+        self._report()
+
+    def _report(self):
+        if self._callback:
+            self._callback(self)
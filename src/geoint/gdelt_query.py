@@ -0,0 +1,272 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+import datetime
+import re
+from geoint.gdelt_cache import gdelt_cache
+from geoint.gdelt_schema import create_event_columns, create_event_fields
+
+class gdelt_query_builder(object):
+    """Builds the queries of the GDELT events table.
+    Only the selected fields are projected and the filters are pushed down into the WHERE clause.
+    The fields are the fields of a GDELT events feature class, so that the created feature class matches the query.
+    """
+
+    TABLE = "gdelt-bq.gdeltv2.events_partitioned"
+
+    REQUIRED_FIELDS = ["GlobalEventId", "ActionGeo_Lat", "ActionGeo_Long"]
+
+    def __init__(self, date, limit=1000, end_date=None):
+        if end_date is not None and end_date < date:
+            raise ValueError("The end date must not be before the start date!")
+        self._date = date
+        self._end_date = end_date
+        self._limit = limit
+        self._field_indices = None
+        self._bboxes = []
+        self._filters = {}
+
+    def __get_dates(self):
+        if self._end_date is None:
+            return [self._date]
+        return [self._date + datetime.timedelta(days=offset) for offset in range((self._end_date - self._date).days + 1)]
+
+    def __get_limit(self):
+        return self._limit
+
+    def __get_bboxes(self):
+        return list(self._bboxes)
+
+    def __get_fields(self):
+        fields = create_event_fields()
+        if self._field_indices is None:
+            return fields
+        return [fields[index] for index in self._field_indices]
+
+    def __get_columns(self):
+        columns = create_event_columns()
+        if self._field_indices is None:
+            return columns
+        return [columns[index] for index in self._field_indices]
+
+    dates = property(__get_dates)
+
+    limit = property(__get_limit)
+
+    bboxes = property(__get_bboxes)
+
+    fields = property(__get_fields)
+
+    columns = property(__get_columns)
+
+    def select(self, field_names):
+        """Selects the fields being queried.
+        The fields needed for the event ID and the location are always selected.
+        """
+        field_indices = {field[0]: index for (index, field) in enumerate(create_event_fields())}
+        selected_indices = set(field_indices[field_name] for field_name in self.REQUIRED_FIELDS)
+        for field_name in field_names:
+            if field_name not in field_indices:
+                raise ValueError("The field {0} is not a GDELT event field!".format(field_name))
+            selected_indices.add(field_indices[field_name])
+        # The fields keep the order of the schema
+        self._field_indices = sorted(selected_indices)
+        return self
+
+    def bbox(self, bbox):
+        """Restricts the events to a bounding box or a list of bounding boxes.
+        """
+        if isinstance(bbox, list):
+            self._bboxes.extend(bbox)
+        elif bbox:
+            self._bboxes.append(bbox)
+        return self
+
+    def cameo_codes(self, codes):
+        """Restricts the events to CAMEO event codes.
+        Every code matches all event codes starting with it, e.g. '14' matches all protests.
+        """
+        self._filters["cameo_codes"] = sorted(self._validate_codes(codes))
+        return self
+
+    def quad_classes(self, quad_classes):
+        """Restricts the events to QuadClass values.
+        """
+        self._filters["quad_classes"] = sorted(int(quad_class) for quad_class in quad_classes)
+        return self
+
+    def goldstein_range(self, minimum=None, maximum=None):
+        """Restricts the events to a range of the Goldstein scale.
+        """
+        self._filters["goldstein_range"] = [None if minimum is None else float(minimum), None if maximum is None else float(maximum)]
+        return self
+
+    def min_mentions(self, mentions):
+        """Restricts the events to a minimum number of mentions.
+        """
+        self._filters["min_mentions"] = int(mentions)
+        return self
+
+    def country_codes(self, codes):
+        """Restricts the events to the FIPS country codes of the action location.
+        """
+        self._filters["country_codes"] = sorted(self._validate_codes(codes))
+        return self
+
+    def since(self, dateadded=None, event_id=None):
+        """Restricts the events to the high-water mark of an existing feature class.
+        Events added at the same DATEADDED are queried again, because they may not be complete.
+        Only events having a greater GlobalEventId are queried.
+        """
+        if dateadded is not None:
+            self._filters["since_dateadded"] = int(dateadded)
+        if event_id is not None:
+            self._filters["since_event_id"] = int(event_id)
+        return self
+
+    def matches(self, values):
+        """Tests whether the values of an event pass the filters of this builder.
+        The values must be ordered like the columns of the GDELT events table.
+        The filters are evaluated like the WHERE clause of the built queries, the partition and the bounding boxes are not tested.
+        """
+        filters = self._filters
+        if not filters:
+            return True
+        if "cameo_codes" in filters:
+            event_code = values[26]
+            if event_code is None or not any(event_code.startswith(code) for code in filters["cameo_codes"]):
+                return False
+        if "quad_classes" in filters and values[29] not in filters["quad_classes"]:
+            return False
+        if "goldstein_range" in filters:
+            (minimum, maximum) = filters["goldstein_range"]
+            goldstein_scale = values[30]
+            if goldstein_scale is None and (minimum is not None or maximum is not None):
+                return False
+            if minimum is not None and goldstein_scale < minimum:
+                return False
+            if maximum is not None and maximum < goldstein_scale:
+                return False
+        if "min_mentions" in filters and (values[31] is None or values[31] < filters["min_mentions"]):
+            return False
+        if "country_codes" in filters and values[53] not in filters["country_codes"]:
+            return False
+        if "since_dateadded" in filters and (values[59] is None or int(values[59]) < filters["since_dateadded"]):
+            return False
+        if "since_event_id" in filters and values[0] <= filters["since_event_id"]:
+            return False
+        return True
+
+    def build(self, date=None, bbox=None):
+        """Builds the query of a single day.
+        The bounding boxes of this builder are replaced by the specified bounding box or list of bounding boxes.
+        The LIMIT clause is omitted when the limit is None.
+        """
+        if date is None:
+            date = self._date
+        if bbox is None:
+            bbox = self._bboxes
+        if self._field_indices is None:
+            projection = "*"
+        else:
+            projection = ", ".join(self.columns)
+        predicates = self._create_predicates(date, bbox)
+        query = "SELECT {0} FROM `{1}` WHERE {2}".format(projection, self.TABLE, " AND ".join(predicates))
+        if self._limit is None:
+            return query
+        return "{0} LIMIT {1}".format(query, self._limit)
+
+    def build_bins(self, grid, date=None, bbox=None):
+        """Builds the query of a single day aggregating the events into the cells of a grid.
+        The selected fields and the limit are ignored, every cell is returned as one row.
+        """
+        if date is None:
+            date = self._date
+        if bbox is None:
+            bbox = self._bboxes
+        predicates = self._create_predicates(date, bbox)
+        return "SELECT {0} FROM `{1}` WHERE {2} GROUP BY cell".format(grid.create_projection(), self.TABLE, " AND ".join(predicates))
+
+    def create_key(self, date=None, bbox=None):
+        """Creates the cache key of the query of a single day.
+        """
+        if date is None:
+            date = self._date
+        if bbox is None:
+            bbox = self._bboxes
+        columns = "*" if self._field_indices is None else self.columns
+        return gdelt_cache.create_key(self.TABLE, date, bbox=bbox if bbox else None, limit=self._limit, columns=columns, filters=self._filters)
+
+    def create_bins_key(self, grid, date=None, bbox=None):
+        """Creates the cache key of the aggregating query of a single day.
+        """
+        if date is None:
+            date = self._date
+        if bbox is None:
+            bbox = self._bboxes
+        filters = dict(self._filters, grid=grid.name)
+        return gdelt_cache.create_key(self.TABLE, date, bbox=bbox if bbox else None, columns=grid.COLUMNS, filters=filters)
+
+    def _create_predicates(self, date, bbox):
+        predicates = [
+            "DATE(_PARTITIONTIME) = '{0}'".format(date),
+            "ActionGeo_Lat IS NOT NULL",
+            "ActionGeo_Long IS NOT NULL"
+        ]
+        bboxes = bbox if isinstance(bbox, list) else [bbox]
+        bbox_predicates = ["(ActionGeo_Long >= {0} AND ActionGeo_Long <= {1} AND ActionGeo_Lat >= {2} AND ActionGeo_Lat <= {3})".format(item["xmin"], item["xmax"], item["ymin"], item["ymax"]) for item in bboxes]
+        if 1 == len(bbox_predicates):
+            predicates.append(bbox_predicates[0])
+        elif bbox_predicates:
+            predicates.append("({0})".format(" OR ".join(bbox_predicates)))
+        return predicates + self._create_filter_predicates()
+
+    def _create_filter_predicates(self):
+        predicates = []
+        if "cameo_codes" in self._filters:
+            predicates.append("({0})".format(" OR ".join("STARTS_WITH(EventCode, '{0}')".format(code) for code in self._filters["cameo_codes"])))
+        if "quad_classes" in self._filters:
+            predicates.append("QuadClass IN ({0})".format(", ".join(str(quad_class) for quad_class in self._filters["quad_classes"])))
+        if "goldstein_range" in self._filters:
+            (minimum, maximum) = self._filters["goldstein_range"]
+            if minimum is not None:
+                predicates.append("GoldsteinScale >= {0}".format(minimum))
+            if maximum is not None:
+                predicates.append("GoldsteinScale <= {0}".format(maximum))
+        if "min_mentions" in self._filters:
+            predicates.append("NumMentions >= {0}".format(self._filters["min_mentions"]))
+        if "country_codes" in self._filters:
+            predicates.append("ActionGeo_CountryCode IN ({0})".format(", ".join("'{0}'".format(code) for code in self._filters["country_codes"])))
+        if "since_dateadded" in self._filters:
+            predicates.append("DATEADDED >= {0}".format(self._filters["since_dateadded"]))
+        if "since_event_id" in self._filters:
+            predicates.append("GLOBALEVENTID > {0}".format(self._filters["since_event_id"]))
+        return predicates
+
+    def _validate_codes(self, codes):
+        for code in codes:
+            if not re.match("^[A-Za-z0-9]+$", code):
+                raise ValueError("The code {0} is not valid!".format(code))
+        return codes
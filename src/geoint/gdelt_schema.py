@@ -0,0 +1,162 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+def create_event_fields():
+    """Creates the field definitions of a GDELT events feature class.
+    The fields are ordered like the columns of the GDELT events table.
+    """
+    return [
+        ["GlobalEventId", "LONG"],
+        ["Day", "LONG"],
+        ["MonthYear", "LONG"],
+        ["Year", "LONG"],
+        ["FractionDate", "DOUBLE"],
+        ["Actor1Code", "TEXT", "Actor1Code", 255],
+        ["Actor1Name", "TEXT", "Actor1Name", 255],
+        ["Actor1CountryCode", "TEXT", "Actor1CountryCode", 255],
+        ["Actor1KnownGroupCode", "TEXT", "Actor1KnownGroupCode", 255],
+        ["Actor1EthnicCode", "TEXT", "Actor1EthnicCode", 255],
+        ["Actor1Religion1Code", "TEXT", "Actor1Religion1Code", 255],
+        ["Actor1Religion2Code", "TEXT", "Actor1Religion2Code", 255],
+        ["Actor1Type1Code", "TEXT", "Actor1Type1Code", 255],
+        ["Actor1Type2Code", "TEXT", "Actor1Type2Code", 255],
+        ["Actor1Type3Code", "TEXT", "Actor1Type3Code", 255],
+        ["Actor2Code", "TEXT", "Actor2Code", 255],
+        ["Actor2Name", "TEXT", "Actor2Name", 255],
+        ["Actor2CountryCode", "TEXT", "Actor2CountryCode", 255],
+        ["Actor2KnownGroupCode", "TEXT", "Actor2KnownGroupCode", 255],
+        ["Actor2EthnicCode", "TEXT", "Actor2EthnicCode", 255],
+        ["Actor2Religion1Code", "TEXT", "Actor2Religion1Code", 255],
+        ["Actor2Religion2Code", "TEXT", "Actor2Religion2Code", 255],
+        ["Actor2Type1Code", "TEXT", "Actor2Type1Code", 255],
+        ["Actor2Type2Code", "TEXT", "Actor2Type2Code", 255],
+        ["Actor2Type3Code", "TEXT", "Actor2Type3Code", 255],
+        ["IsRootEvent", "LONG"],
+        ["EventCode", "TEXT", "EventCode", 255],
+        ["EventBaseCode", "TEXT", "EventBaseCode", 255],
+        ["EventRootCode", "TEXT", "EventRootCode", 255],
+        ["QuadClass", "LONG"],
+        ["GoldsteinScale", "DOUBLE"],
+        ["NumMentions", "LONG"],
+        ["NumSources", "LONG"],
+        ["NumArticles", "LONG"],
+        ["AvgTone", "DOUBLE"],
+        ["Actor1Geo_Type", "LONG"],
+        ["Actor1Geo_Fullname", "TEXT", "Actor1Geo_Fullname", 1000],
+        ["Actor1Geo_CountryCode", "TEXT", "Actor1Geo_CountryCode", 255],
+        ["Actor1Geo_ADM1Code", "TEXT", "Actor1Geo_ADM1Code", 255],
+        ["Actor1Geo_ADM2Code", "TEXT", "Actor1Geo_ADM2Code", 255],
+        ["Actor1Geo_Lat", "DOUBLE"],
+        ["Actor1Geo_Long", "DOUBLE"],
+        ["Actor1Geo_FeatureID", "TEXT", "Actor1Geo_FeatureID", 255],
+        ["Actor2Geo_Type", "LONG"],
+        ["Actor2Geo_FullName", "TEXT", "Actor2Geo_FullName", 1000],
+        ["Actor2Geo_CountryCode", "TEXT", "Actor2Geo_CountryCode", 255],
+        ["Actor2Geo_ADM1Code", "TEXT", "Actor2Geo_ADM1Code", 255],
+        ["Actor2Geo_ADM2Code", "TEXT", "Actor2Geo_ADM2Code", 255],
+        ["Actor2Geo_Lat", "DOUBLE"],
+        ["Actor2Geo_Long", "DOUBLE"],
+        ["Actor2Geo_FeatureID", "TEXT", "Actor2Geo_FeatureID", 255],
+        ["ActionGeo_Type", "LONG"],
+        ["ActionGeo_FullName", "TEXT", "ActionGeo_FullName", 1000],
+        ["ActionGeo_CountryCode", "TEXT", "ActionGeo_CountryCode", 255],
+        ["ActionGeo_ADM1Code", "TEXT", "ActionGeo_ADM1Code", 255],
+        ["ActionGeo_ADM2Code", "TEXT", "ActionGeo_ADM2Code", 255],
+        ["ActionGeo_Lat", "DOUBLE"],
+        ["ActionGeo_Long", "DOUBLE"],
+        ["ActionGeo_FeatureID", "TEXT", "ActionGeo_FeatureID", 255],
+        ["DATEADDED", "TEXT", "DATEADDED", 255],
+        ["SOURCEURL", "TEXT", "SOURCEURL", 1000]
+    ]
+
+def create_event_columns():
+    """Creates the column names of the GDELT events table.
+    The columns are ordered like the fields of a GDELT events feature class.
+    """
+    columns = [field[0] for field in create_event_fields()]
+    columns[0] = "GLOBALEVENTID"
+    columns[1] = "SQLDATE"
+    columns[36] = "Actor1Geo_FullName"
+    return columns
+
+def create_graph_fields():
+    """Creates the field definitions of a GDELT knowledge graph feature class.
+    """
+    return [
+        ["GKGRECORDID", "TEXT", "GKGRECORDID", 255],
+        ["Location_Type", "LONG"],
+        ["Location_FullName", "TEXT", "Location_FullName", 1000],
+        ["Location_CountryCode", "TEXT", "Location_CountryCode", 255],
+        ["Location_ADM1Code", "TEXT", "Location_ADM1Code", 255],
+        ["Location_ADM2Code", "TEXT", "Location_ADM2Code", 255],
+        ["Location_Lat", "DOUBLE"],
+        ["Location_Long", "DOUBLE"],
+        ["Location_FeatureID", "TEXT", "Location_FeatureID", 255],
+        ["DATE", "DATE"],
+        ["SourceCommonName", "TEXT", "SourceCommonName", 255],
+        ["DocumentIdentifier", "TEXT", "DocumentIdentifier", 1000],
+        ["Themes", "TEXT", "Themes", 1000]
+    ]
+
+def create_graph_columns():
+    """Creates the column names queried from the GDELT knowledge graph table.
+    Themes contains the queried themes a document matched, delimited by semicolons.
+    """
+    return ["GKGRECORDID", "V2Locations", "DATE", "SourceCommonName", "DocumentIdentifier", "Themes"]
+
+def create_bin_fields():
+    """Creates the field definitions of a GDELT bins feature class.
+    Every feature represents a grid cell aggregating the GDELT events located in it.
+    """
+    return [
+        ["CellId", "TEXT", "CellId", 255],
+        ["EventCount", "LONG"],
+        ["AvgTone", "DOUBLE"],
+        ["GoldsteinMean", "DOUBLE"],
+        ["GoldsteinStdDev", "DOUBLE"],
+        ["GoldsteinMin", "DOUBLE"],
+        ["GoldsteinMax", "DOUBLE"],
+        ["QuadClass1", "LONG"],
+        ["QuadClass2", "LONG"],
+        ["QuadClass3", "LONG"],
+        ["QuadClass4", "LONG"]
+    ]
+
+def create_cube_fields():
+    """Creates the field definitions of a GDELT space-time bins feature class.
+    Every feature represents a grid cell during one time interval and counts the records, the QuadClass and the EventRootCode values.
+    """
+    fields = [
+        ["CellId", "TEXT", "CellId", 255],
+        ["StartTime", "DATE"],
+        ["EndTime", "DATE"],
+        ["EventCount", "LONG"],
+        ["QuadClass1", "LONG"],
+        ["QuadClass2", "LONG"],
+        ["QuadClass3", "LONG"],
+        ["QuadClass4", "LONG"]
+    ]
+    fields += [["EventRootCode{0:02d}".format(code), "LONG"] for code in range(1, 21)]
+    return fields
@@ -0,0 +1,200 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+import math
+import numpy
+
+class numpy_geometry_backend(object):
+    """Geometry backend for polygons given as lists of rings.
+    Every ring is a list of (x, y) vertices. Holes and multiple parts are evaluated using the even-odd rule.
+    """
+
+    def __init__(self, max_chunk_size=1048576):
+        self._max_chunk_size = max_chunk_size
+
+    def envelope(self, polygon):
+        """Returns the envelope of a polygon as (xmin, ymin, xmax, ymax).
+        """
+        vertices = numpy.concatenate([numpy.asarray(ring, dtype=numpy.float64) for ring in polygon])
+        return (vertices[:, 0].min(), vertices[:, 1].min(), vertices[:, 0].max(), vertices[:, 1].max())
+
+    def contains(self, polygon, x, y):
+        """Tests which points are inside the polygon.
+        The crossing test runs vectorized over all edges and points.
+        """
+        inside = numpy.zeros(len(x), dtype=bool)
+        for ring in polygon:
+            vertices = numpy.asarray(ring, dtype=numpy.float64)
+            x1 = vertices[:, 0][:, numpy.newaxis]
+            y1 = vertices[:, 1][:, numpy.newaxis]
+            x2 = numpy.roll(vertices[:, 0], 1)[:, numpy.newaxis]
+            y2 = numpy.roll(vertices[:, 1], 1)[:, numpy.newaxis]
+            chunk_size = max(1, self._max_chunk_size // len(vertices))
+            for start in range(0, len(x), chunk_size):
+                px = x[start:start + chunk_size]
+                py = y[start:start + chunk_size]
+                with numpy.errstate(divide="ignore", invalid="ignore"):
+                    straddles = (y1 > py) != (y2 > py)
+                    intersection = (x2 - x1) * (py - y1) / (y2 - y1) + x1
+                crossings = numpy.count_nonzero(straddles & (px < intersection), axis=0)
+                inside[start:start + chunk_size] ^= (crossings % 2 == 1)
+        return inside
+
+
+
+class arcpy_geometry_backend(object):
+    """Geometry backend for arcpy polygons.
+    The exact test calls disjoint for every candidate point.
+    """
+
+    def envelope(self, polygon):
+        """Returns the envelope of a polygon as (xmin, ymin, xmax, ymax).
+        """
+        extent = polygon.extent
+        return (extent.XMin, extent.YMin, extent.XMax, extent.YMax)
+
+    def contains(self, polygon, x, y):
+        """Tests which points are inside the polygon.
+        """
+        import arcpy
+        return numpy.array([not polygon.disjoint(arcpy.Point(point_x, point_y)) for (point_x, point_y) in zip(x.tolist(), y.tolist())], dtype=bool)
+
+    @staticmethod
+    def to_rings(polygon):
+        """Converts an arcpy polygon into a list of rings for the NumPy backend.
+        """
+        rings = []
+        for part in polygon:
+            ring = []
+            for point in part:
+                if point is None:
+                    # Interior rings are separated by None
+                    if ring:
+                        rings.append(ring)
+                    ring = []
+                else:
+                    ring.append((point.X, point.Y))
+            if ring:
+                rings.append(ring)
+        return rings
+
+
+
+class gdelt_aoi_index(object):
+    """Spatial index of areas of interest.
+    The envelopes of the areas are bulk-loaded into a uniform grid.
+    Points are rejected by the total extent and the envelopes before the exact point in polygon test runs.
+    """
+
+    def __init__(self, areas_of_interests, backend=None, grid_size=None):
+        self._areas = list(areas_of_interests)
+        self._backend = backend if backend else numpy_geometry_backend()
+        self._envelopes = numpy.array([self._backend.envelope(area) for area in self._areas], dtype=numpy.float64).reshape(-1, 4)
+        if grid_size is None:
+            grid_size = 2 * int(math.ceil(math.sqrt(max(1, len(self._areas)))))
+        self._grid_size = grid_size
+        self._statistics = {
+            "points": 0,
+            "extent_pruned": 0,
+            "envelope_pruned": 0,
+            "exact_tests": 0,
+            "exact_pruned": 0,
+            "accepted": 0
+        }
+        self._bulk_load()
+
+    def __get_statistics(self):
+        return dict(self._statistics)
+
+    statistics = property(__get_statistics)
+
+    def _bulk_load(self):
+        self._cells = {}
+        if 0 == len(self._areas):
+            self._extent = (0.0, 0.0, 0.0, 0.0)
+            return
+        self._extent = (self._envelopes[:, 0].min(), self._envelopes[:, 1].min(), self._envelopes[:, 2].max(), self._envelopes[:, 3].max())
+        self._cell_width = max((self._extent[2] - self._extent[0]) / self._grid_size, 1e-9)
+        self._cell_height = max((self._extent[3] - self._extent[1]) / self._grid_size, 1e-9)
+        (min_columns, min_rows) = self._cell_indices(self._envelopes[:, 0], self._envelopes[:, 1])
+        (max_columns, max_rows) = self._cell_indices(self._envelopes[:, 2], self._envelopes[:, 3])
+        cells = {}
+        for area_index in range(len(self._areas)):
+            for row in range(min_rows[area_index], max_rows[area_index] + 1):
+                for column in range(min_columns[area_index], max_columns[area_index] + 1):
+                    cells.setdefault(row * self._grid_size + column, []).append(area_index)
+        self._cells = {cell: numpy.array(area_indices) for (cell, area_indices) in cells.items()}
+
+    def _cell_indices(self, x, y):
+        columns = numpy.clip(((x - self._extent[0]) / self._cell_width).astype(numpy.int64), 0, self._grid_size - 1)
+        rows = numpy.clip(((y - self._extent[1]) / self._cell_height).astype(numpy.int64), 0, self._grid_size - 1)
+        return (columns, rows)
+
+    def contains(self, x, y):
+        """Tests which points are inside any area of interest.
+        Returns a boolean array.
+        """
+        x = numpy.asarray(x, dtype=numpy.float64)
+        y = numpy.asarray(y, dtype=numpy.float64)
+        accepted = numpy.zeros(len(x), dtype=bool)
+        self._statistics["points"] += len(x)
+        if 0 == len(self._areas):
+            self._statistics["extent_pruned"] += len(x)
+            return accepted
+
+        in_extent = (self._extent[0] <= x) & (x <= self._extent[2]) & (self._extent[1] <= y) & (y <= self._extent[3])
+        extent_indices = numpy.flatnonzero(in_extent)
+        self._statistics["extent_pruned"] += len(x) - len(extent_indices)
+
+        (columns, rows) = self._cell_indices(x[extent_indices], y[extent_indices])
+        (cells, cell_inverse) = numpy.unique(rows * self._grid_size + columns, return_inverse=True)
+        has_candidate = numpy.zeros(len(x), dtype=bool)
+        for cell_position, cell in enumerate(cells.tolist()):
+            area_indices = self._cells.get(cell)
+            if area_indices is None:
+                continue
+            cell_indices = extent_indices[cell_inverse == cell_position]
+            for area_index in area_indices.tolist():
+                point_indices = cell_indices[~accepted[cell_indices]]
+                if 0 == len(point_indices):
+                    break
+                envelope = self._envelopes[area_index]
+                px = x[point_indices]
+                py = y[point_indices]
+                in_envelope = (envelope[0] <= px) & (px <= envelope[2]) & (envelope[1] <= py) & (py <= envelope[3])
+                candidate_indices = point_indices[in_envelope]
+                if 0 == len(candidate_indices):
+                    continue
+                has_candidate[candidate_indices] = True
+                self._statistics["exact_tests"] += len(candidate_indices)
+                inside = self._backend.contains(self._areas[area_index], x[candidate_indices], y[candidate_indices])
+                accepted[candidate_indices[inside]] = True
+
+        candidate_count = int(numpy.count_nonzero(has_candidate))
+        accepted_count = int(numpy.count_nonzero(accepted))
+        self._statistics["envelope_pruned"] += len(extent_indices) - candidate_count
+        self._statistics["exact_pruned"] += candidate_count - accepted_count
+        self._statistics["accepted"] += accepted_count
+        return accepted
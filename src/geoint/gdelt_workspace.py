@@ -23,154 +23,267 @@
 # See <https://developers.arcgis.com/> for further information.
 #
 
-import arcpy
+import numpy
+import warnings
+from geoint.gdelt_feature_factory import gdelt_feature_columns
+from geoint.gdelt_instrumentation import gdelt_instrumentation
+from geoint.gdelt_progress import gdelt_cancelled_error
+from geoint.gdelt_schema import create_bin_fields, create_cube_fields, create_event_fields, create_graph_fields
+from geoint.gdelt_spatial import arcpy_geometry_backend, gdelt_aoi_index
+from geoint.gdelt_writer import arcpy_feature_writer
 
 class gdelt_workspace(object):
     """Represents a simple feature workspace hosting feature classes.
+    The features are written by a bulk feature writer, by default into the ArcGIS workspace at path.
+    The written rows are reported to the optional progress and the optional cancellation token is checked between the batches.
+    When a job is cancelled, a new feature class is deleted unless the partial result is kept.
+    Warnings are passed to the warn callback, by default to arcpy when it is available, so that headless servers do not need ArcGIS.
     """
 
-    def __init__(self, path):
+    def __init__(self, path, writer=None, instrumentation=None, progress=None, cancellation=None, keep_partial=False, warn=None):
         self._path = path
+        self._writer = writer if writer else arcpy_feature_writer(path)
+        self._instrumentation = instrumentation if instrumentation else gdelt_instrumentation()
+        self._progress = progress
+        self._cancellation = cancellation
+        self._keep_partial = keep_partial
+        self._warn = warn if warn else self._add_warning
+        self._interrupted = None
+        self._aoi_statistics = None
+
+    def __get_aoi_statistics(self):
+        return self._aoi_statistics
+
+    def __get_writer(self):
+        return self._writer
+
+    def __get_instrumentation(self):
+        return self._instrumentation
+
+    def __get_interrupted(self):
+        return self._interrupted
+
+    aoi_statistics = property(__get_aoi_statistics)
+
+    instrumentation = property(__get_instrumentation)
+
+    interrupted = property(__get_interrupted)
+
+    writer = property(__get_writer)
 
     def insert_features(self, table_name, gdelt_features, areas_of_interests=None):
         """Inserts a bunch of GDELT features into a feature class of this workspace.
+        Returns the number of inserted features.
+        """
+        fields = self._create_fields()
+        feature_class = self._writer.create(table_name, fields)
+        return self._insert_feature_batches(feature_class, fields, self._create_chunks(gdelt_features), areas_of_interests, None, None)
+
+    def insert_feature_batches(self, table_name, gdelt_feature_batches, areas_of_interests=None, fields=None, append=False, existing_ids=None):
+        """Inserts batches of GDELT features into a feature class of this workspace.
+        Every batch is a list of features whose location is a (x, y) tuple or the feature columns of a batch.
+        The fields must match the fields of the queried events, by default all fields are created.
+        When appending, an existing feature class is reused and features having an existing ID are skipped.
+        Returns the number of inserted features.
         """
-        (feature_class, fields) = self._create_gdelt_feature_class(table_name)
-        field_names = ["SHAPE@"] + [field[0] for field in fields]
-        with arcpy.da.InsertCursor(feature_class, field_names) as insert_cursor:
-            for gdelt_feature in gdelt_features:
-                try:
-                    if (areas_of_interests):
-                        disjoint = True
-                        for area in areas_of_interests:
-                            geometry = gdelt_feature[0]
-                            disjoint = area.disjoint(geometry)
-                            if not disjoint:
-                                break
-                        if not disjoint:
-                            insert_cursor.insertRow(gdelt_feature)
-                    else:
-                        insert_cursor.insertRow(gdelt_feature)
-                except BaseException as ex:
-                    arcpy.AddError(ex)
-                    arcpy.AddError(gdelt_feature)
-                    break
+        if fields is None:
+            fields = self._create_fields()
+        existed = append and self._writer.exists(table_name)
+        feature_class = self._writer.create(table_name, fields, append)
+        # The GlobalEventId always follows the location
+        return self._insert_feature_batches(feature_class, fields, gdelt_feature_batches, areas_of_interests, existing_ids, lambda gdelt_feature: gdelt_feature[1], not existed)
 
     def insert_graph_features(self, table_name, gdelt_features, areas_of_interests=None):
         """Inserts a bunch of GDELT graph features into a feature class of this workspace.
+        Returns the number of inserted features.
         """
-        (feature_class, fields) = self._create_gdelt_graph_feature_class(table_name)
-        field_names = ["SHAPE@"] + [field[0] for field in fields]
-        with arcpy.da.InsertCursor(feature_class, field_names) as insert_cursor:
-            for gdelt_feature in gdelt_features:
-                try:
-                    if (areas_of_interests):
-                        disjoint = True
-                        for area in areas_of_interests:
-                            geometry = gdelt_feature[0]
-                            disjoint = area.disjoint(geometry)
-                            if not disjoint:
-                                break
-                        if not disjoint:
-                            insert_cursor.insertRow(gdelt_feature)
-                    else:
-                        insert_cursor.insertRow(gdelt_feature)
-                except BaseException as ex:
-                    arcpy.AddError(ex)
-                    arcpy.AddError(gdelt_feature)
-                    break
-
-    def _create_gdelt_feature_class(self, table_name):
-        feature_class_result = arcpy.management.CreateFeatureclass(self._path, table_name, geometry_type="POINT", spatial_reference=4326)
-        feature_class = feature_class_result[0]
-        fields = self._create_fields()
-        arcpy.management.AddFields(feature_class, fields)
-        return (feature_class, fields)
+        fields = self._create_graph_fields()
+        feature_class = self._writer.create(table_name, fields)
+        return self._insert_feature_batches(feature_class, fields, self._create_chunks(gdelt_features), areas_of_interests, None, None)
 
-    def _create_gdelt_graph_feature_class(self, table_name):
-        feature_class_result = arcpy.management.CreateFeatureclass(self._path, table_name, geometry_type="POINT", spatial_reference=4326)
-        feature_class = feature_class_result[0]
+    def insert_graph_feature_batches(self, table_name, gdelt_feature_batches, areas_of_interests=None, append=False, existing_keys=None):
+        """Inserts batches of GDELT graph features into a feature class of this workspace.
+        Every batch is a list of features whose location is a (x, y) tuple or the feature columns of a batch.
+        When appending, an existing feature class is reused and features having an existing GKGRECORDID and Location_FeatureID are skipped.
+        Returns the number of inserted features.
+        """
         fields = self._create_graph_fields()
-        arcpy.management.AddFields(feature_class, fields)
-        return (feature_class, fields)
+        existed = append and self._writer.exists(table_name)
+        feature_class = self._writer.create(table_name, fields, append)
+        return self._insert_feature_batches(feature_class, fields, gdelt_feature_batches, areas_of_interests, existing_keys, lambda gdelt_feature: (gdelt_feature[1], gdelt_feature[9]), not existed)
+
+    def insert_bin_features(self, table_name, gdelt_bin_features, areas_of_interests=None):
+        """Inserts the features of aggregated grid cells into a feature class of this workspace.
+        The location of every feature is the center of its cell.
+        Returns the number of inserted features.
+        """
+        fields = self._create_bin_fields()
+        feature_class = self._writer.create(table_name, fields)
+        return self._insert_feature_batches(feature_class, fields, self._create_chunks(gdelt_bin_features), areas_of_interests, None, None)
+
+    def insert_cube_features(self, table_name, gdelt_cube_features, areas_of_interests=None):
+        """Inserts the features of the space-time bins of a cube into one feature class of this workspace.
+        The location of every feature is the center of its cell.
+        Returns the number of inserted features.
+        """
+        fields = self._create_cube_fields()
+        feature_class = self._writer.create(table_name, fields)
+        return self._insert_feature_batches(feature_class, fields, self._create_chunks(gdelt_cube_features), areas_of_interests, None, None)
+
+    def read_high_water_mark(self, table_name):
+        """Reads the high-water mark of an existing GDELT events feature class.
+        Returns the maximum DATEADDED, the maximum GlobalEventId and all GlobalEventIds or None when the feature class does not exist.
+        """
+        if not self._writer.exists(table_name):
+            return None
+        high_water_mark = { "dateadded": None, "event_id": None, "ids": set() }
+        if "DATEADDED" in self._writer.list_fields(table_name):
+            for (event_id, dateadded) in self._writer.search(table_name, ["GlobalEventId", "DATEADDED"]):
+                high_water_mark["ids"].add(event_id)
+                if dateadded and (high_water_mark["dateadded"] is None or high_water_mark["dateadded"] < dateadded):
+                    high_water_mark["dateadded"] = dateadded
+        else:
+            for (event_id,) in self._writer.search(table_name, ["GlobalEventId"]):
+                high_water_mark["ids"].add(event_id)
+        if high_water_mark["ids"]:
+            high_water_mark["event_id"] = max(high_water_mark["ids"])
+        return high_water_mark
+
+    def read_graph_high_water_mark(self, table_name):
+        """Reads the high-water mark of an existing GDELT knowledge graph feature class.
+        Returns the maximum DATE and all pairs of GKGRECORDID and Location_FeatureID or None when the feature class does not exist.
+        """
+        if not self._writer.exists(table_name):
+            return None
+        high_water_mark = { "date": None, "keys": set() }
+        for (record_id, feature_id, date) in self._writer.search(table_name, ["GKGRECORDID", "Location_FeatureID", "DATE"]):
+            high_water_mark["keys"].add((record_id, feature_id))
+            if date and (high_water_mark["date"] is None or high_water_mark["date"] < date):
+                high_water_mark["date"] = date
+        return high_water_mark
+
+    def _insert_feature_batches(self, feature_class, fields, gdelt_feature_batches, areas_of_interests, existing_keys, key_of, created=True):
+        aoi_index = None
+        if (areas_of_interests):
+            aoi_index = self._create_aoi_index(areas_of_interests)
+        interrupted = []
+        def filter_features():
+            try:
+                for gdelt_feature_batch in gdelt_feature_batches:
+                    if self._cancellation is not None:
+                        self._cancellation.check()
+                    if aoi_index:
+                        gdelt_feature_batch = self._filter_feature_batch(gdelt_feature_batch, aoi_index)
+                    if existing_keys is not None:
+                        gdelt_feature_batch = self._skip_existing_features(gdelt_feature_batch, existing_keys, key_of)
+                    for gdelt_feature in gdelt_feature_batch:
+                        yield gdelt_feature
+            except gdelt_cancelled_error as ex:
+                if not self._keep_partial:
+                    raise
+                # The writer commits the features passed so far
+                interrupted.append(ex)
+        rejected = self._writer.statistics["rejected"]
+        first_reject = len(self._writer.rejects)
+        # The upstream stages run lazily while inserting and are measured on their own
+        try:
+            with self._instrumentation.measure("insert") as stage:
+                # The writer reports the rows it wrote, rejected rows are not counted
+                inserted = self._writer.write(feature_class, [field[0] for field in fields], filter_features(), self._progress)
+                rejected = self._writer.statistics["rejected"] - rejected
+                stage.rows_in = inserted + rejected
+                stage.rows_out = inserted
+        except gdelt_cancelled_error:
+            # A cancelled job does not leave a partial feature class
+            if created:
+                self._writer.delete(feature_class)
+            raise
+        self._interrupted = interrupted[0] if interrupted else None
+        if interrupted:
+            self._warn("{0} The {1} GDELT features written so far were kept.".format(interrupted[0], inserted))
+        if (0 < rejected):
+            # Bad rows do not stop the insert, only the first rejects are reported
+            self._warn("{0} GDELT features could not be inserted.".format(rejected))
+            for (gdelt_feature, message) in self._writer.rejects[first_reject:first_reject + 10]:
+                self._warn("{0}: {1}".format(message, gdelt_feature))
+        return inserted
+
+    def _add_warning(self, message):
+        try:
+            import arcpy
+        except ImportError:
+            warnings.warn(message)
+            return
+        arcpy.AddWarning(message)
+
+    def _skip_existing_features(self, gdelt_feature_batch, existing_keys, key_of):
+        """Returns the features of the batch whose keys are not existing.
+        The keys of the returned features are added to the existing keys.
+        """
+        with self._instrumentation.measure("skip_existing") as stage:
+            new_features = []
+            for gdelt_feature in gdelt_feature_batch:
+                key = key_of(gdelt_feature)
+                if key not in existing_keys:
+                    existing_keys.add(key)
+                    new_features.append(gdelt_feature)
+            stage.rows_in = len(gdelt_feature_batch)
+            stage.rows_out = len(new_features)
+        return new_features
+
+    def _create_aoi_index(self, areas_of_interests):
+        """Creates a spatial index using the rings of the areas of interests.
+        The statistics of this index are reported by aoi_statistics.
+        """
+        aoi_index = gdelt_aoi_index([arcpy_geometry_backend.to_rings(area) for area in areas_of_interests])
+        self._aoi_statistics = aoi_index.statistics
+        return aoi_index
+
+    def _create_chunks(self, gdelt_features, chunk_size=10000):
+        """Splits the features into chunks, so that the areas of interests are tested chunk by chunk.
+        """
+        chunk = []
+        for gdelt_feature in gdelt_features:
+            chunk.append(gdelt_feature)
+            if chunk_size <= len(chunk):
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _filter_feature_batch(self, gdelt_feature_batch, aoi_index):
+        """Returns the features of the batch being inside any area of interest.
+        """
+        with self._instrumentation.measure("aoi_filter") as stage:
+            if isinstance(gdelt_feature_batch, gdelt_feature_columns):
+                inside = aoi_index.contains(gdelt_feature_batch.x, gdelt_feature_batch.y)
+                self._aoi_statistics = aoi_index.statistics
+                accepted_features = gdelt_feature_batch.select(inside)
+            else:
+                locations = [self._locate(gdelt_feature) for gdelt_feature in gdelt_feature_batch]
+                x = numpy.fromiter((location[0] for location in locations), dtype=numpy.float64, count=len(locations))
+                y = numpy.fromiter((location[1] for location in locations), dtype=numpy.float64, count=len(locations))
+                inside = aoi_index.contains(x, y)
+                self._aoi_statistics = aoi_index.statistics
+                accepted_features = [gdelt_feature for (gdelt_feature, accepted) in zip(gdelt_feature_batch, inside.tolist()) if accepted]
+            stage.rows_in = len(gdelt_feature_batch)
+            stage.rows_out = len(accepted_features)
+        return accepted_features
+
+    def _locate(self, gdelt_feature):
+        location = gdelt_feature[0]
+        if isinstance(location, tuple):
+            return location
+        return (location.X, location.Y)
 
     def _create_fields(self):
-        return [
-            ["GlobalEventId", "LONG"],
-            ["Day", "LONG"],
-            ["MonthYear", "LONG"],
-            ["Year", "LONG"],
-            ["FractionDate", "DOUBLE"],
-            ["Actor1Code", "TEXT", "Actor1Code", 255],
-            ["Actor1Name", "TEXT", "Actor1Name", 255],
-            ["Actor1CountryCode", "TEXT", "Actor1CountryCode", 255],
-            ["Actor1KnownGroupCode", "TEXT", "Actor1KnownGroupCode", 255],
-            ["Actor1EthnicCode", "TEXT", "Actor1EthnicCode", 255],
-            ["Actor1Religion1Code", "TEXT", "Actor1Religion1Code", 255],
-            ["Actor1Religion2Code", "TEXT", "Actor1Religion2Code", 255],
-            ["Actor1Type1Code", "TEXT", "Actor1Type1Code", 255],
-            ["Actor1Type2Code", "TEXT", "Actor1Type2Code", 255],
-            ["Actor1Type3Code", "TEXT", "Actor1Type3Code", 255],
-            ["Actor2Code", "TEXT", "Actor2Code", 255],
-            ["Actor2Name", "TEXT", "Actor2Name", 255],
-            ["Actor2CountryCode", "TEXT", "Actor2CountryCode", 255],
-            ["Actor2KnownGroupCode", "TEXT", "Actor2KnownGroupCode", 255],
-            ["Actor2EthnicCode", "TEXT", "Actor2EthnicCode", 255],
-            ["Actor2Religion1Code", "TEXT", "Actor2Religion1Code", 255],
-            ["Actor2Religion2Code", "TEXT", "Actor2Religion2Code", 255],
-            ["Actor2Type1Code", "TEXT", "Actor2Type1Code", 255],
-            ["Actor2Type2Code", "TEXT", "Actor2Type2Code", 255],
-            ["Actor2Type3Code", "TEXT", "Actor2Type3Code", 255],
-            ["IsRootEvent", "LONG"],
-            ["EventCode", "TEXT", "EventCode", 255],
-            ["EventBaseCode", "TEXT", "EventBaseCode", 255],
-            ["EventRootCode", "TEXT", "EventRootCode", 255],
-            ["QuadClass", "LONG"],
-            ["GoldsteinScale", "DOUBLE"],
-            ["NumMentions", "LONG"],
-            ["NumSources", "LONG"],
-            ["NumArticles", "LONG"],
-            ["AvgTone", "DOUBLE"],
-            ["Actor1Geo_Type", "LONG"],
-            ["Actor1Geo_Fullname", "TEXT", "Actor1Geo_Fullname", 1000],
-            ["Actor1Geo_CountryCode", "TEXT", "Actor1Geo_CountryCode", 255],
-            ["Actor1Geo_ADM1Code", "TEXT", "Actor1Geo_ADM1Code", 255],
-            ["Actor1Geo_ADM2Code", "TEXT", "Actor1Geo_ADM2Code", 255],
-            ["Actor1Geo_Lat", "DOUBLE"],
-            ["Actor1Geo_Long", "DOUBLE"],
-            ["Actor1Geo_FeatureID", "TEXT", "Actor1Geo_FeatureID", 255],
-            ["Actor2Geo_Type", "LONG"],
-            ["Actor2Geo_FullName", "TEXT", "Actor2Geo_FullName", 1000],
-            ["Actor2Geo_CountryCode", "TEXT", "Actor2Geo_CountryCode", 255],
-            ["Actor2Geo_ADM1Code", "TEXT", "Actor2Geo_ADM1Code", 255],
-            ["Actor2Geo_ADM2Code", "TEXT", "Actor2Geo_ADM2Code", 255],
-            ["Actor2Geo_Lat", "DOUBLE"],
-            ["Actor2Geo_Long", "DOUBLE"],
-            ["Actor2Geo_FeatureID", "TEXT", "Actor2Geo_FeatureID", 255],
-            ["ActionGeo_Type", "LONG"],
-            ["ActionGeo_FullName", "TEXT", "ActionGeo_FullName", 1000],
-            ["ActionGeo_CountryCode", "TEXT", "ActionGeo_CountryCode", 255],
-            ["ActionGeo_ADM1Code", "TEXT", "ActionGeo_ADM1Code", 255],
-            ["ActionGeo_ADM2Code", "TEXT", "ActionGeo_ADM2Code", 255],
-            ["ActionGeo_Lat", "DOUBLE"],
-            ["ActionGeo_Long", "DOUBLE"],
-            ["ActionGeo_FeatureID", "TEXT", "ActionGeo_FeatureID", 255],
-            ["DATEADDED", "TEXT", "DATEADDED", 255],
-            ["SOURCEURL", "TEXT", "SOURCEURL", 1000]
-        ]
+        return create_event_fields()
 
     def _create_graph_fields(self):
-        return [
-            ["GKGRECORDID", "TEXT", "GKGRECORDID", 255],
-            ["Location_Type", "LONG"],
-            ["Location_FullName", "TEXT", "Location_FullName", 1000],
-            ["Location_CountryCode", "TEXT", "Location_CountryCode", 255],
-            ["Location_ADM1Code", "TEXT", "Location_ADM1Code", 255],
-            ["Location_ADM2Code", "TEXT", "Location_ADM2Code", 255],
-            ["Location_Lat", "DOUBLE"],
-            ["Location_Long", "DOUBLE"],
-            ["Location_FeatureID", "TEXT", "Location_FeatureID", 255],
-            ["DATE", "DATE"],
-            ["SourceCommonName", "TEXT", "SourceCommonName", 255],
-            ["DocumentIdentifier", "TEXT", "DocumentIdentifier", 1000]
-        ]
+        return create_graph_fields()
+
+    def _create_bin_fields(self):
+        return create_bin_fields()
+
+    def _create_cube_fields(self):
+        return create_cube_fields()
@@ -0,0 +1,358 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+
+import datetime
+import os
+import sqlite3
+import struct
+import time
+
+class gdelt_writer(object):
+    """Base class of the bulk feature writers.
+    The features are written chunk by chunk and rows which cannot be written are collected as rejects.
+    The location of every feature is a (x, y) tuple or a point having X and Y.
+    """
+
+    def __init__(self, chunk_size=10000, max_rejects=1000):
+        self._chunk_size = chunk_size
+        self._max_rejects = max_rejects
+        self._rejects = []
+        self._rows = 0
+        self._rejected = 0
+        self._seconds = 0.0
+        self._progress = None
+
+    def __get_rejects(self):
+        return self._rejects
+
+    def __get_statistics(self):
+        return {
+            "backend": type(self).__name__,
+            "rows": self._rows,
+            "rejected": self._rejected,
+            "seconds": self._seconds,
+            "rows_per_second": self._rows / self._seconds if self._seconds else 0.0
+        }
+
+    rejects = property(__get_rejects)
+
+    statistics = property(__get_statistics)
+
+    def exists(self, table_name):
+        """Returns whether the table exists.
+        """
+        raise NotImplementedError()
+
+    def list_fields(self, table_name):
+        """Returns the names of the attribute fields of the table.
+        """
+        raise NotImplementedError()
+
+    def search(self, table_name, field_names):
+        """Returns an iterator over the values of the fields of all rows.
+        """
+        raise NotImplementedError()
+
+    def create(self, table_name, fields, append=False):
+        """Creates a point table having the fields and returns the table for writing.
+        When appending, an existing table is reused.
+        """
+        raise NotImplementedError()
+
+    def delete(self, table):
+        """Deletes a table returned by create, e.g. when a cancelled job must not leave a partial table.
+        """
+        raise NotImplementedError()
+
+    def write(self, table, field_names, features, progress=None):
+        """Writes the features into the table and returns the number of written rows.
+        Rows which cannot be written are added to the rejects.
+        The rows written of every chunk are added to the optional progress, the rejects are not.
+        """
+        start = time.perf_counter()
+        self._progress = progress
+        try:
+            written = self._write_chunks(table, field_names, self._create_chunks(features))
+        finally:
+            self._progress = None
+        self._seconds += time.perf_counter() - start
+        self._rows += written
+        return written
+
+    def _write_chunks(self, table, field_names, chunks):
+        raise NotImplementedError()
+
+    def _create_chunks(self, features):
+        chunk = []
+        for feature in features:
+            chunk.append(feature)
+            if self._chunk_size <= len(chunk):
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _create_location(self, location):
+        if isinstance(location, tuple):
+            return location
+        return (location.X, location.Y)
+
+    def _report_written(self, rows):
+        if self._progress is not None and 0 < rows:
+            self._progress.add_written(rows)
+
+    def _reject(self, feature, ex):
+        self._rejected += 1
+        if len(self._rejects) < self._max_rejects:
+            self._rejects.append((feature, str(ex)))
+
+
+
+class arcpy_feature_writer(gdelt_writer):
+    """Writes the features into feature classes of an ArcGIS workspace.
+    One insert cursor is used for all chunks, so that the rows keep their order and nulls are written as nulls.
+    """
+
+    SPATIAL_REFERENCE = 4326
+
+    def __init__(self, path, chunk_size=10000, max_rejects=1000):
+        super().__init__(chunk_size, max_rejects)
+        self._path = path
+
+    def exists(self, table_name):
+        import arcpy
+        return arcpy.Exists(os.path.join(self._path, table_name))
+
+    def list_fields(self, table_name):
+        import arcpy
+        return [field.name for field in arcpy.ListFields(os.path.join(self._path, table_name))]
+
+    def search(self, table_name, field_names):
+        import arcpy
+        with arcpy.da.SearchCursor(os.path.join(self._path, table_name), field_names) as cursor:
+            for row in cursor:
+                yield row
+
+    def create(self, table_name, fields, append=False):
+        import arcpy
+        feature_class = os.path.join(self._path, table_name)
+        if append and arcpy.Exists(feature_class):
+            return feature_class
+        feature_class_result = arcpy.management.CreateFeatureclass(self._path, table_name, geometry_type="POINT", spatial_reference=self.SPATIAL_REFERENCE)
+        feature_class = feature_class_result[0]
+        arcpy.management.AddFields(feature_class, fields)
+        return feature_class
+
+    def delete(self, table):
+        import arcpy
+        if arcpy.Exists(table):
+            arcpy.management.Delete(table)
+
+    def _write_chunks(self, table, field_names, chunks):
+        import arcpy
+        written = 0
+        with arcpy.da.InsertCursor(table, ["SHAPE@XY"] + list(field_names)) as insert_cursor:
+            for chunk in chunks:
+                chunk_written = 0
+                for feature in chunk:
+                    try:
+                        insert_cursor.insertRow((self._create_location(feature[0]),) + tuple(feature[1:]))
+                        chunk_written += 1
+                    except Exception as ex:
+                        self._reject(feature, ex)
+                self._report_written(chunk_written)
+                written += chunk_written
+        return written
+
+
+
+class geopackage_feature_writer(gdelt_writer):
+    """Writes the features into tables of a GeoPackage using SQLite.
+    Every chunk is inserted by one executemany call and all chunks are written in one transaction.
+    This writer does not need ArcGIS and can be used on headless servers.
+    The location of a feature can also be a GeoPackage binary geometry, which is inserted as it is.
+    """
+
+    SPATIAL_REFERENCE = 4326
+
+    FIELD_TYPES = {
+        "TEXT": "TEXT",
+        "SHORT": "SMALLINT",
+        "LONG": "INTEGER",
+        "FLOAT": "FLOAT",
+        "DOUBLE": "DOUBLE",
+        "DATE": "DATETIME"
+    }
+
+    def __init__(self, path, chunk_size=10000, max_rejects=1000):
+        super().__init__(chunk_size, max_rejects)
+        self._path = path
+
+    def __get_path(self):
+        return self._path
+
+    path = property(__get_path)
+
+    def exists(self, table_name):
+        connection = self._connect()
+        try:
+            return self._exists(connection, table_name)
+        finally:
+            connection.close()
+
+    def list_fields(self, table_name):
+        connection = self._connect()
+        try:
+            return [column[1] for column in connection.execute("PRAGMA table_info(\"{0}\")".format(table_name)) if column[1] not in ["fid", "geom"]]
+        finally:
+            connection.close()
+
+    def search(self, table_name, field_names):
+        connection = self._connect()
+        try:
+            column_types = {column[1]: column[2] for column in connection.execute("PRAGMA table_info(\"{0}\")".format(table_name))}
+            is_datetime = [("DATETIME" == column_types.get(field_name)) for field_name in field_names]
+            columns = ", ".join("\"{0}\"".format(field_name) for field_name in field_names)
+            for row in connection.execute("SELECT {0} FROM \"{1}\"".format(columns, table_name)):
+                yield tuple(self._parse_datetime(value) if datetime_value else value for (value, datetime_value) in zip(row, is_datetime))
+        finally:
+            connection.close()
+
+    def create(self, table_name, fields, append=False):
+        connection = self._connect()
+        try:
+            with connection:
+                if append and self._exists(connection, table_name):
+                    return table_name
+                self._drop(connection, table_name)
+                columns = ["fid INTEGER PRIMARY KEY AUTOINCREMENT", "geom POINT"]
+                columns += ["\"{0}\" {1}".format(field[0], self.FIELD_TYPES.get(field[1], "TEXT")) for field in fields]
+                connection.execute("CREATE TABLE \"{0}\" ({1})".format(table_name, ", ".join(columns)))
+                connection.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) VALUES (?, 'features', ?, ?)", (table_name, table_name, self.SPATIAL_REFERENCE))
+                connection.execute("INSERT INTO gpkg_geometry_columns (table_name, column_name, geometry_type_name, srs_id, z, m) VALUES (?, 'geom', 'POINT', ?, 0, 0)", (table_name, self.SPATIAL_REFERENCE))
+            return table_name
+        finally:
+            connection.close()
+
+    def delete(self, table):
+        connection = self._connect()
+        try:
+            with connection:
+                self._drop(connection, table)
+        finally:
+            connection.close()
+
+    def _drop(self, connection, table_name):
+        connection.execute("DROP TABLE IF EXISTS \"{0}\"".format(table_name))
+        connection.execute("DELETE FROM gpkg_geometry_columns WHERE table_name = ?", (table_name,))
+        connection.execute("DELETE FROM gpkg_contents WHERE table_name = ?", (table_name,))
+
+    def _write_chunks(self, table, field_names, chunks):
+        columns = ["geom"] + ["\"{0}\"".format(field_name) for field_name in field_names]
+        statement = "INSERT INTO \"{0}\" ({1}) VALUES ({2})".format(table, ", ".join(columns), ", ".join("?" * len(columns)))
+        written = 0
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN")
+            for chunk in chunks:
+                rows = []
+                accepted_features = []
+                for feature in chunk:
+                    try:
+                        rows.append(self._create_row(feature, len(columns)))
+                        accepted_features.append(feature)
+                    except Exception as ex:
+                        self._reject(feature, ex)
+                chunk_written = self._insert_rows(connection, statement, rows, accepted_features)
+                self._report_written(chunk_written)
+                written += chunk_written
+            connection.commit()
+            return written
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    def _insert_rows(self, connection, statement, rows, features):
+        """Inserts the rows using one statement.
+        When any row fails, the chunk is rolled back and inserted row by row.
+        """
+        connection.execute("SAVEPOINT chunk")
+        try:
+            connection.executemany(statement, rows)
+            connection.execute("RELEASE SAVEPOINT chunk")
+            return len(rows)
+        except sqlite3.Error:
+            connection.execute("ROLLBACK TO SAVEPOINT chunk")
+            connection.execute("RELEASE SAVEPOINT chunk")
+        written = 0
+        for (row, feature) in zip(rows, features):
+            try:
+                connection.execute(statement, row)
+                written += 1
+            except sqlite3.Error as ex:
+                self._reject(feature, ex)
+        return written
+
+    def _create_row(self, feature, column_count):
+        if column_count != len(feature):
+            raise ValueError("The feature has {0} values, but {1} are expected!".format(len(feature), column_count))
+        if isinstance(feature[0], bytes):
+            # The GeoPackage geometry was already created
+            geometry = feature[0]
+        else:
+            (x, y) = self._create_location(feature[0])
+            # GeoPackage binary header having no envelope followed by a little endian WKB point
+            geometry = struct.pack("<2sBBi", b"GP", 0, 1, self.SPATIAL_REFERENCE) + struct.pack("<BIdd", 1, 1, x, y)
+        row = [geometry]
+        for value in feature[1:]:
+            if isinstance(value, datetime.datetime):
+                value = value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            row.append(value)
+        return row
+
+    def _parse_datetime(self, value):
+        if value is None:
+            return None
+        return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ")
+
+    def _exists(self, connection, table_name):
+        return connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone() is not None
+
+    def _connect(self):
+        connection = sqlite3.connect(self._path)
+        # GeoPackage application id and version 1.2
+        connection.execute("PRAGMA application_id = 1196444487")
+        connection.execute("PRAGMA user_version = 10200")
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER NOT NULL PRIMARY KEY, organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT)")
+            connection.execute("CREATE TABLE IF NOT EXISTS gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE, description TEXT DEFAULT '', last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')), min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER)")
+            connection.execute("CREATE TABLE IF NOT EXISTS gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL, CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name))")
+            connection.execute("INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', NULL)")
+            connection.execute("INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', NULL)")
+            connection.execute("INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES ('WGS 84 geodetic', 4326, 'EPSG', 4326, 'GEOGCS[\"WGS 84\",DATUM[\"WGS_1984\",SPHEROID[\"WGS 84\",6378137,298.257223563]],PRIMEM[\"Greenwich\",0],UNIT[\"degree\",0.0174532925199433]]', NULL)")
+        return connection
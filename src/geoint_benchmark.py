@@ -0,0 +1,364 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+"""
+Offline benchmarks of the GEOINT module.
+The pipelines run against a fake BigQuery client and the real arcpy module or a fake arcpy module when ArcGIS is not available.
+Run this module directly for measuring every stage and storing the results as JSON.
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from geoint.gdelt_batch import gdelt_event_batch, gdelt_graph_batch
+from geoint.gdelt_client import gdelt_client, gdelt_event, gdelt_graph_entry
+from geoint.gdelt_query import gdelt_query_builder
+from geoint.gdelt_schema import create_event_fields, create_graph_fields
+from geoint_fakes import create_event_records, create_graph_records, fake_bigquery_client, install_fake_arcpy
+
+class legacy_gdelt_event(object):
+    """Replicates the former layout of a GDELT event record for comparison.
+    Every instance has a dictionary and a list of all values.
+    """
+
+    def __init__(self, record, dateadded_index=59):
+        self.id = record.GLOBALEVENTID
+        self.location = (record.ActionGeo_Long, record.ActionGeo_Lat)
+        self.fullname = record.get("ActionGeo_FullName")
+        self.values = [value for value in record]
+        self.values[dateadded_index] = str(self.values[dateadded_index])
+
+
+
+def benchmark_graph_parser(count, locations_per_document=5):
+    """Measures the throughput of the row-wise and the batch parser of knowledge graph records.
+    Returns the exploded location rows per second of both parsers.
+    """
+    records = create_graph_records(count, locations_per_document)
+
+    start = time.perf_counter()
+    row_count = sum(len(gdelt_graph_entry(record).records) for record in records)
+    entry_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_count = len(gdelt_graph_batch.from_records(records))
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "documents": count,
+        "rows": row_count,
+        "entry_rows_per_second": row_count / entry_seconds,
+        "batch_rows_per_second": batch_count / batch_seconds,
+        "speedup": entry_seconds / batch_seconds
+    }
+
+
+def benchmark_feature_factory(count, workers=4, chunk_size=25000):
+    """Measures the throughput of the per-row and the batch feature creation of GDELT events.
+    The batch is converted into (x, y) tuples, into GeoPackage geometries and into (x, y) tuples using a process pool.
+    Returns the features per second of every variant.
+    """
+    install_fake_arcpy()
+    from geoint.gdelt_feature_factory import gdelt_feature_factory, geopackage_point_backend
+
+    records = create_event_records(count)
+    gdelt_events = [gdelt_event(record) for record in records]
+    batch = gdelt_event_batch.from_records(records)
+    feature_factory = gdelt_feature_factory()
+    geopackage_feature_factory = gdelt_feature_factory(point_backend=geopackage_point_backend())
+    result = {"features": count, "workers": workers}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pool_feature_factory = gdelt_feature_factory(executor=executor, chunk_size=chunk_size)
+        # The worker processes are started before measuring
+        list(executor.map(abs, range(workers)))
+        variants = {
+            "row": lambda: [feature_factory.create_feature(gdelt_event) for gdelt_event in gdelt_events],
+            "columns": lambda: feature_factory.create_feature_batch(batch),
+            "geopackage_columns": lambda: geopackage_feature_factory.create_feature_batch(batch),
+            "process_pool_columns": lambda: pool_feature_factory.create_feature_batch(batch)
+        }
+        for (name, create_features) in variants.items():
+            gc.collect()
+            start = time.perf_counter()
+            features = create_features()
+            seconds = time.perf_counter() - start
+            result["{0}_features_per_second".format(name)] = len(features) / seconds
+    result["speedup"] = result["columns_features_per_second"] / result["row_features_per_second"]
+    return result
+
+def benchmark_event_memory(count, page_size=10000):
+    """Measures the memory held by GDELT events using the legacy records, the slotted records, the views of the batches and the batches.
+    The records are created page-wise like returned by BigQuery and only the converted events are kept.
+    Returns the bytes per event of every representation.
+    """
+    representations = {
+        "legacy": lambda records: [legacy_gdelt_event(record) for record in records],
+        "slotted": lambda records: [gdelt_event(record) for record in records],
+        "views": lambda records: list(gdelt_event_batch.from_records(records).records()),
+        "batch": lambda records: [gdelt_event_batch.from_records(records)]
+    }
+    result = {"events": count}
+    for (name, convert) in representations.items():
+        gc.collect()
+        tracemalloc.start()
+        events = []
+        for first_id in range(0, count, page_size):
+            records = create_event_records(min(page_size, count - first_id), first_id)
+            events.extend(convert(records))
+            del records
+        gc.collect()
+        (current, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["{0}_bytes_per_event".format(name)] = current / count
+        del events
+    return result
+
+
+def measure_stage(stage, trace_memory=True):
+    """Runs a stage returning its result and its number of rows.
+    The stage runs a second time under tracemalloc for measuring the peak memory, because tracing slows down the stage.
+    Returns the result and the measurement.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    (result, rows) = stage()
+    seconds = time.perf_counter() - start
+    measurement = {
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+        "peak_bytes": None
+    }
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        stage()
+        measurement["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return (result, measurement)
+
+def create_areas_of_interests(count, seed=42):
+    """Creates random square areas of interests covering about one percent of the world.
+    """
+    import arcpy
+    random_state = random.Random(seed)
+    areas_of_interests = []
+    for index in range(count):
+        x = random_state.uniform(-180, 170)
+        y = random_state.uniform(-90, 80)
+        size = random_state.uniform(5, 10)
+        ring = arcpy.Array([arcpy.Point(x, y), arcpy.Point(x, y + size), arcpy.Point(x + size, y + size), arcpy.Point(x + size, y), arcpy.Point(x, y)])
+        areas_of_interests.append(arcpy.Polygon(ring, arcpy.SpatialReference(4326)))
+    return areas_of_interests
+
+def benchmark_pipeline(pipeline, size, latency=0.0, page_size=10000, aoi_count=10, trace_memory=True):
+    """Measures every stage of the events or the graph pipeline.
+    The stages are fetch, record construction, feature creation, AOI filtering and insert.
+    The row-wise and the batch variant of every stage are measured separately.
+    """
+    import arcpy
+    from geoint.gdelt_feature_factory import gdelt_feature_factory
+    from geoint.gdelt_workspace import gdelt_workspace
+    from geoint.gdelt_writer import arcpy_feature_writer, geopackage_feature_writer
+
+    date = datetime.date(2020, 3, 1)
+    if "events" == pipeline:
+        bigquery_client = fake_bigquery_client(records_per_query=size, latency=latency)
+        query = gdelt_query_builder(date, limit=size).build()
+        fields = create_event_fields()
+        create_records = lambda pages: [gdelt_event(record) for page in pages for record in page]
+        create_batches = lambda pages: [gdelt_event_batch.from_records(page) for page in pages]
+    else:
+        # Every document has five locations
+        bigquery_client = fake_bigquery_client(records_per_query=max(1, size // 5), latency=latency)
+        query = gdelt_client(client=bigquery_client)._create_graph_query(date, "TERROR", size)[0]
+        fields = create_graph_fields()
+        create_records = lambda pages: [graph_record for page in pages for record in page for graph_record in gdelt_graph_entry(record).records]
+        create_batches = lambda pages: [gdelt_graph_batch.from_records(page) for page in pages]
+    client = gdelt_client(client=bigquery_client)
+    arcpy.env.overwriteOutput = True
+    temp_dir = tempfile.TemporaryDirectory()
+    writers = {
+        "arcpy": arcpy_feature_writer(arcpy.env.scratchGDB),
+        "geopackage": geopackage_feature_writer(os.path.join(temp_dir.name, "benchmark.gpkg"))
+    }
+    workspace = gdelt_workspace(arcpy.env.scratchGDB, writers["arcpy"])
+    feature_factory = gdelt_feature_factory()
+    field_names = [field[0] for field in fields]
+    stages = {}
+    try:
+        def fetch():
+            pages = list(client._iter_jobs_pages([(query, None, date)], page_size, size))
+            return (pages, sum(len(page) for page in pages))
+        (pages, stages["fetch"]) = measure_stage(fetch, trace_memory)
+
+        def construct():
+            records = create_records(pages)
+            return (records, len(records))
+        (records, stages["construct"]) = measure_stage(construct, trace_memory)
+
+        def construct_batches():
+            batches = create_batches(pages)
+            return (batches, sum(len(batch) for batch in batches))
+        (batches, stages["construct_batches"]) = measure_stage(construct_batches, trace_memory)
+
+        def create_features():
+            features = [feature_factory.create_feature(record) for record in records]
+            return (features, len(features))
+        (features, stages["create_feature"]) = measure_stage(create_features, trace_memory)
+
+        def create_feature_batches():
+            feature_batches = [feature_factory.create_feature_batch(batch) for batch in batches]
+            return (feature_batches, sum(len(feature_batch) for feature_batch in feature_batches))
+        (feature_batches, stages["create_feature_batch"]) = measure_stage(create_feature_batches, trace_memory)
+
+        areas_of_interests = create_areas_of_interests(aoi_count)
+        def filter_features():
+            aoi_index = workspace._create_aoi_index(areas_of_interests)
+            filtered_batches = [workspace._filter_feature_batch(feature_batch, aoi_index) for feature_batch in feature_batches]
+            return (filtered_batches, sum(len(feature_batch) for feature_batch in feature_batches))
+        stages["aoi_filter"] = measure_stage(filter_features, trace_memory)[1]
+
+        for (name, writer) in writers.items():
+            def insert():
+                table = writer.create("Benchmark_{0}".format(pipeline), fields)
+                return (None, writer.write(table, field_names, (feature for feature_batch in feature_batches for feature in feature_batch)))
+            stages["insert_{0}".format(name)] = measure_stage(insert, trace_memory)[1]
+    finally:
+        temp_dir.cleanup()
+    return {
+        "pipeline": pipeline,
+        "size": size,
+        "stages": stages
+    }
+
+def run_benchmarks(sizes, pipelines=("events", "graph"), latency=0.0, trace_memory=True):
+    """Runs the pipeline benchmarks for all data sizes.
+    Returns the machine-readable results.
+    """
+    fake_arcpy = install_fake_arcpy()
+    results = {
+        "created": datetime.datetime.now().isoformat(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "arcpy": "fake" if fake_arcpy else "arcpy",
+        "latency": latency,
+        "results": []
+    }
+    for pipeline in pipelines:
+        for size in sizes:
+            results["results"].append(benchmark_pipeline(pipeline, size, latency, trace_memory=trace_memory))
+    return results
+
+def save_results(results, path):
+    """Saves the results as JSON.
+    """
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+
+def load_results(path):
+    """Loads results saved as JSON.
+    """
+    with open(path, "r") as results_file:
+        return json.load(results_file)
+
+def compare_results(baseline, current, tolerance=0.2):
+    """Compares the throughput of every stage with a baseline.
+    Returns the regressions whose rows per second dropped by more than the tolerance.
+    """
+    baseline_stages = {(result["pipeline"], result["size"], stage): measurement for result in baseline["results"] for (stage, measurement) in result["stages"].items()}
+    regressions = []
+    for result in current["results"]:
+        for (stage, measurement) in result["stages"].items():
+            baseline_measurement = baseline_stages.get((result["pipeline"], result["size"], stage))
+            if not baseline_measurement or not baseline_measurement["rows_per_second"]:
+                continue
+            ratio = measurement["rows_per_second"] / baseline_measurement["rows_per_second"]
+            if ratio < 1.0 - tolerance:
+                regressions.append({
+                    "pipeline": result["pipeline"],
+                    "size": result["size"],
+                    "stage": stage,
+                    "baseline_rows_per_second": baseline_measurement["rows_per_second"],
+                    "rows_per_second": measurement["rows_per_second"],
+                    "ratio": ratio
+                })
+    return regressions
+
+def print_results(results):
+    """Prints the measurements of every stage.
+    """
+    print("Benchmark using {arcpy}, Python {python} on {platform}".format(**results))
+    for result in results["results"]:
+        for (stage, measurement) in result["stages"].items():
+            peak = "-" if measurement["peak_bytes"] is None else "{0:.1f} MB".format(measurement["peak_bytes"] / 1048576.0)
+            print("{0:6} {1:>9} {2:22} {3:>12.0f} rows/s {4:>10}".format(result["pipeline"], result["size"], stage, measurement["rows_per_second"], peak))
+
+
+
+if "__main__" == __name__:
+    argument_parser = argparse.ArgumentParser(description="Runs the offline benchmarks of the GEOINT module.")
+    argument_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Number of rows of every run")
+    argument_parser.add_argument("--latency", type=float, default=0.0, help="Latency of every fake query in seconds")
+    argument_parser.add_argument("--output", help="Saves the results as JSON")
+    argument_parser.add_argument("--baseline", help="Compares the results with saved results")
+    argument_parser.add_argument("--tolerance", type=float, default=0.2, help="Tolerated throughput drop compared to the baseline")
+    argument_parser.add_argument("--no-memory", action="store_true", help="Does not measure the peak memory")
+    argument_parser.add_argument("--graph-parser", action="store_true", help="Compares the row-wise and the batch knowledge graph parser")
+    argument_parser.add_argument("--event-memory", type=int, help="Compares the memory of the event representations for this number of events")
+    argument_parser.add_argument("--feature-factory", action="store_true", help="Compares the per-row and the batch feature creation")
+    argument_parser.add_argument("--workers", type=int, default=4, help="Number of worker processes of the batch feature creation")
+    arguments = argument_parser.parse_args()
+
+    if arguments.graph_parser:
+        for count in arguments.sizes:
+            result = benchmark_graph_parser(count)
+            print("Graph parser {documents} documents, {rows} rows: entry {entry_rows_per_second:.0f} rows/s, batch {batch_rows_per_second:.0f} rows/s, speedup {speedup:.1f}x".format(**result))
+    elif arguments.feature_factory:
+        for count in arguments.sizes:
+            result = benchmark_feature_factory(count, arguments.workers)
+            print("Feature factory {features} events: row {row_features_per_second:.0f} features/s, columns {columns_features_per_second:.0f} features/s, GeoPackage columns {geopackage_columns_features_per_second:.0f} features/s, {workers} processes {process_pool_columns_features_per_second:.0f} features/s, speedup {speedup:.1f}x".format(**result))
+    elif arguments.event_memory:
+        result = benchmark_event_memory(arguments.event_memory)
+        print("Event memory {events} events: legacy {legacy_bytes_per_event:.0f} bytes/event, slotted {slotted_bytes_per_event:.0f} bytes/event, views {views_bytes_per_event:.0f} bytes/event, batch {batch_bytes_per_event:.0f} bytes/event".format(**result))
+    else:
+        results = run_benchmarks(arguments.sizes, latency=arguments.latency, trace_memory=not arguments.no_memory)
+        print_results(results)
+        if arguments.output:
+            save_results(results, arguments.output)
+        if arguments.baseline:
+            regressions = compare_results(load_results(arguments.baseline), results, arguments.tolerance)
+            for regression in regressions:
+                print("Regression {pipeline} {size} {stage}: {rows_per_second:.0f} rows/s instead of {baseline_rows_per_second:.0f} rows/s".format(**regression))
+            if regressions:
+                raise SystemExit(1)
@@ -0,0 +1,442 @@
+# GEOINT Toolbox is a python toolbox for geospatial intelligence workflows.
+# Copyright (C) 2020 Esri Deutschland GmbH
+# Jan Tschada (j.tschada@esri.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Additional permission under GNU LGPL version 3 section 4 and 5
+# If you modify this Program, or any covered work, by linking or combining
+# it with ArcGIS (or a modified version of these libraries),
+# containing parts covered by the terms of ArcGIS libraries,
+# the licensors of this Program grant you additional permission to convey the resulting work.
+# See <https://developers.arcgis.com/> for further information.
+#
+
+"""
+Fakes and synthetic data for running the GEOINT module offline.
+The fakes replace Google BigQuery and arcpy in benchmarks and tests.
+"""
+
+import concurrent.futures
+import os
+import random
+import re
+import sys
+import threading
+import time
+import types
+import zipfile
+from google.cloud.bigquery.table import Row
+from geoint.gdelt_grid import gdelt_grid
+from geoint.gdelt_schema import create_event_columns, create_graph_columns
+
+
+def create_event_records(count, first_id=0, seed=42):
+    """Creates synthetic GDELT event records like returned by BigQuery.
+    The identifiers, locations, scores and URLs differ for every record.
+    """
+    random_state = random.Random(seed + first_id)
+    field_to_index = {name: index for (index, name) in enumerate(create_event_columns())}
+    records = []
+    for event_id in range(first_id, first_id + count):
+        latitude = round(random_state.uniform(-90, 90), 4)
+        longitude = round(random_state.uniform(-180, 180), 4)
+        values = [event_id + 900000000, 20200301, 202003, 2020, 2020.1644]
+        values += ["DEU", "GERMANY", "DEU", None, None, None, None, "GOV", None, None]
+        values += ["USA", "UNITED STATES", "USA", None, None, None, None, None, None, None]
+        values += [1, "042", "042", "04", 1, round(random_state.uniform(-10, 10), 1), random_state.randint(1, 500), random_state.randint(1, 50), random_state.randint(1, 500), random_state.uniform(-20, 20)]
+        values += [4, "Berlin, Germany", "GM", "GM16", None, latitude, longitude, "-1746443"]
+        values += [1, "United States", "US", "US", None, 39.8, -98.5, "US"]
+        values += [4, "Location {0}".format(event_id % 1000), "GM", "GM16", None, latitude, longitude, str(event_id % 1000)]
+        values += [20200301000000 + random_state.randint(0, 23) * 10000, "https://example.com/{0}".format(event_id)]
+        records.append(Row(tuple(values), field_to_index))
+    return records
+
+def create_bin_records(event_records, grid):
+    """Aggregates event records into the cells of a grid like the aggregating queries of BigQuery.
+    """
+    cells = {}
+    for record in event_records:
+        cell = grid.locate(record["ActionGeo_Long"], record["ActionGeo_Lat"])
+        values = cells.setdefault(cell, [cell, 0, 0, 0.0, 0, 0.0, 0.0, None, None, 0, 0, 0, 0])
+        values[1] += 1
+        values[2] += 1
+        values[3] += record["AvgTone"]
+        goldstein = record["GoldsteinScale"]
+        values[4] += 1
+        values[5] += goldstein
+        values[6] += goldstein * goldstein
+        values[7] = goldstein if values[7] is None else min(values[7], goldstein)
+        values[8] = goldstein if values[8] is None else max(values[8], goldstein)
+        values[8 + record["QuadClass"]] += 1
+    field_to_index = {name: index for (index, name) in enumerate(gdelt_grid.COLUMNS)}
+    return [Row(tuple(values), field_to_index) for values in cells.values()]
+
+def create_graph_records(count, locations_per_document=5, seed=42, themes="TERROR"):
+    """Creates synthetic GDELT knowledge graph records.
+    Every record contains GKGRECORDID, V2Locations, DATE, SourceCommonName, DocumentIdentifier and the matched Themes.
+    """
+    random_state = random.Random(seed)
+    records = []
+    for index in range(count):
+        locations = []
+        for location_index in range(locations_per_document):
+            latitude = round(random_state.uniform(-90, 90), 4)
+            longitude = round(random_state.uniform(-180, 180), 4)
+            locations.append("{0}#Location {1}, Country#CC#CC{2:02d}##{3}#{4}#{5}#{6}".format(
+                random_state.randint(1, 5), location_index, random_state.randint(1, 99), latitude, longitude, random_state.randint(-99999, 99999), random_state.randint(0, 5000)))
+        timestamp = 20200301000000 + random_state.randint(0, 23) * 10000 + random_state.randint(0, 3) * 1500
+        records.append(("20200301{0:06d}-{1}".format(index // 100, index % 100), ";".join(locations), timestamp, "example.com", "https://example.com/{0}".format(index), themes))
+    return records
+
+def write_export_file(path, event_records, zipped=False):
+    """Writes event records into a tab-delimited GDELT 2.0 export file.
+    Missing values are written as empty columns and a zipped file contains a single member.
+    """
+    lines = ["\t".join("" if value is None else str(value) for value in record.values()) for record in event_records]
+    _write_lines(path, lines, zipped)
+
+def write_graph_file(path, graph_records, themes, zipped=False):
+    """Writes knowledge graph records into a tab-delimited GDELT 2.0 knowledge graph file.
+    The themes are the V2Themes of the records and all the other columns are left empty.
+    """
+    lines = []
+    for (record, record_themes) in zip(graph_records, themes):
+        values = [""] * 27
+        values[0] = record[0]
+        values[1] = str(record[2])
+        values[2] = "1"
+        values[3] = record[3]
+        values[4] = record[4]
+        values[8] = ";".join("{0},{1}".format(theme, offset * 100) for (offset, theme) in enumerate(record_themes))
+        values[10] = record[1]
+        lines.append("\t".join(values))
+    _write_lines(path, lines, zipped)
+
+def _write_lines(path, lines, zipped):
+    content = "".join(line + "\n" for line in lines).encode("utf-8")
+    if zipped:
+        member_name = path[:-len(".zip")] if path.endswith(".zip") else path
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(os.path.basename(member_name), content)
+    else:
+        with open(path, "wb") as file:
+            file.write(content)
+
+
+
+class fake_schema_field(object):
+    """Represents a schema field of a fake query result.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+
+
+class fake_row_iterator(object):
+    """Iterates over the pages of a fake query result.
+    """
+
+    def __init__(self, records, column_names, page_size):
+        self._records = records
+        self._page_size = page_size if page_size else 10000
+        self.schema = [fake_schema_field(name) for name in column_names]
+        self.total_rows = len(records)
+
+    def __get_pages(self):
+        for index in range(0, len(self._records), self._page_size):
+            yield self._records[index:index + self._page_size]
+
+    pages = property(__get_pages)
+
+
+
+class fake_query_job(object):
+    """Represents a fake query job waiting for the injected latency.
+    """
+
+    def __init__(self, records, column_names, latency):
+        self._records = records
+        self._column_names = column_names
+        self._latency = latency
+        self.total_bytes_processed = 1024 * len(records)
+        self.total_bytes_billed = 1024 * len(records)
+        self.cache_hit = False
+        self.slot_millis = int(1000 * latency)
+        self.cancelled = False
+        self._cancel_event = threading.Event()
+        self._finished_at = time.perf_counter() + latency
+
+    def result(self, timeout=None, page_size=None):
+        remaining = self._finished_at - time.perf_counter()
+        if timeout is not None and timeout < remaining:
+            if self._cancel_event.wait(timeout):
+                raise concurrent.futures.CancelledError()
+            raise concurrent.futures.TimeoutError()
+        # A cancelled job stops waiting like BigQuery does
+        if self._cancel_event.wait(max(0.0, remaining)):
+            raise concurrent.futures.CancelledError()
+        return fake_row_iterator(self._records, self._column_names, page_size)
+
+    def cancel(self):
+        self.cancelled = True
+        self._cancel_event.set()
+        return True
+
+
+
+class fake_bigquery_client(object):
+    """Fake BigQuery client returning synthetic GDELT records for every query.
+    Queries of the knowledge graph return graph records, all other queries return event records.
+    The projected columns of event queries are honoured and aggregating queries return the cells of the events.
+    The latency is either the same for all queries or a list of the latencies of the consecutive queries.
+    When graph documents are set, queries of the knowledge graph are evaluated against them like write_graph_file writes them.
+    """
+
+    def __init__(self, records_per_query=10, latency=0.0, locations_per_document=5, graph_documents=None):
+        self._records_per_query = records_per_query
+        self._latency = latency
+        self._locations_per_document = locations_per_document
+        self._graph_documents = graph_documents
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.queries = []
+        self.jobs = []
+
+    def query(self, query, job_config=None):
+        with self._lock:
+            self.queries.append(query)
+            first_id = self._next_id
+            self._next_id += self._records_per_query
+            latency = self._latency[len(self.queries) - 1] if isinstance(self._latency, list) else self._latency
+        query_job = self._create_job(query, first_id, latency)
+        with self._lock:
+            self.jobs.append(query_job)
+        return query_job
+
+    def _create_job(self, query, first_id, latency):
+        if "gkg_partitioned" in query:
+            graph_columns = create_graph_columns()
+            field_to_index = {name: index for (index, name) in enumerate(graph_columns)}
+            # Every document matches all queried themes
+            themes = re.findall(r"'([A-Za-z0-9_]+)'", re.search(r"WHERE theme IN \(([^)]*)\)", query).group(1))
+            if self._graph_documents is not None:
+                return fake_query_job([Row(record, field_to_index) for record in self._select_graph_records(query, themes)], graph_columns, latency)
+            records = [Row(record, field_to_index) for record in create_graph_records(self._records_per_query, self._locations_per_document, first_id, ";".join(themes))]
+            return fake_query_job(records, graph_columns, latency)
+
+        records = create_event_records(self._records_per_query, first_id)
+        if " GROUP BY cell" in query:
+            geohash_match = re.search(r"ST_GEOGPOINT\(ActionGeo_Long, ActionGeo_Lat\), (\d+)\)", query)
+            if geohash_match:
+                grid = gdelt_grid(geohash_precision=int(geohash_match.group(1)))
+            else:
+                grid = gdelt_grid(float(re.search(r"FLOOR\(ActionGeo_Long / ([0-9.]+)\)", query).group(1)))
+            return fake_query_job(create_bin_records(records, grid), gdelt_grid.COLUMNS, latency)
+        projection = query[len("SELECT "):query.index(" FROM ")]
+        if "*" == projection:
+            return fake_query_job(records, create_event_columns(), latency)
+        column_names = projection.split(", ")
+        field_to_index = {name: index for (index, name) in enumerate(column_names)}
+        records = [Row(tuple(record[name] for name in column_names), field_to_index) for record in records]
+        return fake_query_job(records, column_names, latency)
+
+    def _select_graph_records(self, query, themes):
+        day_key = "".join(re.search(r"DATE\(_PARTITIONTIME\) = '(\d{4})-(\d{2})-(\d{2})'", query).groups())
+        since_match = re.search(r" AND DATE >= (\d+)", query)
+        limit_match = re.search(r" LIMIT (\d+)$", query)
+        records = []
+        for (record, document_themes) in self._graph_documents:
+            if not record[1] or not str(record[2]).startswith(day_key):
+                continue
+            if since_match and record[2] < int(since_match.group(1)):
+                continue
+            matched_themes = [theme for theme in themes if theme in document_themes]
+            if matched_themes:
+                records.append(record[:5] + (";".join(sorted(matched_themes)),))
+        if limit_match:
+            records = records[:int(limit_match.group(1))]
+        return records
+
+
+
+class fake_point(object):
+    """Represents a point of the fake arcpy module.
+    """
+
+    def __init__(self, X=0.0, Y=0.0):
+        self.X = X
+        self.Y = Y
+
+
+
+class fake_extent(object):
+    """Represents an extent of the fake arcpy module.
+    """
+
+    def __init__(self, XMin, YMin, XMax, YMax):
+        self.XMin = XMin
+        self.YMin = YMin
+        self.XMax = XMax
+        self.YMax = YMax
+
+
+
+class fake_array(list):
+    """Represents an array of points or arrays of the fake arcpy module.
+    """
+
+
+
+class fake_polygon(object):
+    """Represents a polygon of the fake arcpy module.
+    The polygon is created from an array of points or an array of rings like arcpy does.
+    """
+
+    def __init__(self, inputs, spatial_reference=None):
+        rings = inputs if inputs and isinstance(inputs[0], list) else [inputs]
+        self._rings = [[(float(point.X), float(point.Y)) for point in ring] for ring in rings]
+        self.spatialReference = spatial_reference
+        x = [x for ring in self._rings for (x, y) in ring]
+        y = [y for ring in self._rings for (x, y) in ring]
+        self.extent = fake_extent(min(x), min(y), max(x), max(y))
+
+    def __iter__(self):
+        # The rings of a part are separated by None
+        part = []
+        for ring in self._rings:
+            if part:
+                part.append(None)
+            part += [fake_point(x, y) for (x, y) in ring]
+        return iter([part])
+
+    def disjoint(self, point):
+        inside = False
+        for ring in self._rings:
+            for index in range(len(ring)):
+                (x1, y1) = ring[index - 1]
+                (x2, y2) = ring[index]
+                if (y1 > point.Y) != (y2 > point.Y) and point.X < (x2 - x1) * (point.Y - y1) / (y2 - y1) + x1:
+                    inside = not inside
+        return not inside
+
+
+
+class fake_field(object):
+    """Represents a field of the fake arcpy module.
+    """
+
+    def __init__(self, name, type):
+        self.name = name
+        self.type = type
+
+
+
+class fake_insert_cursor(object):
+    """Inserts rows into an in-memory table of the fake arcpy module.
+    """
+
+    def __init__(self, table, field_names):
+        self._table = table
+        self._field_names = list(field_names)
+        for field_name in self._field_names:
+            if not field_name.startswith("SHAPE@") and field_name not in table["fields"]:
+                raise RuntimeError("Cannot find field '{0}'".format(field_name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def insertRow(self, row):
+        if len(row) != len(self._field_names):
+            raise RuntimeError("Sequence size must match size of the row")
+        self._table["rows"].append(dict(zip(self._field_names, row)))
+
+
+
+class fake_search_cursor(object):
+    """Reads rows from an in-memory table of the fake arcpy module.
+    """
+
+    def __init__(self, table, field_names, spatial_reference=None):
+        self._table = table
+        self._field_names = list(field_names)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __iter__(self):
+        for row in self._table["rows"]:
+            yield tuple(row.get(field_name) for field_name in self._field_names)
+
+
+
+def create_fake_arcpy():
+    """Creates a fake arcpy module storing feature classes in memory.
+    Only the functions used by the GEOINT module are supported.
+    """
+    arcpy = types.ModuleType("arcpy")
+    arcpy.__fake__ = True
+    tables = {}
+    messages = []
+
+    def get_table(path):
+        if path not in tables:
+            raise RuntimeError("Dataset {0} does not exist or is not supported".format(path))
+        return tables[path]
+
+    def create_featureclass(out_path, out_name, geometry_type="POINT", spatial_reference=None):
+        path = "{0}/{1}".format(out_path, out_name).replace("\\", "/")
+        tables[path] = {"fields": {}, "rows": []}
+        return [path]
+
+    def add_fields(in_table, field_description):
+        table = get_table(in_table.replace("\\", "/"))
+        for field in field_description:
+            table["fields"][field[0]] = field[1]
+
+    arcpy.Point = fake_point
+    arcpy.Array = fake_array
+    arcpy.Polygon = fake_polygon
+    arcpy.SpatialReference = lambda factory_code: factory_code
+    arcpy.Exists = lambda path: path.replace("\\", "/") in tables
+    arcpy.ListFields = lambda path: [fake_field(name, type) for (name, type) in get_table(path.replace("\\", "/"))["fields"].items()]
+    arcpy.AddMessage = lambda message: messages.append(("message", str(message)))
+    arcpy.AddWarning = lambda message: messages.append(("warning", str(message)))
+    arcpy.AddError = lambda message: messages.append(("error", str(message)))
+    arcpy.env = types.SimpleNamespace(overwriteOutput=True, scratchGDB="memory")
+    arcpy.messages = messages
+    arcpy.tables = tables
+    arcpy.management = types.SimpleNamespace(CreateFeatureclass=create_featureclass, AddFields=add_fields, Delete=lambda in_data: tables.pop(in_data.replace("\\", "/")))
+    arcpy.da = types.SimpleNamespace(
+        InsertCursor=lambda in_table, field_names: fake_insert_cursor(get_table(in_table.replace("\\", "/")), field_names),
+        SearchCursor=lambda in_table, field_names, spatial_reference=None: fake_search_cursor(get_table(in_table.replace("\\", "/")), field_names, spatial_reference))
+    return arcpy
+
+def install_fake_arcpy():
+    """Installs the fake arcpy module when arcpy is not available.
+    Returns whether the fake module was installed.
+    """
+    try:
+        import arcpy
+        return getattr(arcpy, "__fake__", False)
+    except ImportError:
+        sys.modules["arcpy"] = create_fake_arcpy()
+        return True
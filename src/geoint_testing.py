@@ -28,11 +28,41 @@ Please set GOOGLE_APPLICATION_CREDENTIALS or explicitly create credentials and r
 For more information, please see https://cloud.google.com/docs/authentication/getting-started.
 """
 
+import concurrent.futures
 import datetime
+import json
+import numpy
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
-from geoint.gdelt_client import gdelt_client
-from geoint.gdelt_feature_factory import gdelt_feature_factory
+from google.cloud.bigquery.table import Row
+from geoint_fakes import install_fake_arcpy
+
+# The offline tests use the fake arcpy module when ArcGIS is not installed
+install_fake_arcpy()
+
+from geoint.gdelt_batch import convert_timestamps, gdelt_event_batch, gdelt_graph_batch
+from geoint.gdelt_cache import gdelt_cache
+from geoint.gdelt_client import gdelt_client, gdelt_event, gdelt_graph_entry, gdelt_query_planner
+from geoint.gdelt_cube import gdelt_space_time_cube
+from geoint.gdelt_dedup import bloom_key_filter, exact_key_filter, gdelt_deduplicator
+from geoint.gdelt_feature_factory import arcpy_point_backend, gdelt_feature_columns, gdelt_feature_factory, geopackage_point_backend
+from geoint.gdelt_files import gdelt_file_client
+from geoint.gdelt_grid import decode_geohash, encode_geohash, gdelt_grid
+from geoint.gdelt_instrumentation import gdelt_instrumentation
+from geoint.gdelt_pool import gdelt_client_pool, get_client_pool
+from geoint.gdelt_progress import gdelt_cancellation_token, gdelt_cancelled_error, gdelt_progress, gdelt_timeout_error
+from geoint.gdelt_query import gdelt_query_builder
+from geoint.gdelt_schema import create_bin_fields, create_cube_fields, create_event_columns, create_event_fields
+from geoint.gdelt_spatial import gdelt_aoi_index, numpy_geometry_backend
 from geoint.gdelt_workspace import gdelt_workspace
+from geoint.gdelt_writer import arcpy_feature_writer, geopackage_feature_writer
+from geoint_benchmark import benchmark_feature_factory, compare_results
+from geoint_fakes import create_bin_records, create_event_records, create_fake_arcpy, create_graph_records, fake_array, fake_bigquery_client, fake_point, fake_polygon, write_export_file, write_graph_file
 
 @unittest.skip("Disable GDELT event queries for default testing.")
 class TestGdeltQueries(unittest.TestCase):
@@ -41,6 +71,23 @@ class TestGdeltQueries(unittest.TestCase):
         # Recreate the client before any test
         self._client = gdelt_client()
 
+    def test_gdelt_query_bboxes(self):
+        date = datetime.date.today()
+        bboxes = [
+            { "xmin": -10, "xmax": 10, "ymin": -10, "ymax": 10 },
+            { "xmin": 0, "xmax": 20, "ymin": 0, "ymax": 20 }
+        ]
+        gdelt_events = self._client.query_bboxes(date, bboxes, limit=10)
+        self.assertLessEqual(len(gdelt_events), 10, "The limit must be applied globally!")
+        event_ids = [gdelt_event.id for gdelt_event in gdelt_events]
+        self.assertEqual(len(event_ids), len(set(event_ids)), "The events must not be duplicated!")
+
+    def test_gdelt_dry_run(self):
+        date = datetime.date.today()
+        all_fields = gdelt_query_builder(date)
+        selected_fields = gdelt_query_builder(date).select(["EventRootCode", "QuadClass", "GoldsteinScale", "SOURCEURL"])
+        self.assertLess(self._client.dry_run(selected_fields), self._client.dry_run(all_fields), "Projected queries must scan less bytes!")
+
     def test_gdelt_query_today(self):
         gdelt_events = self._client.query_today(limit=10)
         self.assertIsNotNone(gdelt_events, "The events must not be none!")
@@ -56,6 +103,17 @@ class TestGdeltQueries(unittest.TestCase):
             self.assertIsNotNone(gdelt_event.id, "The event ID must not be none!")
             self.assertIsNotNone(gdelt_event.location, "The location must not be none!")
 
+    def test_gdelt_iter_query_today(self):
+        date = datetime.date.today()
+        gdelt_events = self._client.iter_query(date, limit=10, page_size=3)
+        self.assertIsNotNone(gdelt_events, "The events must not be none!")
+        count = 0
+        for gdelt_event in gdelt_events:
+            self.assertIsNotNone(gdelt_event.id, "The event ID must not be none!")
+            self.assertIsNotNone(gdelt_event.location, "The location must not be none!")
+            count += 1
+        self.assertLessEqual(count, 10, "The limit must be respected!")
+
     def test_gdelt_query_bbox(self):
         date = datetime.date.today()
         bbox = { "xmin": -180, "xmax": 180, "ymin": -90, "ymax": 90 }
@@ -66,7 +124,7 @@ class TestGdeltQueries(unittest.TestCase):
 
 
 
-#@unittest.skip("Disable GDELT graph queries for default testing.")
+@unittest.skipUnless(os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"), "GDELT graph queries need Google Cloud credentials.")
 class TestGdeltGraphQueries(unittest.TestCase):
 
     def setUp(self):
@@ -83,6 +141,1138 @@ class TestGdeltGraphQueries(unittest.TestCase):
             self.assertIsNotNone(gdelt_graph_record.location, "The location must not be none!")
             self.assertIsNotNone(gdelt_graph_record.values, "The values must not be none!")
 
+    def test_gdelt_iter_query_graph_today(self):
+        date = datetime.date.today()
+        theme = "ARMEDCONFLICT"
+        gdelt_graph_records = self._client.iter_query_graph(date, theme, limit=10, page_size=3)
+        self.assertIsNotNone(gdelt_graph_records, "The events must not be none!")
+        for gdelt_graph_record in gdelt_graph_records:
+            self.assertIsNotNone(gdelt_graph_record.id, "The event ID must not be none!")
+            self.assertIsNotNone(gdelt_graph_record.location, "The location must not be none!")
+
+
+
+class TestGdeltCache(unittest.TestCase):
+
+    def setUp(self):
+        # Recreate the cache before any test
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._cache = gdelt_cache(self._temp_dir.name)
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _store(self, cache, key, date, pages):
+        cache_writer = cache.store(key, date)
+        for page in pages:
+            cache_writer.write_page(["GLOBALEVENTID", "SOURCEURL"], page)
+        cache_writer.commit()
+
+    def test_create_key_normalized(self):
+        bbox = { "xmin": -10, "xmax": 10, "ymin": -5, "ymax": 5 }
+        other_bbox = { "ymax": 5.0, "ymin": -5.0, "xmax": 10.0, "xmin": -10.0 }
+        key = gdelt_cache.create_key("events", datetime.date(2020, 3, 1), bbox=bbox, limit=10)
+        self.assertEqual(key, gdelt_cache.create_key("events", "2020-03-01", bbox=other_bbox, limit=10), "Equal queries must share the key!")
+        self.assertNotEqual(key, gdelt_cache.create_key("events", "2020-03-01", bbox=bbox, limit=20), "The limit must be part of the key!")
+
+    def test_cache_hit_and_miss(self):
+        key = gdelt_cache.create_key("events", "2020-03-01", limit=10)
+        self.assertIsNone(self._cache.lookup(key), "The cache must be empty!")
+        self._store(self._cache, key, "2020-03-01", [[(1, "a"), (2, "b")], [(3, None)]])
+        pages = list(self._cache.lookup(key))
+        self.assertEqual(2, len(pages), "The pages must be preserved!")
+        self.assertEqual(["GLOBALEVENTID", "SOURCEURL"], pages[0][0], "The field names must be preserved!")
+        self.assertEqual([(1, "a"), (2, "b")], pages[0][1], "The rows must be preserved!")
+        self.assertEqual([(3, None)], pages[1][1], "The rows must be preserved!")
+        statistics = self._cache.statistics
+        self.assertEqual(1, statistics["hits"], "One lookup must hit!")
+        self.assertEqual(1, statistics["misses"], "One lookup must miss!")
+
+    def test_cache_persistent(self):
+        key = gdelt_cache.create_key("events", "2020-03-01", limit=10)
+        self._store(self._cache, key, "2020-03-01", [[(1, "a")]])
+        other_cache = gdelt_cache(self._temp_dir.name)
+        self.assertIsNotNone(other_cache.lookup(key), "The entry must be persistent!")
+
+    def test_cache_discard(self):
+        key = gdelt_cache.create_key("events", "2020-03-01", limit=10)
+        cache_writer = self._cache.store(key, "2020-03-01")
+        cache_writer.write_page(["GLOBALEVENTID"], [(1,)])
+        cache_writer.discard()
+        self.assertIsNone(self._cache.lookup(key), "Discarded entries must not be cached!")
+
+    def test_cache_today_expires(self):
+        cache = gdelt_cache(self._temp_dir.name, today_ttl=datetime.timedelta(seconds=0))
+        today_key = gdelt_cache.create_key("events", datetime.date.today(), limit=10)
+        past_key = gdelt_cache.create_key("events", "2020-03-01", limit=10)
+        self._store(cache, today_key, datetime.date.today(), [[(1, "a")]])
+        self._store(cache, past_key, "2020-03-01", [[(1, "a")]])
+        time.sleep(0.01)
+        self.assertIsNone(cache.lookup(today_key), "Today's entries must expire!")
+        self.assertIsNotNone(cache.lookup(past_key), "Past entries must not expire!")
+
+    def test_cache_least_recently_used_eviction(self):
+        keys = [gdelt_cache.create_key("events", "2020-03-01", limit=limit) for limit in range(3)]
+        self._store(self._cache, keys[0], "2020-03-01", [[(1, "a")]])
+        entry_size = self._cache.statistics["size"]
+        cache = gdelt_cache(self._temp_dir.name, max_size=2 * entry_size + entry_size // 2)
+        time.sleep(0.01)
+        self._store(cache, keys[1], "2020-03-01", [[(1, "a")]])
+        time.sleep(0.01)
+        self.assertIsNotNone(cache.lookup(keys[0]), "The first entry must be cached!")
+        time.sleep(0.01)
+        self._store(cache, keys[2], "2020-03-01", [[(1, "a")]])
+        self.assertIsNotNone(cache.lookup(keys[0]), "The recently used entry must be kept!")
+        self.assertIsNone(cache.lookup(keys[1]), "The least recently used entry must be evicted!")
+        self.assertEqual(1, cache.statistics["evictions"], "One entry must be evicted!")
+
+    def test_cache_filled_limit(self):
+        # Every day fills the server-side limit
+        for (end_date, limit) in [(None, 10), (datetime.date(2020, 3, 3), 30)]:
+            client = gdelt_client(self._cache, client=fake_bigquery_client(records_per_query=10))
+            self.assertEqual(limit, len(client.query(datetime.date(2020, 3, 1), limit=limit, end_date=end_date)), "The limit must be filled!")
+            queries = len(client._client.queries)
+            self.assertEqual(limit, len(client.query(datetime.date(2020, 3, 1), limit=limit, end_date=end_date)), "The cached result must fill the limit!")
+            self.assertEqual(queries, len(client._client.queries), "A result filling the limit must be cached!")
+        self.assertLess(0, self._cache.statistics["hits"], "The repeated queries must hit the cache!")
+
+
+
+def create_event_values(event_id, longitude=13.4, latitude=52.5):
+    """Creates the values of a synthetic GDELT event record.
+    """
+    values = [event_id, 20200301, 202003, 2020, 2020.1644]
+    values += ["DEU", "GERMANY", "DEU", None, None, None, None, "GOV", None, None]
+    values += ["USA", "UNITED STATES", "USA", None, None, None, None, None, None, None]
+    values += [1, "042", "042", "04", 1, 1.9, 10, 2, 10, -1.5]
+    values += [4, "Berlin, Germany", "GM", "GM16", None, latitude, longitude, "-1746443"]
+    values += [1, "United States", "US", "US", None, 39.8, -98.5, "US"]
+    values += [4, "Berlin, Germany", "GM", "GM16", None, latitude, longitude, "-1746443"]
+    values += [20200301121500, "https://example.com/{0}".format(event_id)]
+    return tuple(values)
+
+
+
+class TestGdeltDateRangeQueries(unittest.TestCase):
+
+    def test_query_single_date(self):
+        client = gdelt_client(client=fake_bigquery_client())
+        gdelt_events = client.query(datetime.date(2020, 3, 1), limit=10)
+        self.assertEqual(10, len(gdelt_events), "All events must be returned!")
+        self.assertEqual(1, len(client._client.queries), "One partition must be queried!")
+
+    def test_query_date_range(self):
+        client = gdelt_client(client=fake_bigquery_client())
+        gdelt_events = client.query(datetime.date(2020, 3, 1), limit=100, end_date=datetime.date(2020, 3, 4))
+        self.assertEqual(40, len(gdelt_events), "The events of all days must be returned!")
+        self.assertEqual(40, len(set(gdelt_event.id for gdelt_event in gdelt_events)), "The events of all days must be merged!")
+        queried_dates = sorted(query.split("'")[1] for query in client._client.queries)
+        self.assertEqual(["2020-03-01", "2020-03-02", "2020-03-03", "2020-03-04"], queried_dates, "Every day must be queried!")
+
+    def test_query_date_range_global_limit(self):
+        client = gdelt_client(client=fake_bigquery_client(), max_workers=2)
+        gdelt_events = list(client.iter_query(datetime.date(2020, 3, 1), limit=25, page_size=3, end_date=datetime.date(2020, 3, 10)))
+        self.assertEqual(25, len(gdelt_events), "The limit must be applied to all days!")
+
+    def test_query_date_range_batches(self):
+        client = gdelt_client(client=fake_bigquery_client())
+        batches = list(client.iter_query_batches(datetime.date(2020, 3, 1), limit=100, page_size=4, end_date=datetime.date(2020, 3, 2)))
+        self.assertEqual(20, sum(len(batch) for batch in batches), "The batches of all days must be returned!")
+
+    def test_query_date_range_concurrent(self):
+        latency = 0.2
+        client = gdelt_client(client=fake_bigquery_client(latency=latency), max_workers=8)
+        start = time.perf_counter()
+        gdelt_events = client.query(datetime.date(2020, 3, 1), limit=1000, end_date=datetime.date(2020, 3, 8))
+        elapsed = time.perf_counter() - start
+        self.assertEqual(80, len(gdelt_events), "The events of all days must be returned!")
+        self.assertLess(elapsed, 4 * latency, "The days must be queried concurrently!")
+
+    def test_stop_early(self):
+        # One day returns soon, the other day keeps running in BigQuery
+        client = gdelt_client(client=fake_bigquery_client(latency=[0.2, 5.0]), max_workers=2)
+        start = time.perf_counter()
+        gdelt_events = client.query(datetime.date(2020, 3, 1), limit=5, end_date=datetime.date(2020, 3, 2))
+        self.assertEqual(5, len(gdelt_events), "The limit must be applied!")
+        self.assertLess(time.perf_counter() - start, 2.0, "The running job must not be awaited!")
+        self.assertEqual(2, len(client._client.jobs), "Both days must be queried!")
+        self.assertTrue(any(job.cancelled for job in client._client.jobs), "The running BigQuery job must be cancelled!")
+
+    def test_invalid_date_range(self):
+        client = gdelt_client(client=fake_bigquery_client())
+        with self.assertRaises(ValueError):
+            client.query(datetime.date(2020, 3, 2), end_date=datetime.date(2020, 3, 1))
+
+
+
+class TestGdeltEventBatch(unittest.TestCase):
+
+    def test_create_batch(self):
+        records = [create_event_values(event_id) for event_id in range(5)]
+        batch = gdelt_event_batch.from_records(records)
+        self.assertEqual(5, len(batch), "The batch must contain all records!")
+        self.assertEqual(61, len(batch.columns), "The batch must contain all fields!")
+        self.assertEqual([0, 1, 2, 3, 4], batch.ids.tolist(), "The IDs must be preserved!")
+        self.assertEqual("int64", str(batch.column("QuadClass").dtype), "LONG fields must be integer arrays!")
+        self.assertEqual("float64", str(batch.column("GoldsteinScale").dtype), "DOUBLE fields must be float arrays!")
+        self.assertEqual("20200301121500", batch.column("DATEADDED")[0], "DATEADDED must be converted to text!")
+        (x, y) = batch.locations
+        self.assertEqual(13.4, x[0], "The longitude must be the x coordinate!")
+        self.assertEqual(52.5, y[0], "The latitude must be the y coordinate!")
+
+    def test_column_lists(self):
+        records = [create_event_values(event_id) for event_id in range(3)]
+        values = list(records[1])
+        values[35] = None
+        values[40] = None
+        records[1] = tuple(values)
+        batch = gdelt_event_batch.from_records(records)
+        column_lists = batch.column_lists()
+        self.assertIsNone(column_lists[35][1], "NULL LONG values must be preserved!")
+        self.assertIsNone(column_lists[40][1], "NULL DOUBLE values must be preserved!")
+        self.assertIsNone(column_lists[8][1], "NULL TEXT values must be preserved!")
+        self.assertEqual(4, column_lists[35][0], "LONG values must be preserved!")
+        self.assertEqual(list(records[0][:59]), [column[0] for column in column_lists[:59]], "The values must be preserved!")
+
+    def test_null_dateadded(self):
+        records = [create_event_values(event_id) for event_id in range(3)]
+        records[1] = records[1][:59] + (None,) + records[1][60:]
+        batch = gdelt_event_batch.from_records(records)
+        self.assertEqual(["20200301121500", None, "20200301121500"], batch.column_lists()[59], "NULL DATEADDED values must be preserved!")
+        cube = gdelt_space_time_cube(1.0, "day")
+        cube.add_batch(batch)
+        self.assertEqual(1, cube.skipped, "Events without DATEADDED must not be binned!")
+
+    def test_select(self):
+        records = [create_event_values(event_id) for event_id in range(4)]
+        batch = gdelt_event_batch.from_records(records)
+        selected_batch = batch.select(batch.ids % 2 == 0)
+        self.assertEqual([0, 2], selected_batch.ids.tolist(), "Only selected records must be returned!")
+
+    def test_records(self):
+        field_to_index = {name: index for (index, name) in enumerate(create_event_columns())}
+        records = [Row(create_event_values(event_id), field_to_index) for event_id in range(3)]
+        batch = gdelt_event_batch.from_records(records)
+        for (record, batch_record) in zip(records, batch.records()):
+            event = gdelt_event(record)
+            self.assertFalse(hasattr(event, "__dict__"), "The event must not have an instance dictionary!")
+            self.assertEqual(event.id, batch_record.id, "The ID of the view must match!")
+            self.assertEqual(event.location, batch_record.location, "The location of the view must match!")
+            self.assertEqual(event.fullname, batch_record.fullname, "The full name of the view must match!")
+            self.assertEqual(event.values, batch_record.values, "The values of the view must match!")
+        event = gdelt_event(records[0])
+        self.assertEqual("20200301121500", event.values[59], "DATEADDED must be converted to text!")
+        event.location = (0.0, 0.0)
+        self.assertEqual((0.0, 0.0), event.location, "The location must be changeable!")
+
+    def test_empty_batch(self):
+        batch = gdelt_event_batch.from_records([])
+        self.assertEqual(0, len(batch), "The batch must be empty!")
+        self.assertEqual(61, len(batch.column_lists()), "The batch must contain all fields!")
+
+
+
+class TestGdeltAoiIndex(unittest.TestCase):
+
+    def setUp(self):
+        square = [[(0, 0), (10, 0), (10, 10), (0, 10)]]
+        square_with_hole = [[(20, 0), (30, 0), (30, 10), (20, 10)], [(22, 2), (28, 2), (28, 8), (22, 8)]]
+        triangle = [[(40, 0), (50, 0), (40, 10)]]
+        self._areas = [square, square_with_hole, triangle]
+
+    def test_numpy_backend_contains(self):
+        backend = numpy_geometry_backend()
+        x = numpy.array([5, 15, 21, 25, 41, 49])
+        y = numpy.array([5, 5, 5, 5, 1, 9])
+        self.assertEqual([True, False], backend.contains(self._areas[0], x[:2], y[:2]).tolist(), "The square must contain only the first point!")
+        self.assertEqual([True, False], backend.contains(self._areas[1], x[2:4], y[2:4]).tolist(), "Points inside the hole must be outside!")
+        self.assertEqual([True, False], backend.contains(self._areas[2], x[4:], y[4:]).tolist(), "The triangle must contain only the first point!")
+        self.assertEqual((20, 0, 30, 10), backend.envelope(self._areas[1]), "The envelope must enclose all rings!")
+
+    def test_index_contains(self):
+        aoi_index = gdelt_aoi_index(self._areas)
+        x = numpy.array([5, 15, 21, 25, 41, 49, -50, 35])
+        y = numpy.array([5, 5, 5, 5, 1, 9, 0, 50])
+        self.assertEqual([True, False, True, False, True, False, False, False], aoi_index.contains(x, y).tolist(), "The points must be tested against all areas!")
+
+    def test_index_matches_brute_force(self):
+        backend = numpy_geometry_backend()
+        aoi_index = gdelt_aoi_index(self._areas, grid_size=3)
+        random_state = numpy.random.RandomState(42)
+        x = random_state.uniform(-10, 60, 1000)
+        y = random_state.uniform(-10, 20, 1000)
+        expected = numpy.zeros(len(x), dtype=bool)
+        for area in self._areas:
+            expected |= backend.contains(area, x, y)
+        self.assertEqual(expected.tolist(), aoi_index.contains(x, y).tolist(), "The index must not change the result!")
+
+    def test_index_statistics(self):
+        aoi_index = gdelt_aoi_index(self._areas)
+        x = numpy.array([5, 15, 25, 49, -50])
+        y = numpy.array([5, 5, 5, 9, 0])
+        aoi_index.contains(x, y)
+        statistics = aoi_index.statistics
+        self.assertEqual(5, statistics["points"], "All points must be counted!")
+        self.assertEqual(1, statistics["extent_pruned"], "One point is outside the extent!")
+        self.assertEqual(1, statistics["envelope_pruned"], "One point is outside the envelopes!")
+        self.assertEqual(2, statistics["exact_pruned"], "Two points must fail the exact test!")
+        self.assertEqual(1, statistics["accepted"], "One point must be accepted!")
+
+    def test_empty_index(self):
+        aoi_index = gdelt_aoi_index([])
+        self.assertEqual([False], aoi_index.contains([0], [0]).tolist(), "No point must be accepted!")
+
+
+
+class TestGdeltGraphBatch(unittest.TestCase):
+
+    def test_convert_timestamps(self):
+        (datetimes, valid) = convert_timestamps([20200301121530, 20201231235959, 20200431000000, None])
+        self.assertEqual([True, True, False, False], valid.tolist(), "Invalid timestamps must be detected!")
+        self.assertEqual(datetime.datetime(2020, 3, 1, 12, 15, 30), datetimes[0].tolist(), "The timestamp must be converted!")
+        self.assertEqual(datetime.datetime(2020, 12, 31, 23, 59, 59), datetimes[1].tolist(), "The timestamp must be converted!")
+
+    def test_same_rows_as_graph_entry(self):
+        records = create_graph_records(50)
+        records.append(("bad", "1#Broken#XX#XX##no-float#13#1#0;1#Short#XX#XX##52#13;;4#Berlin#GM#GM16##52.5#13.4#-1746443#100;", 20200301120000, "source", "document"))
+        records.append(("bad-date", "4#Berlin#GM#GM16##52.5#13.4#-1746443#100", 20200399120000, "source", "document"))
+        expected_rows = [graph_record.values for record in records for graph_record in gdelt_graph_entry(record).records]
+        batch = gdelt_graph_batch.from_records(records)
+        rows = [list(row) for row in zip(*batch.column_lists())]
+        self.assertEqual(expected_rows, rows, "The batch must contain the same rows!")
+        expected_failures = sum(gdelt_graph_entry(record).failures for record in records)
+        self.assertEqual(3, batch.failures, "Parse failures must be counted!")
+        self.assertEqual(expected_failures, batch.failures, "Both parsers must count the same failures!")
+
+    def test_locations(self):
+        records = [("id", "4#Berlin#GM#GM16##52.5#13.4#-1746443#100", 20200301120000, "source", "document")]
+        batch = gdelt_graph_batch.from_records(records)
+        (x, y) = batch.locations
+        self.assertEqual([13.4], x.tolist(), "The longitude must be the x coordinate!")
+        self.assertEqual([52.5], y.tolist(), "The latitude must be the y coordinate!")
+        self.assertEqual(["id"], batch.ids.tolist(), "The record ID must be preserved!")
+
+    def test_empty_batch(self):
+        batch = gdelt_graph_batch.from_records([])
+        self.assertEqual(0, len(batch), "The batch must be empty!")
+        self.assertEqual(13, len(batch.column_lists()), "The batch must contain all fields!")
+
+
+
+class TestGdeltQueryBuilder(unittest.TestCase):
+
+    def test_select_all(self):
+        query_builder = gdelt_query_builder(datetime.date(2020, 3, 1), limit=10)
+        query = query_builder.build()
+        self.assertTrue(query.startswith("SELECT * FROM `gdelt-bq.gdeltv2.events_partitioned`"), "All columns must be selected!")
+        self.assertIn("DATE(_PARTITIONTIME) = '2020-03-01'", query, "The partition must be restricted!")
+        self.assertTrue(query.endswith("LIMIT 10"), "The limit must be applied!")
+        self.assertEqual(61, len(query_builder.fields), "All fields must be returned!")
+        query = gdelt_query_builder(datetime.date(2020, 3, 1), limit=None).build()
+        self.assertNotIn("LIMIT", query, "An unlimited query must not have a LIMIT clause!")
+        self.assertTrue(query.endswith("ActionGeo_Long IS NOT NULL"), "The predicates must end the query!")
+
+    def test_select_fields(self):
+        query_builder = gdelt_query_builder(datetime.date(2020, 3, 1)).select(["SOURCEURL", "EventRootCode", "Day"])
+        self.assertEqual(["GlobalEventId", "Day", "EventRootCode", "ActionGeo_Lat", "ActionGeo_Long", "SOURCEURL"], [field[0] for field in query_builder.fields], "The fields must keep the schema order!")
+        self.assertEqual(["GLOBALEVENTID", "SQLDATE", "EventRootCode", "ActionGeo_Lat", "ActionGeo_Long", "SOURCEURL"], query_builder.columns, "The columns must match the fields!")
+        self.assertTrue(query_builder.build().startswith("SELECT GLOBALEVENTID, SQLDATE, EventRootCode, ActionGeo_Lat, ActionGeo_Long, SOURCEURL FROM"), "Only the selected columns must be projected!")
+        with self.assertRaises(ValueError):
+            query_builder.select(["NoSuchField"])
+
+    def test_filters(self):
+        query_builder = gdelt_query_builder(datetime.date(2020, 3, 1))
+        query_builder.cameo_codes(["14", "19"]).quad_classes([3, 4]).goldstein_range(-10, -5).min_mentions(5).country_codes(["UP", "RS"])
+        query = query_builder.build()
+        self.assertIn("(STARTS_WITH(EventCode, '14') OR STARTS_WITH(EventCode, '19'))", query, "The CAMEO codes must be pushed down!")
+        self.assertIn("QuadClass IN (3, 4)", query, "The quad classes must be pushed down!")
+        self.assertIn("GoldsteinScale >= -10.0 AND GoldsteinScale <= -5.0", query, "The Goldstein range must be pushed down!")
+        self.assertIn("NumMentions >= 5", query, "The mentions must be pushed down!")
+        self.assertIn("ActionGeo_CountryCode IN ('RS', 'UP')", query, "The country codes must be pushed down!")
+        with self.assertRaises(ValueError):
+            query_builder.country_codes(["UP' OR '1'='1"])
+
+    def test_since(self):
+        query_builder = gdelt_query_builder(datetime.date(2020, 3, 1))
+        key = query_builder.create_key()
+        query = query_builder.since(dateadded="20200301121500", event_id=42).build()
+        self.assertIn("DATEADDED >= 20200301121500", query, "The DATEADDED high-water mark must be pushed down!")
+        self.assertIn("GLOBALEVENTID > 42", query, "The GlobalEventId high-water mark must be pushed down!")
+        self.assertNotEqual(key, query_builder.create_key(), "The high-water mark must be part of the key!")
+        client = gdelt_client(client=fake_bigquery_client())
+        (query, cache_key, date) = client._create_graph_query(datetime.date(2020, 3, 1), "TERROR", 1000, datetime.datetime(2020, 3, 1, 12, 15))
+        self.assertIn("DATE >= 20200301121500", query, "The graph high-water mark must be pushed down!")
+        self.assertNotEqual(cache_key, client._create_graph_query(datetime.date(2020, 3, 1), "TERROR", 1000)[1], "The graph high-water mark must be part of the key!")
+
+    def test_bboxes(self):
+        bbox = { "xmin": -10, "xmax": 10, "ymin": -5, "ymax": 5 }
+        query_builder = gdelt_query_builder(datetime.date(2020, 3, 1)).bbox(bbox)
+        self.assertIn("(ActionGeo_Long >= -10 AND ActionGeo_Long <= 10 AND ActionGeo_Lat >= -5 AND ActionGeo_Lat <= 5)", query_builder.build(), "The bounding box must be pushed down!")
+        query = query_builder.build(bbox=[bbox, bbox])
+        self.assertIn(") OR (", query, "The bounding boxes must be OR'ed!")
+
+    def test_cache_keys(self):
+        query_builder = gdelt_query_builder(datetime.date(2020, 3, 1))
+        key = query_builder.create_key()
+        self.assertNotEqual(key, query_builder.quad_classes([1]).create_key(), "The filters must be part of the key!")
+        self.assertNotEqual(key, gdelt_query_builder(datetime.date(2020, 3, 1)).select(["SOURCEURL"]).create_key(), "The columns must be part of the key!")
+
+    def test_query_selected_fields(self):
+        client = gdelt_client(client=fake_bigquery_client())
+        query_builder = gdelt_query_builder(datetime.date(2020, 3, 1)).select(["SOURCEURL"])
+        self.assertIn("SELECT GLOBALEVENTID, ActionGeo_Lat, ActionGeo_Long, SOURCEURL FROM", query_builder.build(), "Only the selected columns must be projected!")
+        gdelt_events = client.query_events(gdelt_query_builder(datetime.date(2020, 3, 1), end_date=datetime.date(2020, 3, 2)).quad_classes([1]))
+        self.assertEqual(20, len(gdelt_events), "The events of all days must be returned!")
+        self.assertIn("QuadClass IN (1)", client._client.queries[0], "The filters must be sent!")
+
+    def test_query_graph_themes(self):
+        client = gdelt_client(client=fake_bigquery_client())
+        (query, cache_key, date) = client._create_graph_query(datetime.date(2020, 3, 1), ["TERROR", "KILL", "TERROR"], 1000)
+        self.assertIn("WHERE theme IN ('KILL', 'TERROR')", query, "The themes must be matched as exact tokens!")
+        self.assertIn("(V2Themes LIKE '%KILL%' OR V2Themes LIKE '%TERROR%')", query, "The partition must be pruned by all themes!")
+        self.assertEqual(cache_key, client._create_graph_query(datetime.date(2020, 3, 1), ["KILL", "TERROR"], 1000)[1], "The order of the themes must not change the key!")
+        self.assertNotEqual(cache_key, client._create_graph_query(datetime.date(2020, 3, 1), "TERROR", 1000)[1], "The themes must be part of the key!")
+        batches = list(client.iter_query_graph_batches(datetime.date(2020, 3, 1), ["TERROR", "KILL"]))
+        self.assertEqual(1, len(client._client.queries), "All themes must be queried by a single scan!")
+        self.assertEqual(["KILL;TERROR"], sorted(set(batches[0].column("Themes").tolist())), "The records must be tagged with the matched themes!")
+        with self.assertRaises(ValueError):
+            client._create_graph_query(datetime.date(2020, 3, 1), ["TERROR'; DROP"], 1000)
+
+
+
+class TestGdeltQueryPlanner(unittest.TestCase):
+
+    def test_merge_contained_bboxes(self):
+        planner = gdelt_query_planner()
+        bboxes = [
+            { "xmin": 0, "xmax": 10, "ymin": 0, "ymax": 10 },
+            { "xmin": 2, "xmax": 4, "ymin": 2, "ymax": 4 },
+            { "xmin": 0, "xmax": 10, "ymin": 0, "ymax": 10 }
+        ]
+        self.assertEqual([{ "xmin": 0, "xmax": 10, "ymin": 0, "ymax": 10 }], planner.merge(bboxes), "Contained bounding boxes must be merged!")
+
+    def test_keep_distant_bboxes(self):
+        planner = gdelt_query_planner()
+        bboxes = [
+            { "xmin": 0, "xmax": 1, "ymin": 0, "ymax": 1 },
+            { "xmin": 50, "xmax": 51, "ymin": 50, "ymax": 51 },
+            { "xmin": 0.5, "xmax": 50.5, "ymin": 0.5, "ymax": 0.6 }
+        ]
+        self.assertEqual(3, len(planner.merge(bboxes)), "Merging must not enlarge the queried area!")
+
+    def test_plan_clusters(self):
+        planner = gdelt_query_planner(max_predicates=2)
+        bboxes = [{ "xmin": index * 10, "xmax": index * 10 + 1, "ymin": 0, "ymax": 1 } for index in range(5, 0, -1)]
+        plan = planner.plan(bboxes)
+        self.assertEqual([2, 2, 1], [len(planned_bboxes) for planned_bboxes in plan], "The bounding boxes must be split into clusters!")
+        self.assertEqual([10, 20], [bbox["xmin"] for bbox in plan[0]], "Neighbouring bounding boxes must share a query!")
+
+    def test_cache_planned_queries(self):
+        bboxes = [{ "xmin": index * 10, "xmax": index * 10 + 1, "ymin": 0, "ymax": 1 } for index in range(2)]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = gdelt_cache(temp_dir)
+            for run in range(2):
+                client = gdelt_client(cache, client=fake_bigquery_client(records_per_query=10), max_workers=1)
+                client._planner = gdelt_query_planner(max_predicates=1)
+                # Both planned queries fill the limit
+                self.assertEqual(20, len(client.query_bboxes(datetime.date(2020, 3, 1), bboxes, limit=20)), "The limit must be filled!")
+            self.assertEqual(0, len(client._client.queries), "The planned queries must be cached!")
+            self.assertEqual(2, cache.statistics["hits"], "Every planned query must hit the cache!")
+
+
+
+class TestGdeltGrid(unittest.TestCase):
+
+    def test_build_bins(self):
+        query_builder = gdelt_query_builder(datetime.date(2020, 3, 1), limit=10).quad_classes([4])
+        query = query_builder.build_bins(gdelt_grid(0.5))
+        self.assertIn("FLOOR(ActionGeo_Long / 0.5)", query, "The cells must be computed by BigQuery!")
+        self.assertIn("QuadClass IN (4)", query, "The filters must be pushed down!")
+        self.assertTrue(query.endswith("GROUP BY cell"), "The events must be grouped by cell without a limit!")
+        self.assertIn("ST_GEOHASH(ST_GEOGPOINT(ActionGeo_Long, ActionGeo_Lat), 4)", query_builder.build_bins(gdelt_grid(geohash_precision=4)), "Geohash cells must be supported!")
+        key = query_builder.create_bins_key(gdelt_grid(0.5))
+        self.assertNotEqual(key, query_builder.create_key(), "Aggregating queries must not share the cache key of event queries!")
+        self.assertNotEqual(key, query_builder.create_bins_key(gdelt_grid(1.0)), "The grid must be part of the key!")
+        with self.assertRaises(ValueError):
+            gdelt_grid(geohash_precision=13)
+
+    def test_edges(self):
+        for cell_size in [1.0, 7.0, 180.0]:
+            grid = gdelt_grid(cell_size)
+            for (x, y) in [(180.0, 90.0), (-180.0, -90.0)]:
+                (center_x, center_y) = grid.center(grid.locate(x, y))
+                self.assertTrue(-180 <= center_x <= 180 and -90 <= center_y <= 90, "Every center must be a valid location!")
+        grid = gdelt_grid(1.0)
+        self.assertEqual("179_89", grid.locate(180.0, 90.0), "Longitude 180 and latitude 90 must be in the last cell!")
+        self.assertEqual((179.5, 89.5), grid.center("180_90"), "Cells beyond the edge must be centered in the last cell!")
+        self.assertIn("LEAST(CAST(FLOOR(ActionGeo_Long / 1.0) AS INT64), 179), LEAST(CAST(FLOOR(ActionGeo_Lat / 1.0) AS INT64), 89)", grid.create_projection(), "BigQuery must clamp the last column and row!")
+
+    def test_cells(self):
+        grid = gdelt_grid(2.5)
+        self.assertEqual("-1_1", grid.locate(-1.0, 3.0), "The cell must contain the location!")
+        self.assertEqual((-1.25, 3.75), grid.center("-1_1"), "The center of the cell must be returned!")
+        geohash = encode_geohash(13.4, 52.5, 6)
+        (xmin, ymin, xmax, ymax) = decode_geohash(geohash)
+        self.assertTrue(xmin <= 13.4 <= xmax and ymin <= 52.5 <= ymax, "The geohash cell must contain the location!")
+        self.assertEqual("u33", gdelt_grid(geohash_precision=3).locate(13.4, 52.5), "The geohash must be encoded!")
+
+    def test_merge(self):
+        field_to_index = {name: index for (index, name) in enumerate(gdelt_grid.COLUMNS)}
+        pages = [
+            [Row(("0_0", 2, 2, -4.0, 2, 2.0, 10.0, -1.0, 3.0, 1, 1, 0, 0), field_to_index)],
+            [Row(("0_0", 2, 1, 2.0, 2, 2.0, 2.0, 1.0, 1.0, 0, 0, 2, 0), field_to_index), Row(("1_0", 1, 0, None, 0, None, None, None, None, 0, 0, 0, 1), field_to_index)]
+        ]
+        gdelt_bins = gdelt_grid(1.0).merge(pages)
+        self.assertEqual(["0_0", "1_0"], [gdelt_bin.id for gdelt_bin in gdelt_bins], "The rows must be merged by cell!")
+        self.assertEqual(("0_0", 4, -2.0 / 3, 1.0, 2 ** 0.5, -1.0, 3.0, 1, 1, 2, 0), gdelt_bins[0].values, "The statistics must be merged!")
+        self.assertEqual((0.5, 0.5), gdelt_bins[0].location, "The location must be the cell center!")
+        self.assertIsNone(gdelt_bins[1].values[2], "Cells without tone must not have an average tone!")
+
+    def test_query_bins(self):
+        client = gdelt_client(client=fake_bigquery_client(records_per_query=50))
+        query_builder = gdelt_query_builder(datetime.date(2020, 3, 1), limit=10, end_date=datetime.date(2020, 3, 2))
+        gdelt_bins = client.query_bins(query_builder, gdelt_grid(180.0))
+        self.assertLessEqual(len(gdelt_bins), 4, "The events of all days must be merged into the cells!")
+        self.assertEqual(100, sum(gdelt_bin.values[1] for gdelt_bin in gdelt_bins), "All events must be counted regardless of the limit!")
+        self.assertEqual(2, len(client._client.queries), "Every day must be aggregated by BigQuery!")
+        gdelt_bins = client.query_bins(gdelt_query_builder(datetime.date(2020, 3, 1)), gdelt_grid(geohash_precision=1))
+        self.assertEqual(50, sum(gdelt_bin.values[1] for gdelt_bin in gdelt_bins), "Geohash cells must be counted!")
+
+    def test_insert_bins(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "gdelt.gpkg")
+            client = gdelt_client(client=fake_bigquery_client(records_per_query=50))
+            gdelt_bins = client.query_bins(gdelt_query_builder(datetime.date(2020, 3, 1)), gdelt_grid(45.0))
+            workspace = gdelt_workspace(path, geopackage_feature_writer(path))
+            inserted = workspace.insert_bin_features("Bins", gdelt_feature_factory().create_bin_features(gdelt_bins))
+            self.assertEqual(len(gdelt_bins), inserted, "Every cell must be inserted!")
+            self.assertEqual([field[0] for field in create_bin_fields()], workspace.writer.list_fields("Bins"), "The bins fields must be created!")
+            self.assertEqual(50, sum(count for (count,) in workspace.writer.search("Bins", ["EventCount"])), "The counts must be written!")
+
+
+
+class TestGdeltSpaceTimeCube(unittest.TestCase):
+
+    def test_add_batches(self):
+        records = create_event_records(3000)
+        cube = gdelt_space_time_cube(45.0, "hour")
+        added = cube.add_batches(gdelt_event_batch.from_records(records[index:index + 1000]) for index in range(0, 3000, 1000))
+        self.assertEqual(3000, added, "All events must be added!")
+        whole_cube = gdelt_space_time_cube(45.0, "hour")
+        whole_cube.add_batch(gdelt_event_batch.from_records(records))
+        self.assertEqual(whole_cube.cells, cube.cells, "Incremental batches must create the same bins!")
+        self.assertEqual(whole_cube.counts.tolist(), cube.counts.tolist(), "Incremental batches must count the same events!")
+        self.assertLessEqual(len(cube), 32 * 24, "The bins must be bounded by the cells and hours!")
+        self.assertEqual(3000, cube.counts[:, 0].sum(), "Every event must be counted once!")
+        self.assertEqual(3000, cube.counts[:, 1].sum(), "The QuadClass values must be counted!")
+        self.assertEqual(3000, cube.counts[:, 8].sum(), "The EventRootCode values must be counted!")
+
+    def test_bins(self):
+        records = [create_event_values(0), create_event_values(1, longitude=13.9), create_event_values(2, longitude=-13.4), create_event_values(3, longitude=None)]
+        cube = gdelt_space_time_cube(1.0, "day")
+        cube.add_batch(gdelt_event_batch.from_records(records))
+        self.assertEqual(["-14_52", "13_52"], cube.cells, "The events must be binned by cell!")
+        self.assertEqual([[-13.5, 52.5], [13.5, 52.5]], [list(center) for center in zip(*[values.tolist() for values in cube.centers])], "The centers must be returned!")
+        self.assertEqual([1, 2], cube.counts[:, 0].tolist(), "The events must be counted!")
+        self.assertEqual(numpy.datetime64("2020-03-01T00:00:00"), cube.start_times[0], "The DATEADDED must be binned by day!")
+        self.assertEqual(numpy.datetime64("2020-03-02T00:00:00"), cube.end_times[0], "The bins must end after the interval!")
+        self.assertEqual(1, cube.skipped, "Events without a location must be skipped!")
+        with self.assertRaises(ValueError):
+            gdelt_space_time_cube(1.0, "week")
+
+    def test_edges(self):
+        records = [create_event_values(0, longitude=180.0, latitude=90.0), create_event_values(1, longitude=-180.0, latitude=-90.0), create_event_values(2, longitude=180.5, latitude=0.0)]
+        for cell_size in [1.0, 7.0, 180.0]:
+            cube = gdelt_space_time_cube(cell_size, "day")
+            cube.add_batch(gdelt_event_batch.from_records(records))
+            (x, y) = cube.centers
+            self.assertEqual(2, cube.records, "The locations on the edges must be added!")
+            self.assertEqual(1, cube.skipped, "Invalid locations must be skipped!")
+            self.assertTrue(((-180 <= x) & (x <= 180) & (-90 <= y) & (y <= 90)).all(), "Every center must be a valid location!")
+        cube = gdelt_space_time_cube(1.0, "day")
+        cube.add_batch(gdelt_event_batch.from_records(records[:1]))
+        self.assertEqual(["179_89"], cube.cells, "Longitude 180 and latitude 90 must be in the last cell!")
+
+    def test_graph_batches(self):
+        cube = gdelt_space_time_cube(90.0, "hour")
+        batch = gdelt_graph_batch.from_records(create_graph_records(100))
+        cube.add_batch(batch)
+        self.assertEqual(len(batch), cube.records, "Every graph location must be counted!")
+        self.assertEqual(0, cube.counts[:, 1:].sum(), "Graph records have no QuadClass and EventRootCode!")
+
+    def test_insert_cube(self):
+        client = gdelt_client(client=fake_bigquery_client(records_per_query=500))
+        query_builder = gdelt_query_builder(datetime.date(2020, 3, 1), limit=10000, end_date=datetime.date(2020, 3, 2)).select(["DATEADDED", "EventRootCode", "QuadClass"])
+        cube = gdelt_space_time_cube(90.0, "day")
+        cube.add_batches(client.iter_query_events_batches(query_builder, page_size=100))
+        self.assertEqual(1000, cube.records, "The events of all days and pages must be counted!")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "gdelt.gpkg")
+            workspace = gdelt_workspace(path, geopackage_feature_writer(path))
+            inserted = workspace.insert_cube_features("SpaceTimeBins", gdelt_feature_factory().create_cube_features(cube))
+            self.assertEqual(len(cube), inserted, "Every bin must be inserted!")
+            self.assertEqual([field[0] for field in create_cube_fields()], workspace.writer.list_fields("SpaceTimeBins"), "The space-time bins fields must be created!")
+            rows = list(workspace.writer.search("SpaceTimeBins", ["StartTime", "EventCount"]))
+            self.assertEqual(1000, sum(count for (start_time, count) in rows), "The counts must be written!")
+            self.assertEqual(datetime.datetime(2020, 3, 1), rows[0][0], "The start time must be written!")
+
+
+
+class TestGdeltDeduplicator(unittest.TestCase):
+
+    def _create_batches(self, id_lists):
+        return [gdelt_event_batch.from_records([create_event_values(event_id) for event_id in event_ids]) for event_ids in id_lists]
+
+    def test_exact_batches(self):
+        deduplicator = gdelt_deduplicator()
+        batches = list(deduplicator.deduplicate_batches(self._create_batches([[1, 2, 2, 3], [3, 4], [1, 2]])))
+        self.assertEqual([[1, 2, 3], [4], []], [batch.ids.tolist() for batch in batches], "Every event must be returned once!")
+        self.assertEqual(4, deduplicator.statistics["duplicates"], "The duplicates must be counted!")
+        self.assertEqual(8, deduplicator.statistics["records"], "The records must be counted!")
+
+    def test_bloom_batches(self):
+        deduplicator = gdelt_deduplicator(bloom_key_filter(1000, 0.000001))
+        batches = list(deduplicator.deduplicate_batches(self._create_batches([[1, 2, 2, 3], [3, 4], [1, 2]])))
+        self.assertEqual([[1, 2, 3], [4], []], [batch.ids.tolist() for batch in batches], "Every event must be returned once!")
+        self.assertEqual(4, len(deduplicator.key_filter), "The distinct keys must be counted!")
+
+    def test_bloom_error_rate(self):
+        key_filter = bloom_key_filter(10000, 0.01)
+        self.assertTrue(all(key_filter.add(numpy.arange(10000, dtype=numpy.int64))), "New keys must be accepted!")
+        self.assertFalse(any(key_filter.add(numpy.arange(10000, dtype=numpy.int64))), "Seen keys must never be accepted!")
+        false_positives = 10000 - sum(key_filter.add(numpy.arange(10000, 20000, dtype=numpy.int64)))
+        self.assertLess(false_positives, 200, "The error rate must be bounded!")
+        self.assertLessEqual(key_filter.statistics["bytes"], 12000, "The memory must be bounded by the capacity!")
+        with self.assertRaises(ValueError):
+            bloom_key_filter(10000, 1.5)
+
+    def test_graph_batches(self):
+        records = create_graph_records(10)
+        records.append(("broken", "1#Nowhere#XX#XX##not-a-number#0#1", 20200301000000, "example.com", "https://example.com/broken"))
+        for key_filter in [exact_key_filter(), bloom_key_filter(1000, 0.000001)]:
+            deduplicator = gdelt_deduplicator(key_filter)
+            batches = list(deduplicator.deduplicate_batches([gdelt_graph_batch.from_records(records), gdelt_graph_batch.from_records(records)]))
+            self.assertEqual(50, len(batches[0]), "The locations of the first batch must be kept!")
+            self.assertEqual(0, len(batches[1]), "Repeated locations must be removed!")
+            self.assertEqual(1, batches[1].failures, "The parsing failures must be kept!")
+
+    def test_existing_keys(self):
+        existing_ids = set([1, 2])
+        deduplicator = gdelt_deduplicator(exact_key_filter(existing_ids))
+        new_ids = [event_id for event_id in deduplicator.deduplicate([1, 3, 3, 4, 2], lambda event_id: event_id, chunk_size=2)]
+        self.assertEqual([3, 4], new_ids, "Existing and repeated keys must be skipped!")
+        self.assertEqual(set([1, 2, 3, 4]), existing_ids, "The existing keys must be updated!")
+
+
+
+class TestGdeltFeatureColumns(unittest.TestCase):
+
+    def setUp(self):
+        self._batch = gdelt_event_batch.from_records([create_event_values(event_id, longitude=event_id) for event_id in range(10)])
+
+    def test_create_features(self):
+        feature_factory = gdelt_feature_factory()
+        feature_columns = feature_factory.create_feature_batch(self._batch)
+        self.assertEqual(10, len(feature_columns), "Every event must be a feature!")
+        self.assertEqual(list(zip([(event_id, 52.5) for event_id in range(10)], *self._batch.column_lists())), list(feature_columns), "Every feature must contain the location and the values!")
+        self.assertEqual(list(range(10)), feature_columns.x.tolist(), "The coordinates must be kept as arrays!")
+        selected = feature_columns.select(feature_columns.x < 3)
+        self.assertEqual([0, 1, 2], selected.columns[0].tolist(), "The selected attributes must be returned!")
+        self.assertEqual(6, len(gdelt_feature_columns.concatenate([selected, selected])), "The features must be concatenated!")
+
+    def test_iterate_chunks(self):
+        records = [create_event_values(event_id, longitude=event_id) for event_id in range(10)]
+        records[4] = records[4][:35] + (None,) + records[4][36:]
+        batch = gdelt_event_batch.from_records([Row(record, {field[0]: index for (index, field) in enumerate(create_event_fields())}) for record in records])
+        feature_columns = gdelt_feature_factory().create_feature_batch(batch)
+        feature_columns.ITER_CHUNK_SIZE = 3
+        self.assertEqual(list(zip([(event_id, 52.5) for event_id in range(10)], *batch.column_lists())), list(feature_columns), "The chunks must return every feature!")
+        selected = feature_columns.select(feature_columns.x < 6)
+        features = list(gdelt_feature_columns.concatenate([selected, feature_columns.select(feature_columns.x < 2)]))
+        self.assertEqual(8, len(features), "The features must be concatenated!")
+        self.assertIsNone(features[4][36], "NULL values must be kept by select and concatenate!")
+        self.assertEqual(4, features[7][36], "The values must be kept by select and concatenate!")
+
+    def test_process_pool(self):
+        feature_factory = gdelt_feature_factory(executor=concurrent.futures.ThreadPoolExecutor(max_workers=2), chunk_size=3)
+        self.assertEqual(list(gdelt_feature_factory().create_feature_batch(self._batch)), list(feature_factory.create_feature_batch(self._batch)), "Split batches must keep the order!")
+        self.assertTrue(feature_factory._is_picklable(), "The default point backend must be picklable!")
+        self.assertFalse(gdelt_feature_factory(point_backend=arcpy_point_backend())._is_picklable(), "The arcpy point backend must stay in process!")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+            feature_factory = gdelt_feature_factory(executor=executor, chunk_size=4)
+            self.assertEqual(list(gdelt_feature_factory().create_feature_batch(self._batch)), list(feature_factory.create_feature_batch(self._batch)), "The worker processes must create the same features!")
+
+    def test_write_geopackage_points(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "gdelt.gpkg")
+            feature_columns = gdelt_feature_factory(point_backend=geopackage_point_backend()).create_feature_batch(self._batch)
+            writer = geopackage_feature_writer(path)
+            self.assertEqual(writer._create_row(next(iter(gdelt_feature_factory().create_feature_batch(self._batch))), 62)[0], feature_columns.points[0], "The geometries must match the writer!")
+            workspace = gdelt_workspace(path, writer)
+            area_of_interest = fake_polygon(fake_array([fake_point(-0.5, 50), fake_point(-0.5, 55), fake_point(2.5, 55), fake_point(2.5, 50), fake_point(-0.5, 50)]))
+            inserted = workspace.insert_feature_batches("Events", [feature_columns], [area_of_interest])
+            self.assertEqual(3, inserted, "The feature columns must be filtered and written!")
+
+    def test_benchmark_feature_factory(self):
+        result = benchmark_feature_factory(100, workers=2, chunk_size=40)
+        self.assertEqual(100, result["features"], "All features must be created!")
+        self.assertLess(0.0, result["process_pool_columns_features_per_second"], "The process pool must be measured!")
+
+
+
+class TestGdeltFileClient(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._records = create_event_records(50) + create_event_records(50, first_id=50)
+        write_export_file(os.path.join(self._temp_dir.name, "20200301000000.export.CSV"), self._records[:50])
+        write_export_file(os.path.join(self._temp_dir.name, "20200301001500.export.CSV.zip"), self._records[50:], zipped=True)
+        # Files of other days must never be parsed
+        write_export_file(os.path.join(self._temp_dir.name, "20200302000000.export.CSV"), create_event_records(10, first_id=100))
+        self._graph_records = create_graph_records(20)
+        themes = [["TERROR", "TAX_FNCACT"] if index % 2 else ["PROTEST"] for index in range(20)]
+        write_graph_file(os.path.join(self._temp_dir.name, "20200301000000.gkg.csv.zip"), self._graph_records, themes, zipped=True)
+        self._client = gdelt_file_client(self._temp_dir.name)
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def test_query(self):
+        gdelt_events = self._client.query(datetime.date(2020, 3, 1), limit=None)
+        self.assertEqual([gdelt_event(record).values for record in self._records], [gdelt_event.values for gdelt_event in gdelt_events], "The files must return the values of BigQuery!")
+        self.assertEqual(100, self._client.lines, "Only the files of the date must be parsed!")
+        self.assertEqual(10, len(self._client.query(datetime.date(2020, 3, 1), limit=10)), "The limit must be applied over all files!")
+        self.assertEqual(110, len(self._client.query(datetime.date(2020, 3, 1), limit=None, end_date=datetime.date(2020, 3, 2))), "All days must be parsed!")
+
+    def test_query_bbox(self):
+        bbox = { "xmin": -90, "xmax": 90, "ymin": 0, "ymax": 90 }
+        expected_ids = [record.GLOBALEVENTID for record in self._records if -90 <= record.ActionGeo_Long <= 90 and 0 <= record.ActionGeo_Lat <= 90]
+        gdelt_events = self._client.query_bbox(datetime.date(2020, 3, 1), bbox, limit=None)
+        self.assertEqual(expected_ids, [gdelt_event.id for gdelt_event in gdelt_events], "The bounding box must be applied while parsing!")
+
+    def test_query_events_batches(self):
+        builder = gdelt_query_builder(datetime.date(2020, 3, 1), None).select(["AvgTone", "DATEADDED"]).goldstein_range(0.0)
+        expected_ids = [record.GLOBALEVENTID for record in self._records if 0.0 <= record.GoldsteinScale]
+        batches = list(self._client.iter_query_events_batches(builder, page_size=20))
+        self.assertEqual(expected_ids, [event_id for batch in batches for event_id in batch.ids.tolist()], "The filters of the builder must be applied!")
+        self.assertEqual([field[0] for field in builder.fields], [field[0] for field in batches[0].fields], "The batches must contain the selected fields!")
+
+    def test_query_bins(self):
+        grid = gdelt_grid(45.0)
+        expected_bins = grid.merge([create_bin_records(self._records, grid)])
+        gdelt_bins = self._client.query_bins(gdelt_query_builder(datetime.date(2020, 3, 1), limit=10), grid, page_size=20)
+        self.assertEqual([gdelt_bin.id for gdelt_bin in expected_bins], [gdelt_bin.id for gdelt_bin in gdelt_bins], "The events must be binned like BigQuery does!")
+        for (expected_bin, gdelt_bin) in zip(expected_bins, gdelt_bins):
+            self.assertEqual(expected_bin.values[:2] + expected_bin.values[7:], gdelt_bin.values[:2] + gdelt_bin.values[7:], "The counts must be merged over all pages!")
+            for (expected_value, value) in zip(expected_bin.values[2:7], gdelt_bin.values[2:7]):
+                self.assertAlmostEqual(expected_value, value, msg="The statistics must be merged over all pages!")
+        stage = self._client.instrumentation.stages["aggregate"]
+        self.assertEqual((100, len(gdelt_bins)), (stage["rows_in"], stage["rows_out"]), "All events must be counted regardless of the limit!")
+
+    def test_inherited_state(self):
+        bboxes = [{ "xmin": 0, "xmax": 10, "ymin": 0, "ymax": 10 }, { "xmin": 5, "xmax": 15, "ymin": 0, "ymax": 10 }]
+        self.assertEqual(1, len(self._client._planner.merge(bboxes)), "The file client must initialize the state of gdelt_client!")
+        self.assertIsNone(self._client._client, "The file client must not acquire a BigQuery client!")
+
+    def test_query_graph(self):
+        expected_records = [record for (index, document) in enumerate(self._graph_records) if index % 2 for record in gdelt_graph_entry(document).records]
+        graph_records = self._client.query_graph(datetime.date(2020, 3, 1), "TERROR")
+        self.assertEqual([record.values for record in expected_records], [record.values for record in graph_records], "Only the documents of the theme must be returned!")
+        batches = list(self._client.iter_query_graph_batches(datetime.date(2020, 3, 1), "TERROR", page_size=3))
+        self.assertEqual(len(expected_records), sum(len(batch) for batch in batches), "The batches must contain every location!")
+        since = self._graph_records[1][2]
+        self.assertTrue(all(since <= int(record.values[9].strftime("%Y%m%d%H%M%S")) for record in self._client.query_graph(datetime.date(2020, 3, 1), "TERROR", since=since)), "Older documents must be skipped!")
+
+    def test_query_graph_themes(self):
+        graph_records = self._client.query_graph(datetime.date(2020, 3, 1), ["TERROR", "PROTEST", "TAX"])
+        self.assertEqual(100, len(graph_records), "Every document must be returned once!")
+        self.assertEqual(["PROTEST", "TERROR"], sorted(set(record.values[12] for record in graph_records)), "The records must be tagged with the matched themes!")
+        self.assertEqual(0, len(self._client.query_graph(datetime.date(2020, 3, 1), "TAX")), "The themes must be matched as exact tokens!")
+
+    def test_query_graph_backends(self):
+        # The second day contains the documents of the first day published one day later
+        documents = [(record, ["TERROR", "TAX_FNCACT"] if index % 2 else ["PROTEST"]) for (index, record) in enumerate(self._graph_records)]
+        documents += [((record[0] + "-next",) + record[1:2] + (record[2] + 1000000,) + record[3:], ["TAX"] if index % 3 else ["TAX_FNCACT"]) for (index, record) in enumerate(self._graph_records)]
+        write_graph_file(os.path.join(self._temp_dir.name, "20200302000000.gkg.csv"), [record for (record, themes) in documents[20:]], [themes for (record, themes) in documents[20:]])
+        clients = [self._client, gdelt_client(client=fake_bigquery_client(graph_documents=documents))]
+        query = lambda client, limit: sorted(record.values for record in client.query_graph(datetime.date(2020, 3, 1), ["TERROR", "TAX"], limit, end_date=datetime.date(2020, 3, 2)))
+        (file_records, bigquery_records) = [query(client, None) for client in clients]
+        self.assertEqual(file_records, bigquery_records, "Both backends must return the same records!")
+        self.assertEqual(23, len(set(values[0] for values in file_records)), "The themes must be matched as exact tokens!")
+        for limit in [5, 15]:
+            documents_per_client = [set(values[0] for values in query(client, limit)) for client in clients]
+            self.assertEqual([limit, limit], [len(document_ids) for document_ids in documents_per_client], "The limit must be applied over all days!")
+            self.assertTrue(all(document_ids <= set(values[0] for values in file_records) for document_ids in documents_per_client), "Only matching documents must be returned!")
+
+    def test_failures(self):
+        with open(os.path.join(self._temp_dir.name, "20200301003000.export.CSV"), "w") as file:
+            file.write("1\tbroken\n")
+        self.assertEqual(100, len(self._client.query(datetime.date(2020, 3, 1), limit=None)), "Broken lines must be skipped!")
+        self.assertEqual(1, self._client.failures, "Broken lines must be counted!")
+        with self.assertRaises(ValueError):
+            gdelt_file_client(os.path.join(self._temp_dir.name, "missing"))
+
+
+
+class TestGdeltProgress(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._temp_dir.name, "gdelt.gpkg")
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _create_feature_batches(self, cancellation):
+        feature_factory = gdelt_feature_factory()
+        for first_id in range(0, 30, 10):
+            if 10 < first_id:
+                cancellation.cancel()
+            yield feature_factory.create_feature_batch(gdelt_event_batch.from_records([create_event_values(event_id) for event_id in range(first_id, first_id + 10)]))
+
+    def test_progress_and_cancellation(self):
+        reports = []
+        progress = gdelt_progress(lambda progress: reports.append((progress.fetched, progress.written)), total=30)
+        cancellation = gdelt_cancellation_token()
+        client = gdelt_client(client=fake_bigquery_client(), max_workers=1, progress=progress, cancellation=cancellation)
+        batches = client.iter_query_events_batches(gdelt_query_builder(datetime.date(2020, 3, 1), None, datetime.date(2020, 3, 3)))
+        self.assertEqual(10, len(next(batches)), "The first page must be fetched!")
+        self.assertEqual([(10, 0)], reports, "The fetched rows must be reported!")
+        cancellation.cancel()
+        with self.assertRaises(gdelt_cancelled_error):
+            next(batches)
+        self.assertEqual(10, progress.fetched, "No page must be fetched after cancelling!")
+
+    def test_cancel_running_job(self):
+        polls = []
+        cancellation = gdelt_cancellation_token(lambda: polls.append(True) or 1 < len(polls))
+        client = gdelt_client(client=fake_bigquery_client(latency=5.0), cancellation=cancellation)
+        client.POLL_SECONDS = 0.05
+        start = time.perf_counter()
+        with self.assertRaises(gdelt_cancelled_error):
+            client.query(datetime.date(2020, 3, 1))
+        self.assertLess(time.perf_counter() - start, 1.0, "The job must not be awaited after cancelling!")
+        self.assertTrue(client._client.jobs[0].cancelled, "The BigQuery job must be cancelled!")
+
+    def test_poll_consumer_thread(self):
+        poll_threads = []
+        cancellation = gdelt_cancellation_token(lambda: poll_threads.append(threading.get_ident()) or 3 < len(poll_threads))
+        client = gdelt_client(client=fake_bigquery_client(latency=5.0), max_workers=2, cancellation=cancellation)
+        client.POLL_SECONDS = 0.05
+        start = time.perf_counter()
+        with self.assertRaises(gdelt_cancelled_error):
+            client.query(datetime.date(2020, 3, 1), end_date=datetime.date(2020, 3, 3))
+        self.assertLess(time.perf_counter() - start, 2.0, "The workers must stop after cancelling!")
+        self.assertEqual({threading.get_ident()}, set(poll_threads), "Only the consumer thread must poll the token!")
+        self.assertTrue(cancellation.signalled, "The workers must be signalled!")
+        self.assertTrue(all(job.cancelled for job in client._client.jobs), "The running BigQuery jobs must be cancelled!")
+
+    def test_timeout(self):
+        client = gdelt_client(client=fake_bigquery_client(latency=5.0), timeout=0.1)
+        with self.assertRaises(gdelt_timeout_error):
+            client.query(datetime.date(2020, 3, 1))
+        self.assertTrue(client._client.jobs[0].cancelled, "The timed out job must be cancelled!")
+        client = gdelt_client(client=fake_bigquery_client(latency=0.05), timeout=1.0)
+        self.assertEqual(10, len(client.query(datetime.date(2020, 3, 1))), "A job finishing in time must be read!")
+
+    def test_keep_partial(self):
+        cancellation = gdelt_cancellation_token()
+        progress = gdelt_progress()
+        workspace = gdelt_workspace(self._path, geopackage_feature_writer(self._path, chunk_size=4), progress=progress, cancellation=cancellation, keep_partial=True)
+        inserted = workspace.insert_feature_batches("Events", self._create_feature_batches(cancellation))
+        self.assertEqual(20, inserted, "The features written before cancelling must be kept!")
+        self.assertIsInstance(workspace.interrupted, gdelt_cancelled_error, "The interruption must be reported!")
+        self.assertEqual(20, progress.written, "The written rows must be reported!")
+        self.assertEqual(20, len(list(workspace.writer.search("Events", ["GlobalEventId"]))), "The partial feature class must be valid!")
+
+    def test_progress_of_rejects(self):
+        progress = gdelt_progress()
+        workspace = gdelt_workspace(self._path, geopackage_feature_writer(self._path, chunk_size=4), progress=progress, warn=lambda message: None)
+        features = list(gdelt_feature_factory().create_feature_batch(gdelt_event_batch.from_records([create_event_values(event_id) for event_id in range(10)])))
+        features[2] = features[2][:5]
+        inserted = workspace.insert_feature_batches("Events", [features])
+        self.assertEqual(9, inserted, "The good rows must be inserted!")
+        self.assertEqual(9, progress.written, "Only the rows the writer wrote must be reported!")
+
+    def test_discard_partial(self):
+        cancellation = gdelt_cancellation_token()
+        workspace = gdelt_workspace(self._path, geopackage_feature_writer(self._path), cancellation=cancellation)
+        with self.assertRaises(gdelt_cancelled_error):
+            workspace.insert_feature_batches("Events", self._create_feature_batches(cancellation))
+        self.assertFalse(workspace.writer.exists("Events"), "A cancelled job must not leave a feature class!")
+
+
+
+class TestGdeltGeoPackageWriter(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._temp_dir.name, "gdelt.gpkg")
+        self._feature_factory = gdelt_feature_factory()
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _create_features(self, event_ids):
+        batch = gdelt_event_batch.from_records([create_event_values(event_id) for event_id in event_ids])
+        return list(self._feature_factory.create_feature_batch(batch))
+
+    def test_write_features(self):
+        writer = geopackage_feature_writer(self._path, chunk_size=3)
+        fields = create_event_fields()
+        table = writer.create("Events", fields)
+        written = writer.write(table, [field[0] for field in fields], self._create_features(range(10)))
+        self.assertEqual(10, written, "All features must be written!")
+        self.assertTrue(writer.exists("Events"), "The table must exist!")
+        self.assertEqual([field[0] for field in fields], writer.list_fields("Events"), "All fields must be created!")
+        rows = list(writer.search("Events", ["GlobalEventId", "DATEADDED", "ActionGeo_Lat"]))
+        self.assertEqual((0, "20200301121500", 52.5), rows[0], "The values must be written!")
+        self.assertEqual(10, writer.statistics["rows"], "The written rows must be counted!")
+        self.assertLessEqual(0.0, writer.statistics["rows_per_second"], "The throughput must be measured!")
+
+    def test_reject_bad_rows(self):
+        writer = geopackage_feature_writer(self._path, chunk_size=4)
+        fields = create_event_fields()
+        table = writer.create("Events", fields)
+        features = self._create_features(range(10))
+        features[2] = features[2][:5]
+        features[7] = (("x", "y"),) + tuple(features[7][1:])
+        written = writer.write(table, [field[0] for field in fields], features)
+        self.assertEqual(8, written, "Bad rows must not stop the write!")
+        self.assertEqual(2, len(writer.rejects), "Bad rows must be rejected!")
+        self.assertEqual(2, writer.statistics["rejected"], "Bad rows must be counted!")
+        self.assertEqual(8, len(list(writer.search("Events", ["GlobalEventId"]))), "Only good rows must be written!")
+
+    def test_headless_workspace(self):
+        script = (
+            "import datetime, os, sys, tempfile\n"
+            "sys.modules['arcpy'] = None\n"
+            "from geoint.gdelt_workspace import gdelt_workspace\n"
+            "from geoint.gdelt_writer import geopackage_feature_writer\n"
+            "with tempfile.TemporaryDirectory() as temp_dir:\n"
+            "    path = os.path.join(temp_dir, 'gdelt.gpkg')\n"
+            "    workspace = gdelt_workspace(path, geopackage_feature_writer(path), warn=lambda message: print('warning', message))\n"
+            "    feature = ((13.4, 52.5), 'id', 4, 'Berlin', 'GM', 'GM16', None, 52.5, 13.4, '-1746443', datetime.datetime(2020, 3, 1), 'source', 'document', 'TERROR')\n"
+            "    print('inserted', workspace.insert_graph_features('Graph', [feature, feature[:3]]))\n"
+        )
+        src_dir = os.path.dirname(os.path.abspath(__file__))
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=src_dir).decode("utf-8")
+        self.assertIn("inserted 1", output, "The GeoPackage must be written without arcpy!")
+        self.assertIn("warning 1 GDELT features could not be inserted.", output, "The warnings must be passed to the callback!")
+
+    def test_write_datetime(self):
+        writer = geopackage_feature_writer(self._path)
+        fields = [["GKGRECORDID", "TEXT", "GKGRECORDID", 255], ["DATE", "DATE"]]
+        table = writer.create("Graph", fields)
+        writer.write(table, ["GKGRECORDID", "DATE"], [((13.4, 52.5), "id", datetime.datetime(2020, 3, 1, 12, 15))])
+        self.assertEqual([("id", datetime.datetime(2020, 3, 1, 12, 15))], list(writer.search("Graph", ["GKGRECORDID", "DATE"])), "Datetimes must be preserved!")
+
+    def test_workspace_append(self):
+        workspace = gdelt_workspace(self._path, geopackage_feature_writer(self._path))
+        self.assertIsNone(workspace.read_high_water_mark("Events"), "A missing feature class has no high-water mark!")
+        self.assertEqual(5, workspace.insert_feature_batches("Events", [self._create_features(range(5))]), "All features must be inserted!")
+        high_water_mark = workspace.read_high_water_mark("Events")
+        self.assertEqual(4, high_water_mark["event_id"], "The maximum ID must be the high-water mark!")
+        self.assertEqual("20200301121500", high_water_mark["dateadded"], "The maximum DATEADDED must be the high-water mark!")
+        inserted = workspace.insert_feature_batches("Events", [self._create_features(range(3, 8))], append=True, existing_ids=high_water_mark["ids"])
+        self.assertEqual(3, inserted, "Only new features must be appended!")
+        self.assertEqual(8, len(list(workspace.writer.search("Events", ["GlobalEventId"]))), "Existing features must be kept!")
+
+
+
+class TestGdeltArcpyWriter(unittest.TestCase):
+
+    def setUp(self):
+        self._previous_arcpy = sys.modules.get("arcpy")
+        self._arcpy = create_fake_arcpy()
+        sys.modules["arcpy"] = self._arcpy
+        self._feature_factory = gdelt_feature_factory()
+
+    def tearDown(self):
+        sys.modules["arcpy"] = self._previous_arcpy
+
+    def _create_features(self, event_ids):
+        batch = gdelt_event_batch.from_records([create_event_values(event_id) for event_id in event_ids])
+        return list(self._feature_factory.create_feature_batch(batch))
+
+    def test_write_one_cursor(self):
+        cursors = []
+        insert_cursor = self._arcpy.da.InsertCursor
+        self._arcpy.da.InsertCursor = lambda in_table, field_names: cursors.append(in_table) or insert_cursor(in_table, field_names)
+        progress = gdelt_progress()
+        writer = arcpy_feature_writer("memory", chunk_size=4)
+        fields = create_event_fields()
+        table = writer.create("Events", fields)
+        written = writer.write(table, [field[0] for field in fields], self._create_features(range(10)), progress)
+        self.assertEqual(10, written, "All features must be written!")
+        self.assertEqual(["memory/Events"], cursors, "One insert cursor must be used for all chunks!")
+        self.assertEqual(10, progress.written, "The written rows of every chunk must be reported!")
+        rows = list(writer.search("Events", ["GlobalEventId", "Actor1KnownGroupCode", "DATEADDED", "ActionGeo_Lat"]))
+        self.assertEqual((0, None, "20200301121500", 52.5), rows[0], "The values and nulls must be written!")
+
+    def test_reject_bad_rows(self):
+        writer = arcpy_feature_writer("memory", chunk_size=4)
+        fields = create_event_fields()
+        table = writer.create("Events", fields)
+        features = self._create_features(range(10))
+        features[2] = features[2][:5]
+        features[7] = features[7][:1] + (None,) + features[7][2:]
+        written = writer.write(table, [field[0] for field in fields], features)
+        self.assertEqual(9, written, "Bad rows must not stop the write!")
+        self.assertEqual(1, writer.statistics["rejected"], "Bad rows must be rejected!")
+        self.assertEqual([0, 1, 3, 4, 5, 6, None, 8, 9], [row[0] for row in writer.search("Events", ["GlobalEventId"])], "The rows must keep their order and nulls!")
+
+
+
+class TestGdeltClientPool(unittest.TestCase):
+
+    def setUp(self):
+        self._closed = []
+        self._constructions = []
+        self._previous_factory = get_client_pool().set_factory(self._create_client)
+
+    def tearDown(self):
+        get_client_pool().set_factory(self._previous_factory)
+
+    def _create_client(self, project=None):
+        self._constructions.append(project)
+        client = fake_bigquery_client()
+        client.close = lambda: self._closed.append(client)
+        return client
+
+    def test_reuse_client(self):
+        clients = [gdelt_client() for index in range(3)]
+        self.assertEqual(1, len(self._constructions), "The BigQuery client must be created once!")
+        self.assertEqual(1, len(set(id(client._client) for client in clients)), "The BigQuery client must be shared!")
+        self.assertEqual(10, len(clients[0].query(datetime.date(2020, 3, 1), limit=10)), "The shared client must be queried!")
+
+    def test_concurrent_borrow(self):
+        pool = gdelt_client_pool(self._create_client)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            clients = list(executor.map(lambda index: pool.get(), range(100)))
+        self.assertEqual(1, len(self._constructions), "Concurrent borrows must create one client!")
+        self.assertEqual(1, len(set(id(client) for client in clients)), "All borrowers must share the client!")
+        self.assertEqual(100, pool.statistics["borrows"], "The borrows must be counted!")
+
+    def test_close(self):
+        pool = gdelt_client_pool(self._create_client)
+        client = pool.get()
+        pool.close()
+        self.assertEqual([client], self._closed, "The client must be closed!")
+        self.assertIsNot(client, pool.get(), "A closed client must not be reused!")
+
+
+
+class TestGdeltToolboxImport(unittest.TestCase):
+
+    # Loading the toolbox must not pay the import costs of BigQuery and NumPy
+    HEAVY_MODULES = ["google.cloud.bigquery", "numpy"]
+
+    def _measure_import(self, statement):
+        """Runs the import statement in a new interpreter.
+        Returns the import time in seconds and the heavy modules being imported.
+        """
+        script = (
+            "import json, sys, time, types\n"
+            "sys.modules.setdefault('arcpy', types.ModuleType('arcpy'))\n"
+            "start = time.perf_counter()\n"
+            "{0}\n"
+            "seconds = time.perf_counter() - start\n"
+            "heavy = [name for name in {1!r} if name in sys.modules]\n"
+            "print(json.dumps({{'seconds': seconds, 'heavy': heavy}}))\n"
+        ).format(statement, self.HEAVY_MODULES)
+        src_dir = os.path.dirname(os.path.abspath(__file__))
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=src_dir)
+        return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+    def test_import_client(self):
+        result = self._measure_import("import geoint.gdelt_client")
+        self.assertNotIn("google.cloud.bigquery", result["heavy"], "The client must import BigQuery on first use!")
+
+    def test_import_toolbox(self):
+        toolbox_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tbx", "geoint.pyt")
+        statement = "import importlib.machinery; importlib.machinery.SourceFileLoader('geoint_toolbox', {0!r}).load_module()".format(toolbox_path)
+        result = self._measure_import(statement)
+        self.assertEqual([], result["heavy"], "Loading the toolbox must not import BigQuery or NumPy!")
+        self.assertLess(result["seconds"], 0.5, "Loading the toolbox must be fast!")
+
+
+
+class TestGdeltInstrumentation(unittest.TestCase):
+
+    def test_nested_stages(self):
+        instrumentation = gdelt_instrumentation()
+        with instrumentation.measure("outer") as outer_stage:
+            with instrumentation.measure("inner") as inner_stage:
+                time.sleep(0.05)
+                inner_stage.rows_in = 10
+                inner_stage.rows_out = 4
+        stages = instrumentation.stages
+        self.assertLessEqual(0.05, stages["inner"]["seconds"], "The inner stage must be measured!")
+        self.assertLess(stages["outer"]["seconds"], 0.05, "The time of nested stages must not be accounted!")
+        self.assertIn("inner: ", instrumentation.format_messages()[0], "Every stage must be formatted!")
+        self.assertIn("6 rows dropped", instrumentation.format_messages()[0], "Dropped rows must be reported!")
+
+    def test_pipeline(self):
+        events = []
+        log_path = os.path.join(tempfile.gettempdir(), "geoint_instrumentation_test.json")
+        if os.path.exists(log_path):
+            os.remove(log_path)
+        instrumentation = gdelt_instrumentation(events.append, log_path)
+        client = gdelt_client(client=fake_bigquery_client(records_per_query=20), instrumentation=instrumentation)
+        feature_factory = gdelt_feature_factory(instrumentation)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "gdelt.gpkg")
+            workspace = gdelt_workspace(path, geopackage_feature_writer(path), instrumentation)
+            arcpy = create_fake_arcpy()
+            # The whole world except the southern hemisphere
+            area = arcpy.Polygon(arcpy.Array([arcpy.Point(-180, 0), arcpy.Point(-180, 90), arcpy.Point(180, 90), arcpy.Point(180, 0), arcpy.Point(-180, 0)]))
+            gdelt_event_batches = client.iter_query_events_batches(gdelt_query_builder(datetime.date(2020, 3, 1), limit=20), page_size=8)
+            inserted = workspace.insert_feature_batches("Events", (feature_factory.create_feature_batch(batch) for batch in gdelt_event_batches), [area])
+        instrumentation.close()
+        stages = instrumentation.stages
+        self.assertEqual(["aoi_filter", "construct", "create_features", "fetch", "insert"], sorted(stages.keys()), "Every stage must be measured!")
+        self.assertEqual(20, stages["fetch"]["rows_out"], "The fetched rows must be counted!")
+        self.assertEqual(20, stages["aoi_filter"]["rows_in"], "The rows in must be counted!")
+        self.assertEqual(inserted, stages["aoi_filter"]["rows_out"], "The rows out must be counted!")
+        self.assertEqual(1, len(instrumentation.jobs), "The job must be recorded!")
+        self.assertEqual(20480, instrumentation.summary()["jobs"]["bytes_processed"], "The processed bytes must be recorded!")
+        self.assertEqual("summary", events[-1]["type"], "The summary must be passed to the callback!")
+        with open(log_path, "r") as log_file:
+            self.assertEqual(len(events), len(log_file.readlines()), "Every event must be logged!")
+        os.remove(log_path)
+
+
+
+class TestGdeltBenchmark(unittest.TestCase):
+
+    def test_fake_client_projection(self):
+        client = fake_bigquery_client(records_per_query=3)
+        rows = list(client.query(gdelt_query_builder(datetime.date(2020, 3, 1)).select(["SOURCEURL"]).build()).result().pages)[0]
+        self.assertEqual(["GLOBALEVENTID", "ActionGeo_Lat", "ActionGeo_Long", "SOURCEURL"], list(rows[0].keys()), "Only the projected columns must be returned!")
+        graph_rows = list(client.query(gdelt_client(client=client)._create_graph_query(datetime.date(2020, 3, 1), "TERROR", 3)[0]).result().pages)[0]
+        self.assertEqual(3, len(graph_rows), "Graph queries must return graph records!")
+        self.assertEqual(5, len(gdelt_graph_entry(graph_rows[0]).records), "Every graph record must have five locations!")
+
+    def test_fake_arcpy(self):
+        arcpy = create_fake_arcpy()
+        polygon = arcpy.Polygon(arcpy.Array([arcpy.Point(0, 0), arcpy.Point(0, 10), arcpy.Point(10, 10), arcpy.Point(10, 0), arcpy.Point(0, 0)]))
+        self.assertFalse(polygon.disjoint(arcpy.Point(5, 5)), "The point must be inside!")
+        self.assertTrue(polygon.disjoint(arcpy.Point(15, 5)), "The point must be outside!")
+        feature_class = arcpy.management.CreateFeatureclass("memory", "Events")[0]
+        arcpy.management.AddFields(feature_class, [["GlobalEventId", "LONG"]])
+        with arcpy.da.InsertCursor(feature_class, ["SHAPE@XY", "GlobalEventId"]) as cursor:
+            cursor.insertRow(((5, 5), 1))
+            with self.assertRaises(RuntimeError):
+                cursor.insertRow(((5, 5),))
+        self.assertEqual([(1,)], list(arcpy.da.SearchCursor(feature_class, ["GlobalEventId"])), "The inserted row must be found!")
+
+    def test_compare_results(self):
+        baseline = {"results": [{"pipeline": "events", "size": 10, "stages": {"fetch": {"rows_per_second": 100.0}, "construct": {"rows_per_second": 100.0}}}]}
+        current = {"results": [{"pipeline": "events", "size": 10, "stages": {"fetch": {"rows_per_second": 50.0}, "construct": {"rows_per_second": 90.0}}}]}
+        regressions = compare_results(baseline, current, tolerance=0.2)
+        self.assertEqual(["fetch"], [regression["stage"] for regression in regressions], "Only the slower stage must be a regression!")
+
 
 
 @unittest.skip("Disable Feature mapping for default testing.")
@@ -100,6 +1290,12 @@ class TestGdeltFeatureFactory(unittest.TestCase):
             gdelt_feature = self._feature_factory.create_feature(gdelt_event)
             self.assertIsNotNone(gdelt_feature, "The feature must not be none!")
 
+    def test_gdelt_create_feature_batches_today(self):
+        date = datetime.date.today()
+        for gdelt_event_batch in self._client.iter_query_batches(date, limit=10):
+            gdelt_features = self._feature_factory.create_feature_batch(gdelt_event_batch)
+            self.assertEqual(len(gdelt_event_batch), len(gdelt_features), "Every event must be a feature!")
+
 
 
 @unittest.skip("Disable ArcObjects for default testing.")